@@ -3,19 +3,30 @@ from qm.QuantumMachinesManager import QuantumMachinesManager
 from qm import SimulationConfig
 from qm import LoopbackInterface
 from config_array_sorting import *
+from macros import *
+from reference_planner import plan_assignments, parse_debug_data
+from spectrogram_verifier import track_tones, track_chirp_ends, verify_chirps
 import matplotlib.pyplot as plt
+from time import sleep
 
 ########################################
 # Define target matrix and frequencies #
 ########################################
 collision_free = True  # Enables the collision fre sorting algorithm
+suffix_count = True  # Counts the atoms to the right of each site once per row for the collision free algorithm
 piecewise_chirp = False  # Enables the piecewise chirp decomposition for minimal jerk trajectory
+chirp_lookup_table = False  # Reads the chirp rates from a table precomputed for every (source, target) column pair
 analog_occupation_matrix = False  # Reads the current occupation matrix via analog readout
+pipelined_readout = False  # Sorts each row as soon as it is received and reads the next matrix in a second buffer
 raw_adc_acquisition = True  # Acquires chirp tones to plot spectrograms - output should be connected to OPX analog input
+stage_timestamps = False  # Streams the timestamps of the real-time computation stages of each row
 single_run = True  # Runs the sorting only once, else is infinite loop
-maximum_chirp_rate = None  # Maximum constant chirp rate in Hz/ns, None uses default pulse length from config
-if maximum_chirp_rate is not None and piecewise_chirp:
-    raise ValueError("Warning: dynamic pulse duration with piecewise chirps is not implemented.")
+maximum_chirp_rate = None  # Maximum chirp rate in Hz/ns (peak rate of piecewise chirps), None uses default pulse length
+real_time_compute_budget = 200  # Clock cycles waited before the pulses with maximum_chirp_rate, see stage_timestamps
+if maximum_chirp_rate is not None and piecewise_chirp and not chirp_lookup_table:
+    raise ValueError("Warning: dynamic pulse duration with piecewise chirps requires the chirp rate lookup table.")
+if pipelined_readout and not analog_occupation_matrix:
+    raise ValueError("Warning: the pipelined readout requires the analog readout of the occupation matrix.")
 # Initial occupation matrix in 2D
 atom_location_list = [
     list(map(int, np.random.choice([0, 1], size=number_of_columns, p=[0.4, 0.6]))) for i in range(number_of_rows)
@@ -52,392 +63,9 @@ target_frequencies_1d = [j for sub in target_frequencies_full_python for j in su
 # Get all relevant elements in a list for easy align
 elements = list(config["elements"].keys())
 elements.remove("qubit")
-
-#############################################
-# Macros used to derive relevant parameters #
-#############################################
-def analog_readout(nb_of_rows, nb_of_columns, readout_threshold, readout_done):
-    """
-    This macro gets the current occupation matrix from the measurement of an analog signal sent by an external device.
-    If the receive signal is larger than readout_threshold, then there is no atom and if it is smaller it means that
-    there is an atom. The readout_done flag becomes True when all the sites have been received.
-
-    :param nb_of_rows: A python variable for the number of rows in the array (int).
-    :param nb_of_columns: A python variable for the number of column in the array (int).
-    :param readout_threshold: A python variable for the analog threshold dicriminating between atom and no-atom (float).
-    :param readout_done: A QUA variable for stating whether the readout is completed or not (bool).
-
-    :return: Three QUA 1D vectors for the atom locations, target locations and target frequencies of the current row.
-    """
-    occupation_matrix = declare(int, size=nb_of_columns * nb_of_rows)  # Full 1D occupation matrix
-    num_sites = declare(int, value=number_of_columns * number_of_rows)  # Total number of sites to be measured
-    data = declare(fixed)  # integrated data for occupation matrix readout
-    counter = declare(int)  # Counter for keeping track of the received locations
-    assign(counter, 0)
-    with while_(~readout_done):
-        wait_for_trigger("fpga")
-        measure("readout_fpga", "fpga", None, integration.full("constant", data, "out1"))
-        with if_(data < readout_threshold):
-            assign(occupation_matrix[counter], 1)
-        with else_():
-            assign(occupation_matrix[counter], 0)
-        save(occupation_matrix[counter], data_stream)
-        assign(counter, counter + 1)
-        assign(readout_done, counter == num_sites)
-    return occupation_matrix, readout_done
-
-
-def get_current_row(this_row, nb_of_columns, current_location_full, target_location_full, target_frequencies_full):
-    """
-    This macro gets the current and target locations and target frequencies of the current row from the full 1d vector.
-
-    :param this_row: A QUA variable for the current row (int).
-    :param nb_of_columns: A python variable for the number of column in the array (int).
-    :param current_location_full: A 1D QUA vector for the atom location in the current row (int).
-    :param target_location_full: A 1D QUA vector for the target location in the current row (int).
-    :param target_frequencies_full: A 1D QUA vector for the target frequencies in the current row (int).
-
-    :return: Three QUA 1D vectors for the atom locations, target locations and target frequencies of the current row.
-    """
-    # QUA variable containing the current row atom locations
-    current_location = declare(int, size=nb_of_columns)
-    # QUA variable containing the current row target locations
-    target_location = declare(int, size=nb_of_columns)
-    # QUA variable containing the current row target frequencies
-    target_frequencies = declare(int, size=nb_of_columns)
-    # QUA variable for incrementing the number of target frequencies
-    freq_count = declare(int)
-    assign(freq_count, 0)
-    # Qua variable for looping over the columns
-    col = declare(int)
-    # Loop over the columns for filling the atom and target frequencies for current row
-    with for_(col, 0, col < nb_of_columns, col + 1):
-        # Initialize the current atom location vector for this row
-        assign(current_location[col], current_location_full[this_row * nb_of_columns + col])
-        # Initialize the target atom location vector for this row
-        assign(target_location[col], target_location_full[this_row * nb_of_columns + col])
-        # Initialize the target frequency vector for this row
-        with if_(target_frequencies_full[this_row * nb_of_columns + col] > 10):
-            assign(
-                target_frequencies[freq_count],
-                target_frequencies_full[this_row * nb_of_columns + col],
-            )
-            assign(freq_count, freq_count + 1)
-    return current_location, target_location, target_frequencies
-
-
-def find_number_of_tweezers(atoms_in_current_row, atoms_in_target_row, max_nb_of_tweezers):
-
-    """
-    This macro finds the number of tweezer required for this arrangment sequence based of the number of atoms in the
-    target row, the number of atoms in the current row and the number of available tweezers.
-
-    :param atoms_in_current_row: A 1D QUA vector for the atom location in the current row.
-    :param atoms_in_target_row: A 1D QUA vector for the atom location in the target row.
-    :param max_nb_of_tweezers: A QUA variable for the waximum number of available tweezers (due to the limited number of available pulse processors).
-
-    :return: A QUA variable (int) for the number of tweezers required for achieving the sorting.
-    """
-
-    nb_of_tweezers = declare(int)  # Number of available tweezers
-    # generating an integer vector of size=3 and storing three values in it
-    atoms_or_targets = declare(int, size=3)
-    assign(atoms_or_targets[0], Math.sum(atoms_in_current_row))  # how many atoms in the current row?
-    assign(atoms_or_targets[1], Math.sum(atoms_in_target_row))  # how many atoms are in the target state?
-    assign(atoms_or_targets[2], max_nb_of_tweezers)  # what's the max number of tweezers we are allowed to use?
-    assign(nb_of_tweezers, Math.min(atoms_or_targets))
-    # The number of required tweezers for this row arrangement is the minimum of the number of atoms in the initial
-    # configuration, the number of final atoms needed in the ordered row and the number of tweezers available
-    return nb_of_tweezers
-
-
-def assign_tweezers_to_atoms(
-    nb_of_tweezers, nb_of_tweezers_python, atoms_in_current_row, current_frequencies, target_frequencies, tweezer_phases
-):
-    """
-    This function finds the atoms in the row and assign one tweezer to each with the corresponding initial frequency
-    Will only avoid collisions on left compact targets. Improvement necessary for arbitrary collision free rearrangement
-
-    :param nb_of_tweezers: A QUA variable for the number of required tweezers (int).
-    :param nb_of_tweezers_python: A python variable for the maximum number of available tweezers.
-    :param atoms_in_current_row: A 1D QUA vector for the atom location in the current row.
-    :param current_frequencies: A 1D QUA vector for the frequencies of the atoms in the current row.
-    :param target_frequencies: A 1D QUA vector for the frequencies of the atoms in the target row.
-    :param tweezer_phases: A 1D QUA vector for the phases of the tweezers for the current row.
-
-    :return: Four QUA 1D vectors for the amplitude, frequencie, phase and detuning of each tweezer to sort the current row.
-    """
-
-    # QUA variables declaration
-    amplitudes = declare(fixed, size=nb_of_tweezers_python)
-    frequencies = declare(int, size=nb_of_tweezers_python)
-    phases = declare(fixed, value=phases_list)
-    detunings = declare(int, size=nb_of_tweezers_python)
-    i = declare(int)
-    j = declare(int)
-    column = declare(int)
-
-    # Initialize the amplitude vector
-    with for_(column, 0, column < nb_of_tweezers_python, column + 1):
-        assign(amplitudes[column], 0.0)
-    # debugging save to indicate a change of row
-    save(-1, data_stream)
-    # scan the atom locations and update the list of tweezers frequencies
-    assign(j, 0)  # assigning 0 to the j index
-    assign(i, 0)  # assigning 0 to the i index
-    # pick up only the amount of atoms you need to fill the target, if there aren't_int enough atoms or tweezers
-    # available then pick as many as you can
-    with while_(j < nb_of_tweezers):
-        with if_(atoms_in_current_row[i] == 1):  # if an atom is present in site i
-            assign(amplitudes[j], 1.0)  # set the amplitude of the tweezer to active (=1)
-            assign(frequencies[j], current_frequencies[i])  # update the tweezer freq with that of atom index
-            assign(phases[j], tweezer_phases[i])  # update the tweezer phase j with that of the atom index i
-            # Set the detuning vector
-            assign(detunings[j], target_frequencies[j] - frequencies[j])
-            # Save atom to be moved and target to check the tweezer locations
-            save(i, data_stream)
-            save(j, data_stream)
-            assign(j, j + 1)
-        assign(i, i + 1)
-
-    return amplitudes, frequencies, phases, detunings
-
-
-def assign_tweezers_to_atoms_collision_free(
-    nb_of_tweezers, nb_of_tweezers_python, atoms_in_current_row, current_frequencies, target_frequencies, tweezer_phases
-):
-    """
-    This function finds the atoms in the row and assign one tweezer to each with the corresponding initial frequency
-    Will avoid any collisions from happening when sorting row by row.
-
-    :param nb_of_tweezers: A QUA variable for the number of required tweezers (int).
-    :param nb_of_tweezers_python: A python variable for the maximum number of available tweezers.
-    :param atoms_in_current_row: A 1D QUA vector for the atom location in the current row.
-    :param current_frequencies: A 1D QUA vector for the frequencies of the atoms in the current row.
-    :param target_frequencies: A 1D QUA vector for the frequencies of the atoms in the target row.
-    :param tweezer_phases: A 1D QUA vector for the phases of the tweezers for the current row.
-
-    :return: Four QUA 1D vectors for the amplitude, frequencie, phase and detuning of each tweezer to sort the current row.
-    """
-    # QUA variables declaration
-    amplitudes = declare(fixed, size=nb_of_tweezers_python)
-    frequencies = declare(int, size=nb_of_tweezers_python)
-    phases = declare(fixed, value=phases_list)
-    detunings = declare(int, size=nb_of_tweezers_python)
-    column = declare(int)
-
-    # Initialize the amplitude vector
-    with for_(column, 0, column < nb_of_tweezers_python, column + 1):
-        assign(amplitudes[column], 0.0)
-    # Ending index of the current atom to find when scanning to the left
-    previous_atom = declare(int)
-    assign(previous_atom, -1)
-    # Number of assigned atoms
-    atoms_assigned = declare(int)
-    assign(atoms_assigned, 0)
-    # Flag to exit loops once the tweezer is assigned --> replaces break statement
-    current_is_assigned = declare(bool)
-    # Remaining atoms to assign (number_of_tweezers - atoms_assigned)
-    nb_of_atoms_to_assign = declare(int)
-    # Target atoms index
-    target_index = declare(int)
-    assign(target_index, 0)
-    # Current atoms index
-    trial_atom = declare(int)
-    # Total number of atoms located to the right of the current index
-    nb_of_atoms_to_the_right = declare(int)
-    # Corresponding index for calculating the previous number
-    sum_index = declare(int)
-    # Vector used to find the starting index when scanning to the right (max)
-    max_comp = declare(int, size=2)
-    # starting index when scanning to the right
-    max_result = declare(int)
-    # debugging save to indicate a change of row
-    save(-1, data_stream)
-    # This logic searches for atoms in the target vector and if there are enough atoms on the right to complete
-    # the sorting, then assign one tweezer to the closest atom on the left.
-    # else, assign one tweezer to the closest atom on the right
-    with while_(atoms_assigned < nb_of_tweezers):
-        # Current tweezer is not assigned yet
-        assign(current_is_assigned, False)
-        # Increment until one target atom is found --> index = target atom location
-        with while_(atom_target_qua[target_index] == 0):
-            assign(target_index, target_index + 1)
-        # number of remaining atoms to assign
-        assign(nb_of_atoms_to_assign, nb_of_tweezers - atoms_assigned)
-        # Look in current site and to the left for a suitable atom
-        with for_(trial_atom, target_index, (trial_atom > previous_atom) & ~current_is_assigned, trial_atom - 1):
-            # Number of current atoms located to the right of the current target atom
-            assign(nb_of_atoms_to_the_right, 0)
-            with for_(sum_index, trial_atom, sum_index < number_of_columns, sum_index + 1):
-                assign(nb_of_atoms_to_the_right, nb_of_atoms_to_the_right + atoms_in_current_row[sum_index])
-            # If there are more atoms to the right than needed AND  1 atom is here AND this atom is not already assigned
-            # Then assign a tweezer to this atom
-            with if_((nb_of_atoms_to_the_right >= nb_of_atoms_to_assign) & (atoms_in_current_row[trial_atom] == 1)):
-                # Keep the atom location for subsequent tweezer assignment
-                assign(previous_atom, trial_atom)
-                # Update the flag to exit the if statement and simulate a break
-                assign(current_is_assigned, True)
-        # If no suitable atom was found, look to the right instead
-        with if_(~current_is_assigned):
-            # Find the center before looking to the right of it
-            assign(max_comp[0], previous_atom + 1)
-            assign(max_comp[1], target_index + 1)
-            assign(max_result, Math.max(max_comp))
-            # Look to the right for a suitable atom
-            with for_(trial_atom, max_result, (trial_atom < number_of_columns) & ~current_is_assigned, trial_atom + 1):
-                # If there is an atom here AND it is not assigned yet, then assign a tweezer to this atom
-                with if_((atoms_in_current_row[trial_atom] == 1)):
-                    # Keep the atom location for subsequent tweezer assignment
-                    assign(previous_atom, trial_atom)
-                    # Update the flag to exit the if statement and simulate a break
-                    assign(current_is_assigned, True)
-        # Once a suitable atom was found, assign a tweezer to it
-        with if_(current_is_assigned):
-            # Save atom to be moved and target to check the tweezer locations
-            save(previous_atom, data_stream)
-            save(target_index, data_stream)
-            # Got to the next target atom
-            assign(target_index, target_index + 1)
-            # set the amplitude of the tweezer to active (=1)
-            assign(amplitudes[atoms_assigned], 1.0)
-            # update the tweezer freq with that of atom index
-            assign(frequencies[atoms_assigned], current_frequencies[previous_atom])
-            # update the tweezer phase j with that of the atom index i
-            assign(phases[atoms_assigned], tweezer_phases[previous_atom])
-            # Set the detuning vector
-            assign(
-                detunings[atoms_assigned],
-                target_frequencies[atoms_assigned] - frequencies[atoms_assigned],
-            )
-            # Increment the number of assigned atoms
-            assign(atoms_assigned, atoms_assigned + 1)
-
-    return amplitudes, frequencies, phases, detunings
-
-
-def calculate_pulse_length(detunings, pulse_duration, max_rate=None):
-    """
-    This macro derives the maximum and minimum detunings to be applied and derives the minimum chirp pulse duration.
-
-    :param detunings: A 1D QUA vector for each tweezer detuning in Hz (int).
-    :param pulse_duration: A python variable for the default constant chirp pulse duration in ns (int).
-    :param max_rate: A python variable for the maximum allowed chirp rate in Hz/ns. Default is None which corresponds to using the provided default pulse duration
-
-    :return: A QUA variable for the chirp pulse duration in ns (int)
-    """
-    # QUA variables declaration
-    chirp_pulse_duration = declare(int)  # Duration of the frequency chirp
-    # Find the maximum detuning used to set the minimum acceptable pulse duration
-    if max_rate is not None:
-        min_detuning = declare(int)
-        max_detuning = declare(int)
-        assign(min_detuning, Math.min(detunings))
-        assign(max_detuning, Math.max(detunings))  # find the maximum detuning
-        assign(max_detuning, Util.cond(max_detuning > -min_detuning, max_detuning, -min_detuning))
-        assign(chirp_pulse_duration, max_detuning / max_rate)
-        # Minimum pulse duration is 16 ns
-        with if_(max_detuning < 16):
-            assign(chirp_pulse_duration, 16)
-        with else_():
-            assign(chirp_pulse_duration, max_detuning / max_rate)
-    else:
-        # pulse duration is assigned to be constant
-        assign(chirp_pulse_duration, pulse_duration)
-
-    return chirp_pulse_duration
-
-
-def calculate_chirp_rates(nb_of_tweezers_python, detunings, pulse_duration):
-    """
-    This macro derives the constant linear chirp rates needed to arrange the atoms in the current row.
-
-    :param nb_of_tweezers_python: A python variable for the number of available tweezers.
-    :param detunings: A 1D QUA vector for each tweezer detuning in Hz (int).
-    :param pulse_duration: A QUA variable for the chirp pulse duration in ns (int)
-
-    :return: A QUA 1D vector for each tweezer constant chirp rate in mHz/ns
-    """
-    # QUA variables declaration
-    chirp_rates = declare(int, size=nb_of_tweezers_python)
-    j = declare(int)
-    # Calculate the chirp rates for all tweezers.
-    # Each tweezer has its own chirp rate depending on the initial and final position of the arranged atom.
-    with for_(j, 0, j < nb_of_tweezers_python, j + 1):
-        assign(chirp_rates[j], Cast.to_int(detunings[j] / (pulse_duration / 1000)))  # x1000 to go to 'mHz/ns'
-
-    return chirp_rates
-
-
-def calculate_piecewise_chirp_rates(nb_of_tweezers_python, detunings, pulse_duration, nb_of_segments):
-    """
-    This macro derives the piecewise decomposition of the total chirp waveform based on the minimum jerk trajectory.
-
-    :param nb_of_tweezers_python: A python variable for the number of available tweezers.
-    :param detunings: A 1D QUA vector for each tweezer detuning in Hz (int).
-    :param pulse_duration: A QUA variable for the chirp pulse duration in ns (int)
-    :param nb_of_segments: A python variable for the number of segments contained in the picewise chirp (int). No gaps if < 50.
-
-    :return: A Python 2D array whose rows are 1D QUA vectors for each tweezer piecewise chirp rate in mHz/ns
-    """
-    # QUA variables declaration
-    n_segment = declare(int, value=nb_of_segments)
-    chirp_rates_full = declare(int, value=[int(x) for x in np.zeros(nb_of_tweezers_python * nb_of_segments)])
-    step = declare(int)
-    chirp_rates = [declare(int, value=[int(x) for x in np.zeros(nb_of_segments)]) for _ in range(nb_of_tweezers_python)]
-    # Calculate the chirp rates for all Tweezers.
-    # Each tweezer has its own chirp rate depending on the initial and final position of the arranged atom.
-    tau = declare(fixed)  # Normalized time
-    tau_squared = declare(fixed)  # Normalized time squared
-    linear_piece = declare(fixed)  # minimal jerk trajectory
-    segment_step = declare(int)  # Step variable for incrementing the segments
-    one_over_chirp_n_segments = declare(fixed)  # one over the nuber of linear segments
-    assign(one_over_chirp_n_segments, Math.div(1, n_segment))
-    j = declare(int)
-
-    with for_(j, 0, j < nb_of_tweezers_python, j + 1):
-        assign(tau, 0)
-        with for_(segment_step, 0, segment_step < n_segment, segment_step + 1):
-            assign(tau, Cast.mul_fixed_by_int(one_over_chirp_n_segments, segment_step + 1))
-            assign(tau_squared, tau * tau)
-            assign(
-                linear_piece,
-                (
-                    Cast.mul_fixed_by_int(tau_squared, 30)
-                    - Cast.mul_fixed_by_int(tau_squared * tau, 60)
-                    + Cast.mul_fixed_by_int(tau_squared * tau_squared, 30)
-                ),
-            )
-            assign(
-                chirp_rates_full[segment_step + j * n_segment],
-                Cast.to_int(Cast.mul_int_by_fixed(detunings[j], linear_piece) / (pulse_duration / 1000)),
-            )  # /1000 to go to 'mHz/ns'
-    # Build a 1D chirp vector for each tweezer in a given row. 1st index must be python and 2nd QUA (fake 2D array)
-    for tweezer_index in range(nb_of_tweezers_python):
-        with for_(step, 0, step < n_segment, step + 1):
-            assign(chirp_rates[tweezer_index][step], chirp_rates_full[tweezer_index * n_segment + step])
-
-    return chirp_rates
-
-
-def set_tweezers_frequencies_and_phases(nb_of_tweezers_python, current_frequencies, row_frequency, tweezer_phases):
-    """
-    This macro sets the previously calculated frequencies and phases to the corresponding tweezers.
-
-    :param nb_of_tweezers_python: A python variable for the maximum number of available tweezers.
-    :param current_frequencies: A 1D QUA vector for the frequencies of the atoms in the current row.
-    :param row_frequency: A QUA variable for the frequency of the current row in Hz (int)
-    :param tweezer_phases: A 1D QUA vector for the phases of the tweezers for the current row.
-
-    :return: None
-    """
-    # set the phases and frequencies of the tweezers
-    update_frequency("row_selector", row_frequency)
-    for index in range(nb_of_tweezers_python):
-        reset_frame(f"column_{index + 1}")
-        frame_rotation(tweezer_phases[index + 1], "column_{}".format(index + 1))
-        update_frequency("column_{}".format(index + 1), current_frequencies[index])
-
+if pipelined_readout:
+    # The occupation readout runs independently of the tweezers so that the next row is received during the chirps
+    elements.remove("fpga")
 
 ###############
 # QUA program #
@@ -460,6 +88,7 @@ with program() as atom_sorting:
     # Debug variables
     raw_adc = declare_stream(adc_trace=True)  # Raw ADC trace for spectrograms or occupation matrix readout
     data_stream = declare_stream()  # stream used to extract variables for debug
+    occupation_stream = declare_stream()  # stream used to extract the occupation matrices received row by row
     infinite_run = declare(bool, value=True)  # Flag used to perform the sorting only once instead of infinite_loop_()
 
     # QUA variable representing the current row
@@ -474,6 +103,34 @@ with program() as atom_sorting:
     column_frequencies_qua = declare(int, value=[int(x) for x in column_if])
     # QUA variable containing the tweezer phases
     tweezer_phases_qua = declare(fixed, value=phases_list)
+    if chirp_lookup_table:
+        # QUA variable containing the precomputed chirp rates of every move between two columns
+        chirp_rates_table_qua = declare(
+            int,
+            value=chirp_rates_table(
+                column_if,
+                constant_pulse_length,
+                n_segment_python if piecewise_chirp else None,
+                max_rate=maximum_chirp_rate,
+            ),
+        )
+        if maximum_chirp_rate is not None:
+            # QUA variable containing the pulse duration of every possible largest column difference of a row
+            pulse_durations_list = pulse_durations_table(
+                column_if, maximum_chirp_rate, n_segment_python if piecewise_chirp else None
+            )[1]
+            pulse_durations_qua = declare(int, value=pulse_durations_list)
+        # QUA variable containing the index of the move of each tweezer in the lookup table
+        moves_qua = declare(int, size=max_number_of_tweezers)
+    else:
+        moves_qua = None
+    if pipelined_readout:
+        # QUA variable containing two occupation buffers: one being sorted while the next matrix is received
+        atom_location_buffers = declare(int, size=2 * number_of_columns * number_of_rows)
+        # QUA variable for the index of the first site of the buffer being sorted
+        buffer_offset_qua = declare(int, value=0)
+        # Receive the first row of the first occupation matrix
+        analog_readout_row(0, number_of_columns, threshold, atom_location_buffers, buffer_offset_qua, occupation_stream)
 
     with while_(infinite_run):
         # Reset variables for new loop
@@ -482,9 +139,13 @@ with program() as atom_sorting:
         ###############################################
         # Measure occupation matrix from analog input #
         ###############################################
-        if analog_occupation_matrix:
+        if pipelined_readout:
+            # The rows are received during the sorting sequence
+            atom_location_full = atom_location_buffers
+            assign(received_full_array, True)
+        elif analog_occupation_matrix:
             atom_location_full, received_full_array = analog_readout(
-                number_of_rows, number_of_columns, threshold, received_full_array
+                number_of_rows, number_of_columns, threshold, received_full_array, data_stream
             )
         else:
             atom_location_full = declare(int, value=atom_location_list_1d)
@@ -503,19 +164,32 @@ with program() as atom_sorting:
                     atom_location_full,
                     atom_target_full_qua,
                     target_frequencies_full_qua,
+                    buffer_offset=buffer_offset_qua if pipelined_readout else None,
                 )
+                if stage_timestamps:
+                    timestamp_stage("readout_done")
                 # Derive number of required tweezers
                 number_of_tweezers = find_number_of_tweezers(atom_location_qua, atom_target_qua, max_number_of_tweezers)
                 # Assign the tweezers amplitude, initial frequency, phase and detuning using either a dummy logic that
                 # will only avoid collisions on left compact targets, or a smarter collision-free algorithm
                 if collision_free:
+                    # Derive the number of atoms to the right of each site in a single pass over the row
+                    if suffix_count:
+                        atoms_to_the_right_qua = count_atoms_to_the_right(number_of_columns, atom_location_qua)
+                    else:
+                        atoms_to_the_right_qua = None
                     amplitude_qua, frequency_qua, phase_qua, detuning_qua = assign_tweezers_to_atoms_collision_free(
                         number_of_tweezers,
                         max_number_of_tweezers,
+                        number_of_columns,
                         atom_location_qua,
+                        atom_target_qua,
                         column_frequencies_qua,
                         target_frequencies_qua,
                         tweezer_phases_qua,
+                        data_stream,
+                        atoms_to_the_right=atoms_to_the_right_qua,
+                        moves=moves_qua,
                     )
                 else:
                     amplitude_qua, frequency_qua, phase_qua, detuning_qua = assign_tweezers_to_atoms(
@@ -525,20 +199,51 @@ with program() as atom_sorting:
                         column_frequencies_qua,
                         target_frequencies_qua,
                         tweezer_phases_qua,
+                        data_stream,
+                        moves=moves_qua,
+                        atoms_in_target_row=atom_target_qua,
+                        nb_of_columns=number_of_columns,
                     )
+                if stage_timestamps:
+                    timestamp_stage("assignment_done")
                 # Derive the chirp pulse duration from the default pulse length of the maximum chirp rate if not None.
-                chirp_pulse_duration_qua = calculate_pulse_length(
-                    detuning_qua, constant_pulse_length, max_rate=maximum_chirp_rate
-                )
-                # Derive the chirp rates defined as piecewise or constant
-                if piecewise_chirp:
+                if chirp_lookup_table and maximum_chirp_rate is not None:
+                    chirp_pulse_duration_qua, duration_index_qua = lookup_pulse_length(
+                        moves_qua, number_of_columns, pulse_durations_qua
+                    )
+                else:
+                    chirp_pulse_duration_qua = calculate_pulse_length(
+                        detuning_qua, constant_pulse_length, max_rate=maximum_chirp_rate
+                    )
+                    duration_index_qua = None
+                # Derive the chirp rates defined as piecewise or constant, either from the lookup table or in real-time
+                if piecewise_chirp and chirp_lookup_table:
+                    piecewise_chirp_rates_qua = lookup_piecewise_chirp_rates(
+                        max_number_of_tweezers,
+                        moves_qua,
+                        chirp_rates_table_qua,
+                        n_segment_python,
+                        duration_index=duration_index_qua,
+                        nb_of_moves=2 * number_of_columns - 1,
+                    )
+                elif piecewise_chirp:
                     piecewise_chirp_rates_qua = calculate_piecewise_chirp_rates(
                         max_number_of_tweezers, detuning_qua, chirp_pulse_duration_qua, n_segment_python
                     )
+                elif chirp_lookup_table:
+                    constant_chirp_rates_qua = lookup_chirp_rates(
+                        max_number_of_tweezers,
+                        moves_qua,
+                        chirp_rates_table_qua,
+                        duration_index=duration_index_qua,
+                        nb_of_moves=2 * number_of_columns - 1,
+                    )
                 else:
                     constant_chirp_rates_qua = calculate_chirp_rates(
                         max_number_of_tweezers, detuning_qua, chirp_pulse_duration_qua
                     )
+                if stage_timestamps:
+                    timestamp_stage("chirp_rates_done")
                 # Assign the frequencies and phases to the tweezers
                 set_tweezers_frequencies_and_phases(
                     max_number_of_tweezers, frequency_qua, row_frequencies_qua[current_row], phase_qua
@@ -549,53 +254,52 @@ with program() as atom_sorting:
                 align(*elements)
                 # Wait to calculate as much as possible before playing the pulses to minimize gaps
                 if maximum_chirp_rate is not None:
-                    wait(200)
-                # ramp up power of occupied tweezers and row selector
-                play("blackman_up", "row_selector")
-                for element_index in range(max_number_of_tweezers):
-                    play(
-                        "blackman_up" * amp(amplitude_qua[element_index]),
-                        "column_{}".format(element_index + 1),
-                    )
-                # chirp tweezers
-                play("constant", "row_selector")
-                for element_index in range(max_number_of_tweezers):
-                    if piecewise_chirp:
-                        play(
-                            "constant" * amp(amplitude_qua[element_index]),
-                            "column_{}".format(element_index + 1),
-                            chirp=(piecewise_chirp_rates_qua[element_index], "mHz/nsec"),
-                        )  # chirp is 1D vector
-                    else:
-                        if maximum_chirp_rate is None:
-                            play(
-                                "constant" * amp(amplitude_qua[element_index]),
-                                "column_{}".format(element_index + 1),
-                                chirp=(constant_chirp_rates_qua[element_index], "mHz/nsec"),
-                            )
-                        else:
-                            play(
-                                "constant" * amp(amplitude_qua[element_index]),
-                                "column_{}".format(element_index + 1),
-                                duration=chirp_pulse_duration_qua,
-                                chirp=(constant_chirp_rates_qua[element_index], "mHz/nsec"),
-                            )
-                # ramp down power of occupied tweezers
-                play("blackman_down", "row_selector")
-                for element_index in range(max_number_of_tweezers):
-                    play(
-                        "blackman_down" * amp(amplitude_qua[element_index]),
-                        "column_{}".format(element_index + 1),
-                    )
+                    wait(real_time_compute_budget)
+                # ramp up power, chirp and ramp down power of the occupied tweezers and row selector
+                play_chirp_pulses(
+                    max_number_of_tweezers,
+                    amplitude_qua,
+                    piecewise_chirp_rates_qua if piecewise_chirp else constant_chirp_rates_qua,
+                    pulse_duration=chirp_pulse_duration_qua if maximum_chirp_rate is not None else None,
+                    ramp_timestamp_stream="ramp_start" if stage_timestamps else None,
+                    ramp_down_timestamp_stream="ramp_down_start" if stage_timestamps else None,
+                )
                 # Measure raw adc trace for spectrograms
                 if raw_adc_acquisition:
                     measure("readout", "detector", raw_adc)
+                # Receive the next row while the chirps of the current row are being played
+                if pipelined_readout:
+                    with if_(current_row < number_of_rows - 1):
+                        analog_readout_row(
+                            current_row + 1,
+                            number_of_columns,
+                            threshold,
+                            atom_location_buffers,
+                            buffer_offset_qua,
+                            occupation_stream,
+                        )
+                    # Receive the first row of the next occupation matrix in the other buffer
+                    if not single_run:
+                        with else_():
+                            analog_readout_row(
+                                0,
+                                number_of_columns,
+                                threshold,
+                                atom_location_buffers,
+                                number_of_columns * number_of_rows - buffer_offset_qua,
+                                occupation_stream,
+                            )
+            # Swap the occupation buffers
+            if pipelined_readout:
+                assign(buffer_offset_qua, number_of_columns * number_of_rows - buffer_offset_qua)
             # Exit the infinite loop in case just a single sorting sequence is needed
             if single_run:
                 assign(infinite_run, False)
 
     with stream_processing():
         data_stream.save_all("data")
+        if pipelined_readout:
+            occupation_stream.save_all("occupation")
         if raw_adc_acquisition:
             raw_adc.input2().save_all("raw_data")
 
@@ -613,6 +317,60 @@ if not Simulation:
     job = qm.execute(atom_sorting)  # order_atoms
     # job = qm.execute(freq_calibration)
     res = job.result_handles
+
+    if raw_adc_acquisition and not single_run:
+        # Check the end frequency of the tweezers of every sorting sequence while the infinite loop runs, until the job
+        # is halted. The occupation matrix and debug data of a sequence are streamed before its raw ADC traces.
+        matrix_size = number_of_rows * number_of_columns
+        frequency_band = (min(column_if) - abs(column_spacing), max(column_if) + abs(column_spacing))
+        if maximum_chirp_rate is not None:
+            pulse_durations_list = pulse_durations_table(
+                column_if, maximum_chirp_rate, n_segment_python if piecewise_chirp else None
+            )[1]
+        raw_data = res.get("raw_data")
+        sequence = 0
+        data_start = 0  # Index of the occupation matrix of the sequence in the debug data of the analog readout
+        while res.is_processing():
+            if raw_data.count_so_far() < (sequence + 1) * number_of_rows:
+                sleep(0.1)
+                continue
+            if pipelined_readout:
+                occupation = res.get("occupation").fetch(slice(sequence * matrix_size, (sequence + 1) * matrix_size))
+            elif analog_occupation_matrix:
+                occupation = res.get("data").fetch(slice(data_start, data_start + matrix_size))
+            if pipelined_readout or analog_occupation_matrix:
+                occupation = np.reshape(occupation["value"], (number_of_rows, number_of_columns))
+            else:
+                occupation = atom_location_list
+            # The moves of the sequence, as cross-checked with the debug data after a single run
+            sources, destinations = plan_assignments(
+                occupation, atom_target_list, max_number_of_tweezers, collision_free
+            )
+            nb_of_tweezers = np.sum(sources >= 0, axis=1)
+            # The occupation matrix, then a -1 and the (atom, target) pairs of each row
+            data_start += matrix_size + number_of_rows + 2 * np.sum(nb_of_tweezers)
+            if maximum_chirp_rate is None:
+                chirp_durations = np.full(number_of_rows, constant_pulse_length)
+            else:
+                # The pulse duration of a row is set by the largest column difference of its moves
+                column_differences = np.max(np.where(sources >= 0, np.abs(destinations - sources), 0), axis=1)
+                chirp_durations = np.take(pulse_durations_list, column_differences)
+            raw = raw_data.fetch(slice(sequence * number_of_rows, (sequence + 1) * number_of_rows))["value"]
+            times, tracks = track_chirp_ends(
+                raw,
+                blackman_pulse_length + chirp_durations,
+                nb_of_tweezers,
+                frequency_band,
+                excluded_frequencies=row_frequencies_list,
+                exclusion_width=abs(column_spacing) / 4,
+            )
+            passed, _, _ = verify_chirps(
+                times, tracks, target_frequencies_full_python, nb_of_tweezers, abs(column_spacing) / 4
+            )
+            if not np.all(passed):
+                print(f"Sequence {sequence}: rows with a tweezer missing its target {np.flatnonzero(~passed).tolist()}")
+            sequence += 1
+
     res.wait_for_all_values()
 
     # Print atom displacement fo reach row: each pair is current --> target
@@ -626,9 +384,57 @@ if not Simulation:
         else:
             print(f"{item} ", end="")
 
+    # Compare the tweezer assignments with the host-side reference planner
+    received_occupation, sources, destinations = parse_debug_data(
+        assign, number_of_rows, atom_target_list, max_number_of_tweezers, collision_free
+    )
+    if pipelined_readout:
+        received_occupation = res.get("occupation").fetch_all()["value"][: number_of_rows * number_of_columns]
+        received_occupation = np.reshape(received_occupation, (number_of_rows, number_of_columns))
+    elif received_occupation is None:
+        received_occupation = atom_location_list
+    reference_sources, reference_destinations = plan_assignments(
+        received_occupation, atom_target_list, max_number_of_tweezers, collision_free
+    )
+    mismatch = np.any((sources != reference_sources) | (destinations != reference_destinations), axis=1)
+    print(f"\nRows differing from the reference planner: {np.flatnonzero(mismatch).tolist()}")
+
+    if stage_timestamps:
+        # Latency histograms of the real-time computation stages
+        stages = ["readout_done", "assignment_done", "chirp_rates_done", "ramp_start"]
+        # The ramp of a row starts after the pulses of the previous row, which are excluded from its latency
+        latencies = get_stage_latencies(res, stages, ramp_down=("ramp_down_start", blackman_pulse_length))
+        plt.figure(figsize=(15, 4))
+        for i, (stage, latency) in enumerate(latencies.items()):
+            plt.subplot(1, len(latencies), i + 1)
+            plt.hist(latency, bins=20)
+            plt.xlabel(f"{stage} [ns]")
+            plt.ylabel("Counts")
+            print(f"{stage}: median {np.median(latency):.0f} ns, max {np.max(latency):.0f} ns")
+        plt.tight_layout()
+        compute_latency = (
+            latencies["readout_done -> assignment_done"] + latencies["assignment_done -> chirp_rates_done"]
+        )
+        print(
+            f"Real-time computations of a row take up to {np.max(compute_latency) / 4:.0f} clock cycles "
+            f"(real_time_compute_budget = {real_time_compute_budget})"
+        )
+
     if raw_adc_acquisition:
         fs = 14
         raw1 = res.raw_data.fetch_all()["value"]
+        # Check the end frequency of each tweezer against the target frequencies
+        times, tracks = track_tones(
+            raw1[:number_of_rows],
+            np.sum(sources >= 0, axis=1),
+            frequency_band=(min(column_if) - abs(column_spacing), max(column_if) + abs(column_spacing)),
+            excluded_frequencies=row_frequencies_list,
+            exclusion_width=abs(column_spacing) / 4,
+        )
+        passed, end_frequencies, arrival_times = verify_chirps(
+            times, tracks, target_frequencies_full_python, np.sum(sources >= 0, axis=1), abs(column_spacing) / 4
+        )
+        print(f"Rows with a tweezer missing its target frequency: {np.flatnonzero(~passed).tolist()}")
         plt.figure(figsize=(25, 12))
         for i in range(number_of_rows):
             # plt.figure(figsize=(14,9))
@@ -0,0 +1,165 @@
+"""
+Rearrangement of the atoms over the whole array with row and column moves.
+The moves are derived on the host by the 2D planner (planner_2d.py) between two occupation matrices, so that a row
+short of atoms can be filled with the spare atoms of the neighbouring rows. The QUA program then plays the row passes,
+where the row selector is static and the column tweezers are chirped, followed by the column passes, where a column
+tone is static and the row tones are chirped.
+"""
+from qm.qua import *
+from qm.QuantumMachinesManager import QuantumMachinesManager
+from qm import SimulationConfig
+from qm import LoopbackInterface
+from config_array_sorting import *
+from macros import *
+from planner_2d import plan_2d_moves, apply_passes
+from reference_planner import plan_assignments, apply_moves, fill_fraction
+import time
+
+##############
+# Parameters #
+##############
+filling_probability = 0.5  # Probability to find an atom in a given site
+# Initial occupation matrix in 2D
+atom_location_list = [
+    list(map(int, np.random.choice([0, 1], size=number_of_columns, p=[1 - filling_probability, filling_probability])))
+    for i in range(number_of_rows)
+]
+# Target occupation matrix in 2D
+goal = [
+    ["1", "X", "X", "X", "X", "X", "1"],
+    ["X", "1", "X", "X", "X", "1", "X"],
+    ["X", "X", "1", "1", "1", "X", "X"],
+    ["X", "X", "1", "1", "1", "X", "X"],
+    ["X", "X", "1", "1", "1", "X", "X"],
+    ["X", "1", "X", "X", "X", "1", "X"],
+    ["1", "X", "X", "X", "X", "X", "1"],
+]
+atom_target_list = [[1 if goal[j][i] == "1" else 0 for i in range(number_of_columns)] for j in range(number_of_rows)]
+print("Atom target matrix:")
+print_2d(atom_target_list)
+print("Initial occupation matrix:")
+print_2d(atom_location_list)
+
+##########################
+# Host-side 2D move plan #
+##########################
+start = time.time()
+passes = plan_2d_moves(atom_location_list, atom_target_list, max_number_of_tweezers, max_number_of_row_tones)
+print(f"\n{len(passes)} passes planned in {(time.time() - start) * 1e3:.1f} ms")
+final_occupation = apply_passes(atom_location_list, passes)
+print("Expected final occupation matrix:")
+print_2d(final_occupation.astype(int).tolist())
+# Comparison with the row by row sorting
+sources, destinations = plan_assignments(atom_location_list, atom_target_list, max_number_of_tweezers)
+print(
+    f"Target fill fraction: {fill_fraction(final_occupation, atom_target_list):.2f} with the 2D planner, "
+    f"{fill_fraction(apply_moves(atom_location_list, sources, destinations), atom_target_list):.2f} row by row"
+)
+
+# Static tone and moving tones of each pass in 1D
+column_table = chirp_rates_table(column_if, constant_pulse_length)
+row_table = chirp_rates_table(row_frequencies_list, constant_pulse_length)
+row_pass_frequencies, column_pass_frequencies = [], []
+row_pass_tones, column_pass_tones = ([], [], []), ([], [], [])
+for axis, line, pass_sources, pass_destinations in passes:
+    if axis == 0:
+        row_pass_frequencies.append(int(row_frequencies_list[line]))
+        line_frequencies, table, tones = column_if, column_table, row_pass_tones
+    else:
+        column_pass_frequencies.append(int(column_if[line]))
+        line_frequencies, table, tones = row_frequencies_list, row_table, column_pass_tones
+    for source, destination in zip(pass_sources.tolist(), pass_destinations.tolist()):
+        tones[0].append(int(line_frequencies[source]) if source >= 0 else int(line_frequencies[0]))
+        tones[1].append(1.0 if source >= 0 else 0.0)
+        tones[2].append(table[destination - source + len(line_frequencies) - 1] if source >= 0 else 0)
+nb_of_row_passes = len(row_pass_frequencies)
+nb_of_column_passes = len(column_pass_frequencies)
+# The QUA vectors cannot be empty
+if nb_of_row_passes == 0:
+    row_pass_frequencies = [0]
+    row_pass_tones = ([0] * max_number_of_tweezers, [0.0] * max_number_of_tweezers, [0] * max_number_of_tweezers)
+if nb_of_column_passes == 0:
+    column_pass_frequencies = [0]
+    column_pass_tones = ([0] * max_number_of_row_tones, [0.0] * max_number_of_row_tones, [0] * max_number_of_row_tones)
+
+# Column tweezers moving the atoms along the rows and row tones moving the atoms along the columns
+column_elements = [f"column_{i + 1}" for i in range(max_number_of_tweezers)]
+row_selectors = ["row_selector"] + [f"row_selector_{i}" for i in range(2, max_number_of_row_tones + 1)]
+
+###############
+# QUA program #
+###############
+with program() as atom_sorting_2d:
+    # QUA variable representing the current pass
+    current_pass = declare(int)
+    # QUA variables containing the static row frequency and the column tweezers of each row pass
+    row_pass_frequencies_qua = declare(int, value=row_pass_frequencies)
+    row_pass_tone_frequencies_qua = declare(int, value=row_pass_tones[0])
+    row_pass_amplitudes_qua = declare(fixed, value=row_pass_tones[1])
+    row_pass_chirp_rates_qua = declare(int, value=row_pass_tones[2])
+    # QUA variables containing the static column frequency and the row tones of each column pass
+    column_pass_frequencies_qua = declare(int, value=column_pass_frequencies)
+    column_pass_tone_frequencies_qua = declare(int, value=column_pass_tones[0])
+    column_pass_amplitudes_qua = declare(fixed, value=column_pass_tones[1])
+    column_pass_chirp_rates_qua = declare(int, value=column_pass_tones[2])
+    # QUA variable containing the tweezer phases
+    tweezer_phases_qua = declare(fixed, value=phases_list)
+
+    # Row passes
+    with for_(current_pass, 0, current_pass < nb_of_row_passes, current_pass + 1):
+        frequency_qua, amplitude_qua, chirp_rates_qua = get_current_pass(
+            current_pass,
+            max_number_of_tweezers,
+            row_pass_tone_frequencies_qua,
+            row_pass_amplitudes_qua,
+            row_pass_chirp_rates_qua,
+        )
+        play_sorting_pass(
+            "row_selector",
+            row_pass_frequencies_qua[current_pass],
+            column_elements,
+            frequency_qua,
+            amplitude_qua,
+            chirp_rates_qua,
+            tweezer_phases_qua,
+        )
+    # Column passes
+    with for_(current_pass, 0, current_pass < nb_of_column_passes, current_pass + 1):
+        frequency_qua, amplitude_qua, chirp_rates_qua = get_current_pass(
+            current_pass,
+            max_number_of_row_tones,
+            column_pass_tone_frequencies_qua,
+            column_pass_amplitudes_qua,
+            column_pass_chirp_rates_qua,
+        )
+        play_sorting_pass(
+            "column_1",
+            column_pass_frequencies_qua[current_pass],
+            row_selectors,
+            frequency_qua,
+            amplitude_qua,
+            chirp_rates_qua,
+            tweezer_phases_qua,
+        )
+
+#####################################
+#  Open Communication with the QOP  #
+#####################################
+Simulation = False
+
+qmm = QuantumMachinesManager(host=qop_ip, port=qop_port)
+
+if not Simulation:
+    # Open a quantum machine
+    qm = qmm.open_qm(config)
+    job = qm.execute(atom_sorting_2d)
+    job.result_handles.wait_for_all_values()
+
+else:
+    simulation_duration = 300  # simulate for 2e4 clock cycles or 120µs
+    job = qmm.simulate(
+        config,
+        atom_sorting_2d,
+        SimulationConfig(simulation_duration),
+        simulation_interface=LoopbackInterface([("con1", 1, "con1", 1), ("con1", 2, "con1", 2)]),
+    )
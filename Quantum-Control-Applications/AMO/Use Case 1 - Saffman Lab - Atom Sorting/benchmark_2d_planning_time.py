@@ -0,0 +1,66 @@
+"""
+Benchmark of the host-side 2D planner (planner_2d.py) for square arrays up to 50x50.
+For each array size, random occupation matrices are rearranged into a centered square target and the planning time,
+the number of passes and the target fill fraction are derived.
+"""
+from planner_2d import plan_2d_moves, apply_passes
+from reference_planner import fill_fraction
+import numpy as np
+import matplotlib.pyplot as plt
+import time
+
+##############
+# Parameters #
+##############
+array_sizes = [7, 10, 20, 30, 40, 50]  # Number of rows and columns of the arrays
+n_shots = 20  # Number of random occupation matrices per array size
+filling_probability = 0.6  # Probability to find an atom in a given site
+target_size = 0.7  # Side of the centered square target relative to the array size
+max_nb_of_row_moves = 7  # Number of column tweezers
+max_nb_of_column_moves = 2  # Number of row tones
+
+##############
+# Simulation #
+##############
+rng = np.random.default_rng(0)
+planning_times, nb_of_passes, fill = [], [], []
+for size in array_sizes:
+    side = int(target_size * size)
+    first = (size - side) // 2
+    target = np.zeros((size, size), dtype=bool)
+    target[first : first + side, first : first + side] = True
+    times, passes_count, fill_fractions = [], [], []
+    for _ in range(n_shots):
+        occupation = rng.random((size, size)) < filling_probability
+        start = time.perf_counter()
+        passes = plan_2d_moves(occupation, target, max_nb_of_row_moves, max_nb_of_column_moves)
+        times.append(time.perf_counter() - start)
+        passes_count.append(len(passes))
+        fill_fractions.append(fill_fraction(apply_passes(occupation, passes), target))
+    planning_times.append(np.array(times) * 1e3)
+    nb_of_passes.append(np.mean(passes_count))
+    fill.append(np.mean(fill_fractions))
+    print(
+        f"{size}x{size}: {np.mean(planning_times[-1]):.1f} +/- {np.std(planning_times[-1]):.1f} ms, "
+        f"{nb_of_passes[-1]:.0f} passes, target fill fraction {fill[-1]:.3f}"
+    )
+
+##########
+# Figure #
+##########
+plt.figure(figsize=(12, 4))
+plt.subplot(131)
+plt.errorbar(array_sizes, [np.mean(t) for t in planning_times], yerr=[np.std(t) for t in planning_times], fmt="o-")
+plt.yscale("log")
+plt.xlabel("Array size")
+plt.ylabel("Planning time [ms]")
+plt.subplot(132)
+plt.plot(array_sizes, nb_of_passes, "o-")
+plt.xlabel("Array size")
+plt.ylabel("Number of passes")
+plt.subplot(133)
+plt.plot(array_sizes, fill, "o-")
+plt.xlabel("Array size")
+plt.ylabel("Target fill fraction")
+plt.tight_layout()
+plt.show()
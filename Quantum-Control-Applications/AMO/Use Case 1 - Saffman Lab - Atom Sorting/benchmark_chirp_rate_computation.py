@@ -0,0 +1,135 @@
+"""
+Benchmark of the real-time dead time spent deriving the chirp rates of each row before playing the chirp pulses.
+The chirp rates are either computed in real-time from the tweezer detunings (calculate_chirp_rates and
+calculate_piecewise_chirp_rates) or read from the table precomputed for every signed column difference of a move
+(lookup_chirp_rates and lookup_piecewise_chirp_rates).
+A short marker pulse is played on the row selector before and after the computation of the chirp rates of each row, and
+the gap between the two markers is extracted from the simulated waveforms.
+"""
+from qm.qua import *
+from qm.QuantumMachinesManager import QuantumMachinesManager
+from qm import SimulationConfig
+from config_array_sorting import *
+from macros import *
+import matplotlib.pyplot as plt
+
+##############
+# Parameters #
+##############
+n_rows_benchmark = number_of_rows  # Number of random rows sorted for each configuration
+filling_probability = 0.6  # Probability to find an atom in a given site
+marker_len = 4  # Duration of the marker pulses in clock cycles
+simulation_duration = int(5e4)  # Must be long enough to sort all the rows (clock cycles)
+np.random.seed(0)
+# Random occupation and target matrices
+occupation = np.random.choice(
+    [0, 1], size=n_rows_benchmark * number_of_columns, p=[1 - filling_probability, filling_probability]
+)
+atom_location_list_1d = [int(x) for x in occupation]
+atom_target_1d_python = [int(x) for x in np.random.choice([0, 1], size=n_rows_benchmark * number_of_columns)]
+target_frequencies_1d = [
+    column_if[i % number_of_columns] if atom_target_1d_python[i] else 0 for i in range(len(atom_target_1d_python))
+]
+
+
+def chirp_rates_program(piecewise, lookup):
+    """
+    Generates a program that sorts the rows of the random occupation matrix and brackets the real-time derivation of the
+    chirp rates of each row with two marker pulses played by the row selector.
+
+    :param piecewise: Whether to derive the piecewise minimum jerk chirp rates or the constant ones (bool).
+    :param lookup: Whether to read the chirp rates from the lookup table or to compute them in real-time (bool).
+
+    :return: The QUA program.
+    """
+    with program() as prog:
+        data_stream = declare_stream()
+        current_row = declare(int)
+        atom_location_full = declare(int, value=atom_location_list_1d)
+        atom_target_full_qua = declare(int, value=atom_target_1d_python)
+        target_frequencies_full_qua = declare(int, value=target_frequencies_1d)
+        column_frequencies_qua = declare(int, value=column_if)
+        tweezer_phases_qua = declare(fixed, value=phases_list)
+        if lookup:
+            chirp_rates_table_qua = declare(
+                int, value=chirp_rates_table(column_if, constant_pulse_length, n_segment_python if piecewise else None)
+            )
+            moves_qua = declare(int, size=max_number_of_tweezers)
+        else:
+            moves_qua = None
+
+        with for_(current_row, 0, current_row < n_rows_benchmark, current_row + 1):
+            atom_location_qua, atom_target_qua, target_frequencies_qua = get_current_row(
+                current_row, number_of_columns, atom_location_full, atom_target_full_qua, target_frequencies_full_qua
+            )
+            number_of_tweezers = find_number_of_tweezers(atom_location_qua, atom_target_qua, max_number_of_tweezers)
+            atoms_to_the_right_qua = count_atoms_to_the_right(number_of_columns, atom_location_qua)
+            amplitude_qua, frequency_qua, phase_qua, detuning_qua = assign_tweezers_to_atoms_collision_free(
+                number_of_tweezers,
+                max_number_of_tweezers,
+                number_of_columns,
+                atom_location_qua,
+                atom_target_qua,
+                column_frequencies_qua,
+                target_frequencies_qua,
+                tweezer_phases_qua,
+                data_stream,
+                atoms_to_the_right=atoms_to_the_right_qua,
+                moves=moves_qua,
+            )
+            # Marker indicating the start of the chirp rates computation
+            play("constant", "row_selector", duration=marker_len)
+            if lookup and piecewise:
+                lookup_piecewise_chirp_rates(max_number_of_tweezers, moves_qua, chirp_rates_table_qua, n_segment_python)
+            elif lookup:
+                lookup_chirp_rates(max_number_of_tweezers, moves_qua, chirp_rates_table_qua)
+            else:
+                chirp_pulse_duration_qua = calculate_pulse_length(detuning_qua, constant_pulse_length)
+                if piecewise:
+                    calculate_piecewise_chirp_rates(
+                        max_number_of_tweezers, detuning_qua, chirp_pulse_duration_qua, n_segment_python
+                    )
+                else:
+                    calculate_chirp_rates(max_number_of_tweezers, detuning_qua, chirp_pulse_duration_qua)
+            align()
+            # Marker indicating the end of the chirp rates computation, i.e. when the chirp pulses can be played
+            play("constant", "row_selector", duration=marker_len)
+            align()
+
+        with stream_processing():
+            data_stream.save_all("data")
+
+    return prog
+
+
+#####################################
+#  Open Communication with the QOP  #
+#####################################
+qmm = QuantumMachinesManager(host=qop_ip, port=qop_port)
+
+gaps = {}
+for piecewise in [False, True]:
+    for lookup in [False, True]:
+        job = qmm.simulate(config, chirp_rates_program(piecewise, lookup), SimulationConfig(simulation_duration))
+        job.result_handles.wait_for_all_values()
+        gaps[(piecewise, lookup)] = get_marker_gaps(job, "row_selector", n_rows_benchmark)
+
+for piecewise, chirp in zip([False, True], ["constant", "piecewise"]):
+    computed = np.mean(gaps[(piecewise, False)])
+    looked_up = np.mean(gaps[(piecewise, True)])
+    print(
+        f"{chirp} chirps: {computed:.0f} clock cycles computed in real-time, {looked_up:.0f} clock cycles with the "
+        f"lookup table ({computed - looked_up:.0f} clock cycles shorter gap before the chirp pulses)"
+    )
+
+##########
+# Figure #
+##########
+plt.figure()
+for (piecewise, lookup), row_gaps in gaps.items():
+    label = f"{'piecewise' if piecewise else 'constant'} chirps, {'lookup table' if lookup else 'real-time'}"
+    plt.plot(np.arange(n_rows_benchmark), row_gaps, "o-", label=label)
+plt.xlabel("Row")
+plt.ylabel("Chirp rates computation [clock cycles]")
+plt.legend()
+plt.show()
@@ -0,0 +1,152 @@
+"""
+Benchmark of the generation of the atom sorting program for an increasing number of tweezers.
+For each number of tweezers, the row by row sorting program (collision free assignment with linear or piecewise chirps)
+is generated for an array with as many columns as tweezers, and the number of QUA statements, the size of the generated
+QUA script, the Python generation time and the compilation time are reported.
+Since the element played by a QUA statement is fixed at compile time, each tweezer requires its own frequency, phase
+and play statements, while all the other computations are done in QUA loops over the tweezers.
+"""
+from qm.qua import *
+from qm.QuantumMachinesManager import QuantumMachinesManager
+from qm import generate_qua_script
+from config_array_sorting import *
+from macros import *
+import matplotlib.pyplot as plt
+import copy
+import time
+
+##############
+# Parameters #
+##############
+tweezers_list = [7, 16, 32, 64]  # Number of tweezers to benchmark
+filling_probability = 0.6  # Probability to find an atom in a given site
+np.random.seed(0)
+
+
+def sorting_program(nb_of_tweezers, piecewise):
+    """
+    Generates the row by row sorting program for an array with as many columns as tweezers.
+
+    :param nb_of_tweezers: A python variable for the number of tweezers and columns (int).
+    :param piecewise: Whether to use the piecewise minimum jerk chirps or the constant ones (bool).
+
+    :return: The QUA program.
+    """
+    column_frequencies = [int(column_if_first_site + column_spacing * i) for i in range(nb_of_tweezers)]
+    occupation_1d = [
+        int(x)
+        for x in np.random.choice(
+            [0, 1], size=number_of_rows * nb_of_tweezers, p=[1 - filling_probability, filling_probability]
+        )
+    ]
+    target_1d = [1] * (number_of_rows * nb_of_tweezers)
+    target_frequencies = [column_frequencies[i % nb_of_tweezers] for i in range(len(target_1d))]
+    with program() as prog:
+        data_stream = declare_stream()
+        current_row = declare(int)
+        atom_location_full = declare(int, value=occupation_1d)
+        atom_target_full_qua = declare(int, value=target_1d)
+        target_frequencies_full_qua = declare(int, value=target_frequencies)
+        row_frequencies_qua = declare(int, value=[int(x) for x in row_frequencies_list])
+        column_frequencies_qua = declare(int, value=column_frequencies)
+        tweezer_phases_qua = declare(fixed, value=[phases_list[i % len(phases_list)] for i in range(nb_of_tweezers)])
+
+        with for_(current_row, 0, current_row < number_of_rows, current_row + 1):
+            atom_location_qua, atom_target_qua, target_frequencies_qua = get_current_row(
+                current_row, nb_of_tweezers, atom_location_full, atom_target_full_qua, target_frequencies_full_qua
+            )
+            number_of_tweezers = find_number_of_tweezers(atom_location_qua, atom_target_qua, nb_of_tweezers)
+            atoms_to_the_right_qua = count_atoms_to_the_right(nb_of_tweezers, atom_location_qua)
+            amplitude_qua, frequency_qua, phase_qua, detuning_qua = assign_tweezers_to_atoms_collision_free(
+                number_of_tweezers,
+                nb_of_tweezers,
+                nb_of_tweezers,
+                atom_location_qua,
+                atom_target_qua,
+                column_frequencies_qua,
+                target_frequencies_qua,
+                tweezer_phases_qua,
+                data_stream,
+                atoms_to_the_right=atoms_to_the_right_qua,
+            )
+            chirp_pulse_duration_qua = calculate_pulse_length(detuning_qua, constant_pulse_length)
+            if piecewise:
+                chirp_rates_qua = calculate_piecewise_chirp_rates(
+                    nb_of_tweezers, detuning_qua, chirp_pulse_duration_qua, n_segment_python
+                )
+            else:
+                chirp_rates_qua = calculate_chirp_rates(nb_of_tweezers, detuning_qua, chirp_pulse_duration_qua)
+            set_tweezers_frequencies_and_phases(
+                nb_of_tweezers, frequency_qua, row_frequencies_qua[current_row], phase_qua
+            )
+            align()
+            play_chirp_pulses(nb_of_tweezers, amplitude_qua, chirp_rates_qua)
+
+        with stream_processing():
+            data_stream.save_all("data")
+
+    return prog
+
+
+def config_with_tweezers(nb_of_tweezers):
+    """
+    Returns a copy of the configuration with nb_of_tweezers column tweezers.
+
+    :param nb_of_tweezers: A python variable for the number of tweezers (int).
+    :return: The configuration dictionary.
+    """
+    config_tweezers = copy.deepcopy(config)
+    for i in range(1, nb_of_tweezers + 1):
+        config_tweezers["elements"][f"column_{i}"] = copy.deepcopy(config["elements"]["column_1"])
+    return config_tweezers
+
+
+#####################################
+#  Open Communication with the QOP  #
+#####################################
+qmm = QuantumMachinesManager(host=qop_ip, port=qop_port)
+
+results = {False: [], True: []}
+for piecewise in [False, True]:
+    for nb_of_tweezers in tweezers_list:
+        start = time.perf_counter()
+        prog = sorting_program(nb_of_tweezers, piecewise)
+        generation_time = time.perf_counter() - start
+        script = generate_qua_script(prog)
+        # One statement per line of the generated program
+        body = script[script.index("with program()") : script.index("config = ")] if "config = " in script else script
+        nb_of_statements = len([line for line in body.splitlines() if line.strip()])
+        # Compilation on the QOP
+        qm = qmm.open_qm(config_with_tweezers(nb_of_tweezers))
+        start = time.perf_counter()
+        try:
+            qm.compile(prog)
+            compile_time = time.perf_counter() - start
+        except Exception as error:
+            print(f"Compilation failed for {nb_of_tweezers} tweezers: {error}")
+            compile_time = np.nan
+        qm.close()
+        results[piecewise].append((nb_of_statements, len(body), generation_time, compile_time))
+        print(
+            f"{'piecewise' if piecewise else 'constant'} chirps, {nb_of_tweezers} tweezers: "
+            f"{nb_of_statements} statements, {len(body) / 1e3:.1f} kB script, "
+            f"generated in {generation_time * 1e3:.0f} ms, compiled in {compile_time:.2f} s"
+        )
+    statements = [r[0] for r in results[piecewise]]
+    slope = np.polyfit(tweezers_list, statements, 1)[0]
+    print(f"--> {slope:.1f} statements per additional tweezer")
+
+##########
+# Figure #
+##########
+plt.figure(figsize=(12, 4))
+for i, ylabel in enumerate(["Number of statements", "Script size [characters]", "Compilation time [s]"]):
+    plt.subplot(131 + i)
+    for piecewise in [False, True]:
+        values = [r[i if i < 2 else 3] for r in results[piecewise]]
+        plt.plot(tweezers_list, values, "o-", label="piecewise chirps" if piecewise else "constant chirps")
+    plt.xlabel("Number of tweezers")
+    plt.ylabel(ylabel)
+    plt.legend()
+plt.tight_layout()
+plt.show()
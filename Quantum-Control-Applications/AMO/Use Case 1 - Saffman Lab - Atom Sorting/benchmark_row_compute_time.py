@@ -0,0 +1,129 @@
+"""
+Benchmark of the real-time dead time spent computing the tweezer assignment of each row with the collision free
+sorting algorithm. For each number of columns, the same random occupation matrices are sorted by summing the atoms to
+the right of every trial atom (suffix_count=False) and by reading the suffix-count vector built once per row
+(suffix_count=True).
+A short marker pulse is played on the row selector before and after the computation of each row, and the gap between
+the two markers is extracted from the simulated waveforms.
+"""
+from qm.qua import *
+from qm.QuantumMachinesManager import QuantumMachinesManager
+from qm import SimulationConfig
+from config_array_sorting import *
+from macros import *
+import matplotlib.pyplot as plt
+
+##############
+# Parameters #
+##############
+columns_list = [7, 10, 16, 24, 32]  # Number of columns to benchmark
+n_rows_benchmark = 10  # Number of random rows sorted for each number of columns
+filling_probability = 0.6  # Probability to find an atom in a given site
+marker_len = 4  # Duration of the marker pulses in clock cycles
+simulation_duration = int(2e5)  # Must be long enough to sort all the rows with the nested summation (clock cycles)
+np.random.seed(0)
+
+
+def row_compute_program(nb_of_columns, occupation_1d, target_1d, suffix):
+    """
+    Generates a program that sorts the rows of the provided occupation matrix and brackets the real-time computation of
+    each row with two marker pulses played by the row selector.
+
+    :param nb_of_columns: A python variable for the number of column in the array (int).
+    :param occupation_1d: The 1D occupation matrix (list of 0 and 1).
+    :param target_1d: The 1D target matrix (list of 0 and 1).
+    :param suffix: Whether to use the suffix-count vector or the nested summation (bool).
+
+    :return: The QUA program.
+    """
+    column_frequencies = [int(column_if_first_site + column_spacing * i) for i in range(nb_of_columns)]
+    target_frequencies = [column_frequencies[i % nb_of_columns] if target_1d[i] else 0 for i in range(len(target_1d))]
+    with program() as prog:
+        data_stream = declare_stream()
+        current_row = declare(int)
+        atom_location_full = declare(int, value=occupation_1d)
+        atom_target_full_qua = declare(int, value=target_1d)
+        target_frequencies_full_qua = declare(int, value=target_frequencies)
+        column_frequencies_qua = declare(int, value=column_frequencies)
+        tweezer_phases_qua = declare(fixed, value=[phases_list[i % len(phases_list)] for i in range(nb_of_columns)])
+
+        with for_(current_row, 0, current_row < n_rows_benchmark, current_row + 1):
+            # Marker indicating the start of the row computation
+            play("constant", "row_selector", duration=marker_len)
+            atom_location_qua, atom_target_qua, target_frequencies_qua = get_current_row(
+                current_row, nb_of_columns, atom_location_full, atom_target_full_qua, target_frequencies_full_qua
+            )
+            number_of_tweezers = find_number_of_tweezers(atom_location_qua, atom_target_qua, max_number_of_tweezers)
+            if suffix:
+                atoms_to_the_right_qua = count_atoms_to_the_right(nb_of_columns, atom_location_qua)
+            else:
+                atoms_to_the_right_qua = None
+            assign_tweezers_to_atoms_collision_free(
+                number_of_tweezers,
+                max_number_of_tweezers,
+                nb_of_columns,
+                atom_location_qua,
+                atom_target_qua,
+                column_frequencies_qua,
+                target_frequencies_qua,
+                tweezer_phases_qua,
+                data_stream,
+                atoms_to_the_right=atoms_to_the_right_qua,
+            )
+            align()
+            # Marker indicating the end of the row computation
+            play("constant", "row_selector", duration=marker_len)
+            align()
+
+        with stream_processing():
+            data_stream.save_all("data")
+
+    return prog
+
+
+#####################################
+#  Open Communication with the QOP  #
+#####################################
+qmm = QuantumMachinesManager(host=qop_ip, port=qop_port)
+
+dead_times = {False: [], True: []}
+for n_columns in columns_list:
+    # Random occupation and compact target centered in the row
+    occupation = np.random.choice(
+        [0, 1], size=(n_rows_benchmark, n_columns), p=[1 - filling_probability, filling_probability]
+    )
+    first_target = (n_columns - max_number_of_tweezers) // 2
+    target_row = [1 if first_target <= i < first_target + max_number_of_tweezers else 0 for i in range(n_columns)]
+    occupation_list = [int(x) for x in occupation.flatten()]
+    target_list = target_row * n_rows_benchmark
+    for suffix_count in [False, True]:
+        job = qmm.simulate(
+            config,
+            row_compute_program(n_columns, occupation_list, target_list, suffix_count),
+            SimulationConfig(simulation_duration),
+        )
+        job.result_handles.wait_for_all_values()
+        gaps = get_marker_gaps(job, "row_selector", n_rows_benchmark)
+        dead_times[suffix_count].append(gaps)
+        print(
+            f"{n_columns} columns, suffix_count={suffix_count}: "
+            f"{np.mean(gaps):.0f} +/- {np.std(gaps):.0f} clock cycles per row"
+        )
+
+##########
+# Figure #
+##########
+plt.figure()
+for suffix_count, label in zip([False, True], ["nested summation", "suffix count"]):
+    plt.errorbar(
+        columns_list,
+        [np.mean(g) for g in dead_times[suffix_count]],
+        yerr=[np.std(g) for g in dead_times[suffix_count]],
+        fmt="o-",
+        label=label,
+    )
+plt.xlabel("Number of columns")
+plt.ylabel("Compute time per row [clock cycles]")
+plt.title("Collision free tweezer assignment")
+plt.legend()
+plt.show()
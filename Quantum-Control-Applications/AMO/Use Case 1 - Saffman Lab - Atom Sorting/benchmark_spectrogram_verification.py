@@ -0,0 +1,139 @@
+"""
+Benchmark of the headless verification of the chirp trajectories (spectrogram_verifier.py) on synthetic raw ADC traces.
+The traces of all the rows of a random occupation matrix are generated from the moves derived by the reference planner,
+with Blackman power ramps, linear chirps, the row selector tone and white noise. One tweezer of one row is sent to the
+wrong column in order to check that the corresponding row is flagged. The verification time of all the rows is
+compared with the computation of the spectrograms of array_sorting.py with matplotlib, and with the duration of the
+chirps of all the rows for the end frequency check of track_chirp_ends, which runs on every sorting sequence of the
+continuous loop.
+"""
+from config_array_sorting import *
+from reference_planner import plan_assignments
+from spectrogram_verifier import track_tones, track_chirp_ends, verify_chirps
+import matplotlib.pyplot as plt
+from matplotlib import mlab
+import time
+
+##############
+# Parameters #
+##############
+filling_probability = 0.6  # Probability to find an atom in a given site
+faulty_row = 3  # Row in which one tweezer is sent to the wrong column
+noise_amplitude = 0.5  # Standard deviation of the white noise relative to the amplitude of one tweezer
+n_repetitions = 5  # Number of repetitions of the timing measurements
+sampling_rate = 1e9  # ADC sampling rate in Hz
+tolerance = abs(column_spacing) / 4  # Maximum frequency error in Hz
+rng = np.random.default_rng(0)
+
+########################
+# Synthetic ADC traces #
+########################
+occupation = rng.random((number_of_rows, number_of_columns)) < filling_probability
+target = np.ones((number_of_rows, number_of_columns), dtype=int)
+target_frequencies_full_python = [[int(column_if[i]) for i in range(number_of_columns)] for j in range(number_of_rows)]
+sources, destinations = plan_assignments(occupation, target, max_number_of_tweezers)
+faulty_destinations = destinations.copy()
+if np.any(sources[faulty_row] >= 0):
+    # The last tweezer of the faulty row ends one column away from its target
+    last = np.flatnonzero(sources[faulty_row] >= 0)[-1]
+    faulty_destinations[faulty_row, last] = (destinations[faulty_row, last] + 1) % number_of_columns
+
+t = np.arange(int(readout_pulse_length)) / sampling_rate
+ramp_up, ramp_down = int(blackman_pulse_length), int(blackman_pulse_length + constant_pulse_length)
+envelope = np.concatenate(
+    [
+        blackman(blackman_pulse_length, 0, 1),
+        np.ones(int(constant_pulse_length)),
+        blackman(blackman_pulse_length, 1, 0),
+    ]
+)
+raw_traces = np.zeros((number_of_rows, len(t)))
+for row in range(number_of_rows):
+    raw_traces[row] = envelope * np.cos(2 * np.pi * row_frequencies_list[row] * t)
+    for source, destination in zip(sources[row], faulty_destinations[row]):
+        if source < 0:
+            continue
+        # Instantaneous frequency: static, linear chirp and static
+        frequency = np.full(len(t), float(column_if[source]))
+        frequency[ramp_up:ramp_down] += np.linspace(0, column_if[destination] - column_if[source], ramp_down - ramp_up)
+        frequency[ramp_down:] = column_if[destination]
+        raw_traces[row] += envelope * np.cos(2 * np.pi * np.cumsum(frequency) / sampling_rate + rng.random())
+raw_traces += noise_amplitude * rng.standard_normal(raw_traces.shape)
+nb_of_tweezers = np.sum(sources >= 0, axis=1)
+
+################
+# Verification #
+################
+frequency_band = (min(column_if) - abs(column_spacing), max(column_if) + abs(column_spacing))
+verification_times = []
+for _ in range(n_repetitions):
+    start = time.perf_counter()
+    times, tracks = track_tones(
+        raw_traces,
+        nb_of_tweezers,
+        sampling_rate=sampling_rate,
+        frequency_band=frequency_band,
+        excluded_frequencies=row_frequencies_list,
+        exclusion_width=tolerance,
+    )
+    passed, end_frequencies, arrival_times = verify_chirps(
+        times, tracks, target_frequencies_full_python, nb_of_tweezers, tolerance
+    )
+    verification_times.append(time.perf_counter() - start)
+end_check_times = []
+for _ in range(n_repetitions):
+    start = time.perf_counter()
+    end_times, end_tracks = track_chirp_ends(
+        raw_traces,
+        ramp_down,
+        nb_of_tweezers,
+        frequency_band,
+        sampling_rate=sampling_rate,
+        excluded_frequencies=row_frequencies_list,
+        exclusion_width=tolerance,
+    )
+    end_passed, end_check_frequencies, _ = verify_chirps(
+        end_times, end_tracks, target_frequencies_full_python, nb_of_tweezers, tolerance
+    )
+    end_check_times.append(time.perf_counter() - start)
+specgram_times = []
+for _ in range(n_repetitions):
+    start = time.perf_counter()
+    for row in range(number_of_rows):
+        mlab.specgram(raw_traces[row], NFFT=2**14, Fs=sampling_rate, noverlap=100)
+    specgram_times.append(time.perf_counter() - start)
+
+for row in range(number_of_rows):
+    used = ~np.isnan(end_frequencies[row])
+    print(
+        f"row {row}: {'pass' if passed[row] else 'FAIL'}, {nb_of_tweezers[row]} tweezers, "
+        f"end frequencies {np.round(end_frequencies[row][used] / 1e6, 3).tolist()} MHz, "
+        f"arrival times {np.round(arrival_times[row][used] * 1e6).tolist()} us"
+    )
+print(
+    f"\nVerification of {number_of_rows} rows: {np.mean(verification_times) * 1e3:.0f} +/- "
+    f"{np.std(verification_times) * 1e3:.0f} ms vs {np.mean(specgram_times) * 1e3:.0f} +/- "
+    f"{np.std(specgram_times) * 1e3:.0f} ms for the matplotlib spectrograms"
+)
+print(
+    f"End frequency check of {number_of_rows} rows: {np.mean(end_check_times) * 1e3:.1f} +/- "
+    f"{np.std(end_check_times) * 1e3:.1f} ms for {number_of_rows * readout_pulse_length / 1e6:.1f} ms of chirps, "
+    f"failed rows {np.flatnonzero(~end_passed).tolist()} vs {np.flatnonzero(~passed).tolist()} for the full "
+    f"verification, largest difference of the end frequencies "
+    f"{np.nanmax(np.abs(end_check_frequencies - end_frequencies)) / 1e3:.1f} kHz"
+)
+
+##########
+# Figure #
+##########
+plt.figure(figsize=(25, 12))
+for row in range(number_of_rows):
+    plt.subplot(241 + row)
+    for j in range(len(column_if)):
+        plt.axhline(column_if[j] / 1e6, color="k", linewidth=1, linestyle="--")
+    plt.plot(times * 1e6, tracks[row] / 1e6, ".")
+    plt.title(f"row {row}: {'pass' if passed[row] else 'FAIL'}")
+    plt.xlabel("Time [µs]")
+    plt.ylabel("Frequency [MHz]")
+plt.tight_layout()
+plt.show()
@@ -18,6 +18,78 @@ def blackman(t, v_start, v_end):
     return black
 
 
+def minimum_jerk_profile(nb_of_segments):
+    """
+    Chirp rate profile of the minimum jerk trajectory sampled at the end of each segment, relative to the mean chirp rate
+    of the pulse. It peaks at 1.875 in the middle of the pulse.
+    :param nb_of_segments: number of segments of the piecewise chirp (int)
+    :return: the relative chirp rate of each segment (numpy array)
+    """
+    tau = np.arange(1, nb_of_segments + 1) / nb_of_segments
+    return 30 * tau**2 - 60 * tau**3 + 30 * tau**4
+
+
+def minimum_jerk_chirp_rates(detunings, pulse_durations, nb_of_segments):
+    """
+    Piecewise chirp rates following the minimum jerk trajectory for any (detuning, pulse duration) pairs.
+    :param detunings: total frequency detuning of each chirp [Hz] (array)
+    :param pulse_durations: chirp pulse duration [ns], broadcast against the detunings (array)
+    :param nb_of_segments: number of segments of the piecewise chirp (int)
+    :return: chirp rates [mHz/ns] of shape (..., nb_of_segments) (numpy array of int)
+    """
+    linear_piece = minimum_jerk_profile(nb_of_segments)
+    detunings = np.asarray(detunings, dtype=float)[..., None]
+    pulse_durations = np.asarray(pulse_durations, dtype=float)[..., None]
+    return np.trunc(detunings * linear_piece / (pulse_durations / 1000)).astype(int)
+
+
+def pulse_durations_table(column_frequencies, max_rate, nb_of_segments=None):
+    """
+    Chirp pulse durations set by the maximum chirp rate, for every possible maximum detuning of a row. For evenly spaced
+    columns, the maximum detuning of a row is set by the largest column difference of its moves, from 0 to
+    len(column_frequencies) - 1, which indexes the table.
+    :param column_frequencies: frequency of each column [Hz] (list)
+    :param max_rate: maximum chirp rate [Hz/ns] (float)
+    :param nb_of_segments: number of segments of the piecewise minimum jerk chirp, None for constant chirps. The pulses
+    are then lengthened by the peak of minimum_jerk_profile(), so that the rate of every segment stays below max_rate
+    (int)
+    :return: the absolute detuning [Hz] of each column difference and the corresponding pulse durations [ns], multiple
+    of 4 ns and at least 16 ns (lists of int)
+    """
+    column_frequencies = np.asarray(column_frequencies, dtype=float)
+    if nb_of_segments is not None:
+        max_rate = max_rate / np.max(minimum_jerk_profile(nb_of_segments))
+    max_detunings = np.abs(np.mean(np.diff(column_frequencies))) * np.arange(len(column_frequencies))
+    pulse_durations = 4 * np.maximum(np.floor(max_detunings / max_rate / 4), 4).astype(int)
+    return [int(x) for x in max_detunings], [int(x) for x in pulse_durations]
+
+
+def chirp_rates_table(column_frequencies, pulse_duration, nb_of_segments=None, max_rate=None):
+    """
+    Chirp rates of every possible move between two evenly spaced columns, to be declared as a QUA lookup table.
+    Since the rate of a move only depends on its signed column difference, the move from the column i to the column j
+    has the index j - i + len(column_frequencies) - 1, among 2 * len(column_frequencies) - 1 moves.
+    :param column_frequencies: frequency of each column [Hz] (list)
+    :param pulse_duration: chirp pulse duration [ns] (int), not used if max_rate is not None
+    :param nb_of_segments: number of segments of the piecewise minimum jerk chirp, None for constant chirps (int)
+    :param max_rate: maximum chirp rate [Hz/ns] setting the pulse duration of each row, see pulse_durations_table().
+    The table then contains one block of 2 * len(column_frequencies) - 1 moves per largest column difference of a row
+    (float)
+    :return: flattened list of chirp rates [mHz/ns] with nb_of_segments consecutive rates per move for piecewise chirps
+    """
+    column_frequencies = np.asarray(column_frequencies, dtype=float)
+    nb_of_columns = len(column_frequencies)
+    detunings = np.mean(np.diff(column_frequencies)) * np.arange(1 - nb_of_columns, nb_of_columns)
+    if max_rate is not None:
+        pulse_durations = pulse_durations_table(column_frequencies, max_rate, nb_of_segments)[1]
+        pulse_duration = np.array(pulse_durations)[:, None]
+    if nb_of_segments is None:
+        rates = detunings / (pulse_duration / 1000)
+    else:
+        rates = minimum_jerk_chirp_rates(detunings, pulse_duration, nb_of_segments)
+    return [int(x) for x in np.trunc(rates).flatten()]
+
+
 def print_2d(matrix):
     """
     Nicely prints a 2D array
@@ -76,11 +148,15 @@ column_if = [int(column_if_first_site + column_spacing * i) for i in range(numbe
 row_spacing = 0.76e6  # in Hz
 row_selector_if = 68.6e6  # in Hz
 row_frequencies_list = [row_selector_if + row_spacing * x for x in range(number_of_rows)]
+# Maximum number of rows sorted simultaneously with several row tones (multi_row_sorting.py)
+max_number_of_row_tones = 2
 
 # Readout time of the occupation matrix sent by fpga
 readout_fpga_len = 60
 # Readout duration for acquiring the spectrographs
 readout_pulse_length = blackman_pulse_length * 2 + constant_pulse_length
+# Duration of the marker pulses used to timestamp the real-time computations
+marker_pulse_length = 16
 
 # --> Microwave qubit addressing
 qubit_LO = 9.4e9  # Hz
@@ -166,6 +242,14 @@ config = {
             "time_of_flight": 24,
             "smearing": 0,
         },
+        # timestamp is used to timestamp the real-time computations of each row
+        "timestamp": {
+            "singleInput": {"port": ("con1", 7)},  # Fake output port for the marker pulses
+            "intermediate_frequency": 0,
+            "operations": {
+                "marker": "marker_pulse",
+            },
+        },
         # row_selector is used to control the row AOD
         "row_selector": {
             "singleInput": {
@@ -201,6 +285,13 @@ config = {
             },
             "digital_marker": "ON",
         },
+        "marker_pulse": {
+            "operation": "control",
+            "length": marker_pulse_length,
+            "waveforms": {
+                "single": "zero_wf",
+            },
+        },
         "blackman_up_pulse": {
             "operation": "control",
             "length": blackman_pulse_length,
@@ -296,3 +387,16 @@ for i in range(1, n_tweezers + 1):
             "constant": "constant_pulse",
         },
     }
+# Iteratively add the additional row tones, the first one being played by the row_selector
+for i in range(2, max_number_of_row_tones + 1):
+    config["elements"][f"row_selector_{i}"] = {
+        "singleInput": {
+            "port": ("con1", row_channel),
+        },
+        "intermediate_frequency": row_selector_if,
+        "operations": {
+            "blackman_up": "blackman_up_pulse",
+            "blackman_down": "blackman_down_pulse",
+            "constant": "constant_pulse",
+        },
+    }
@@ -0,0 +1,825 @@
+"""
+This file contains the QUA macros used by the atom sorting programs.
+All the macros below have been written and tested with the basic configuration. If you modify this configuration
+(elements, operations, number of tweezers...) these macros will need to be modified accordingly.
+"""
+
+from qm.qua import *
+from config_array_sorting import phases_list
+import numpy as np
+
+
+##############
+# QUA macros #
+##############
+
+
+def analog_readout(nb_of_rows, nb_of_columns, readout_threshold, readout_done, debug_stream):
+    """
+    This macro gets the current occupation matrix from the measurement of an analog signal sent by an external device.
+    If the receive signal is larger than readout_threshold, then there is no atom and if it is smaller it means that
+    there is an atom. The readout_done flag becomes True when all the sites have been received.
+
+    :param nb_of_rows: A python variable for the number of rows in the array (int).
+    :param nb_of_columns: A python variable for the number of column in the array (int).
+    :param readout_threshold: A python variable for the analog threshold dicriminating between atom and no-atom (float).
+    :param readout_done: A QUA variable for stating whether the readout is completed or not (bool).
+    :param debug_stream: A QUA stream used to save the received occupation matrix for debug.
+
+    :return: Three QUA 1D vectors for the atom locations, target locations and target frequencies of the current row.
+    """
+    occupation_matrix = declare(int, size=nb_of_columns * nb_of_rows)  # Full 1D occupation matrix
+    num_sites = declare(int, value=nb_of_columns * nb_of_rows)  # Total number of sites to be measured
+    data = declare(fixed)  # integrated data for occupation matrix readout
+    counter = declare(int)  # Counter for keeping track of the received locations
+    assign(counter, 0)
+    with while_(~readout_done):
+        wait_for_trigger("fpga")
+        measure("readout_fpga", "fpga", None, integration.full("constant", data, "out1"))
+        with if_(data < readout_threshold):
+            assign(occupation_matrix[counter], 1)
+        with else_():
+            assign(occupation_matrix[counter], 0)
+        save(occupation_matrix[counter], debug_stream)
+        assign(counter, counter + 1)
+        assign(readout_done, counter == num_sites)
+    return occupation_matrix, readout_done
+
+
+def analog_readout_row(this_row, nb_of_columns, readout_threshold, occupation_matrix, buffer_offset, debug_stream):
+    """
+    This macro gets the occupation of a single row from the measurement of an analog signal sent by an external device,
+    so that each row can be sorted as soon as its sites have been received. The sites are written in the occupation
+    buffer starting at buffer_offset, which allows receiving the next occupation matrix in a second buffer while the
+    current one is being sorted.
+    If the receive signal is larger than readout_threshold, then there is no atom and if it is smaller it means that
+    there is an atom.
+
+    :param this_row: A QUA variable for the row being received (int).
+    :param nb_of_columns: A python variable for the number of column in the array (int).
+    :param readout_threshold: A python variable for the analog threshold dicriminating between atom and no-atom (float).
+    :param occupation_matrix: A 1D QUA vector containing the occupation buffers (int).
+    :param buffer_offset: A QUA variable for the index of the first site of the buffer to fill (int).
+    :param debug_stream: A QUA stream used to save the received occupation matrix for debug.
+    """
+    data = declare(fixed)  # integrated data for occupation matrix readout
+    first_site = declare(int)  # Index of the first site of the row in the occupation buffers
+    col = declare(int)  # Qua variable for looping over the columns
+    assign(first_site, buffer_offset + this_row * nb_of_columns)
+    with for_(col, 0, col < nb_of_columns, col + 1):
+        wait_for_trigger("fpga")
+        measure("readout_fpga", "fpga", None, integration.full("constant", data, "out1"))
+        with if_(data < readout_threshold):
+            assign(occupation_matrix[first_site + col], 1)
+        with else_():
+            assign(occupation_matrix[first_site + col], 0)
+        save(occupation_matrix[first_site + col], debug_stream)
+
+
+def get_current_row(
+    this_row,
+    nb_of_columns,
+    current_location_full,
+    target_location_full,
+    target_frequencies_full,
+    buffer_offset=None,
+):
+    """
+    This macro gets the current and target locations and target frequencies of the current row from the full 1d vector.
+
+    :param this_row: A QUA variable for the current row (int).
+    :param nb_of_columns: A python variable for the number of column in the array (int).
+    :param current_location_full: A 1D QUA vector for the atom location in the current row (int).
+    :param target_location_full: A 1D QUA vector for the target location in the current row (int).
+    :param target_frequencies_full: A 1D QUA vector for the target frequencies in the current row (int).
+    :param buffer_offset: A QUA variable for the index of the first site of the occupation buffer being sorted when
+        current_location_full contains several occupation matrices (int). None if it contains a single one.
+
+    :return: Three QUA 1D vectors for the atom locations, target locations and target frequencies of the current row.
+    """
+    # QUA variable containing the current row atom locations
+    current_location = declare(int, size=nb_of_columns)
+    # QUA variable containing the current row target locations
+    target_location = declare(int, size=nb_of_columns)
+    # QUA variable containing the current row target frequencies
+    target_frequencies = declare(int, size=nb_of_columns)
+    # QUA variable for incrementing the number of target frequencies
+    freq_count = declare(int)
+    assign(freq_count, 0)
+    # Qua variable for looping over the columns
+    col = declare(int)
+    # Loop over the columns for filling the atom and target frequencies for current row
+    with for_(col, 0, col < nb_of_columns, col + 1):
+        # Initialize the current atom location vector for this row
+        if buffer_offset is None:
+            assign(current_location[col], current_location_full[this_row * nb_of_columns + col])
+        else:
+            assign(current_location[col], current_location_full[buffer_offset + this_row * nb_of_columns + col])
+        # Initialize the target atom location vector for this row
+        assign(target_location[col], target_location_full[this_row * nb_of_columns + col])
+        # Initialize the target frequency vector for this row
+        with if_(target_frequencies_full[this_row * nb_of_columns + col] > 10):
+            assign(
+                target_frequencies[freq_count],
+                target_frequencies_full[this_row * nb_of_columns + col],
+            )
+            assign(freq_count, freq_count + 1)
+    return current_location, target_location, target_frequencies
+
+
+def find_number_of_tweezers(atoms_in_current_row, atoms_in_target_row, max_nb_of_tweezers):
+
+    """
+    This macro finds the number of tweezer required for this arrangment sequence based of the number of atoms in the
+    target row, the number of atoms in the current row and the number of available tweezers.
+
+    :param atoms_in_current_row: A 1D QUA vector for the atom location in the current row.
+    :param atoms_in_target_row: A 1D QUA vector for the atom location in the target row.
+    :param max_nb_of_tweezers: A QUA variable for the waximum number of available tweezers (due to the limited number of available pulse processors).
+
+    :return: A QUA variable (int) for the number of tweezers required for achieving the sorting.
+    """
+
+    nb_of_tweezers = declare(int)  # Number of available tweezers
+    # generating an integer vector of size=3 and storing three values in it
+    atoms_or_targets = declare(int, size=3)
+    assign(atoms_or_targets[0], Math.sum(atoms_in_current_row))  # how many atoms in the current row?
+    assign(atoms_or_targets[1], Math.sum(atoms_in_target_row))  # how many atoms are in the target state?
+    assign(atoms_or_targets[2], max_nb_of_tweezers)  # what's the max number of tweezers we are allowed to use?
+    assign(nb_of_tweezers, Math.min(atoms_or_targets))
+    # The number of required tweezers for this row arrangement is the minimum of the number of atoms in the initial
+    # configuration, the number of final atoms needed in the ordered row and the number of tweezers available
+    return nb_of_tweezers
+
+
+def count_atoms_to_the_right(nb_of_columns, atoms_in_current_row):
+    """
+    This macro builds the suffix-count vector of the current row, i.e. the number of atoms located at or to the right
+    of each site. It is derived in a single pass over the row so that the collision free assignment can read it instead
+    of summing the rest of the row for every trial atom.
+
+    :param nb_of_columns: A python variable for the number of column in the array (int).
+    :param atoms_in_current_row: A 1D QUA vector for the atom location in the current row.
+
+    :return: A 1D QUA vector of size nb_of_columns + 1 whose element i is the number of atoms in the sites i to
+        nb_of_columns - 1 (the last element is always 0).
+    """
+    atoms_to_the_right = declare(int, size=nb_of_columns + 1)
+    col = declare(int)
+    assign(atoms_to_the_right[nb_of_columns], 0)
+    # Scan the row from right to left and accumulate the number of atoms
+    with for_(col, nb_of_columns - 1, col >= 0, col - 1):
+        assign(atoms_to_the_right[col], atoms_to_the_right[col + 1] + atoms_in_current_row[col])
+    return atoms_to_the_right
+
+
+def assign_tweezers_to_atoms(
+    nb_of_tweezers,
+    nb_of_tweezers_python,
+    atoms_in_current_row,
+    current_frequencies,
+    target_frequencies,
+    tweezer_phases,
+    debug_stream,
+    moves=None,
+    atoms_in_target_row=None,
+    nb_of_columns=None,
+):
+    """
+    This function finds the atoms in the row and assign one tweezer to each with the corresponding initial frequency
+    Will only avoid collisions on left compact targets. Improvement necessary for arbitrary collision free rearrangement
+
+    :param nb_of_tweezers: A QUA variable for the number of required tweezers (int).
+    :param nb_of_tweezers_python: A python variable for the maximum number of available tweezers.
+    :param atoms_in_current_row: A 1D QUA vector for the atom location in the current row.
+    :param current_frequencies: A 1D QUA vector for the frequencies of the atoms in the current row.
+    :param target_frequencies: A 1D QUA vector for the frequencies of the atoms in the target row.
+    :param tweezer_phases: A 1D QUA vector for the phases of the tweezers for the current row.
+    :param debug_stream: A QUA stream used to save the tweezer assignments for debug.
+    :param moves: (optional) A 1D QUA vector of size nb_of_tweezers_python receiving the index of the move of each
+        tweezer in the chirp rate lookup table (target column - source column + nb_of_columns - 1).
+    :param atoms_in_target_row: A 1D QUA vector for the atom location in the target row, only needed with moves.
+    :param nb_of_columns: A python variable for the number of column in the array (int), only needed with moves.
+
+    :return: Four QUA 1D vectors for the amplitude, frequencie, phase and detuning of each tweezer to sort the current row.
+    """
+
+    # QUA variables declaration
+    amplitudes = declare(fixed, size=nb_of_tweezers_python)
+    frequencies = declare(int, size=nb_of_tweezers_python)
+    # Initial phases of the tweezers, read from index 1 by set_tweezers_frequencies_and_phases
+    phases = declare(fixed, value=[phases_list[k % len(phases_list)] for k in range(nb_of_tweezers_python + 1)])
+    detunings = declare(int, size=nb_of_tweezers_python)
+    i = declare(int)
+    j = declare(int)
+    column = declare(int)
+    if moves is not None:
+        # Target atoms index
+        target_index = declare(int)
+        assign(target_index, 0)
+
+    # Initialize the amplitude vector
+    with for_(column, 0, column < nb_of_tweezers_python, column + 1):
+        assign(amplitudes[column], 0.0)
+        if moves is not None:
+            # Unused tweezers do not move
+            assign(moves[column], nb_of_columns - 1)
+    # debugging save to indicate a change of row
+    save(-1, debug_stream)
+    # scan the atom locations and update the list of tweezers frequencies
+    assign(j, 0)  # assigning 0 to the j index
+    assign(i, 0)  # assigning 0 to the i index
+    # pick up only the amount of atoms you need to fill the target, if there aren't_int enough atoms or tweezers
+    # available then pick as many as you can
+    with while_(j < nb_of_tweezers):
+        with if_(atoms_in_current_row[i] == 1):  # if an atom is present in site i
+            assign(amplitudes[j], 1.0)  # set the amplitude of the tweezer to active (=1)
+            assign(frequencies[j], current_frequencies[i])  # update the tweezer freq with that of atom index
+            assign(phases[j], tweezer_phases[i])  # update the tweezer phase j with that of the atom index i
+            # Set the detuning vector
+            assign(detunings[j], target_frequencies[j] - frequencies[j])
+            if moves is not None:
+                # Find the target atom location and set the index of the move in the lookup table
+                with while_(atoms_in_target_row[target_index] == 0):
+                    assign(target_index, target_index + 1)
+                assign(moves[j], target_index - i + nb_of_columns - 1)
+                assign(target_index, target_index + 1)
+            # Save atom to be moved and target to check the tweezer locations
+            save(i, debug_stream)
+            save(j, debug_stream)
+            assign(j, j + 1)
+        assign(i, i + 1)
+
+    return amplitudes, frequencies, phases, detunings
+
+
+def assign_tweezers_to_atoms_collision_free(
+    nb_of_tweezers,
+    nb_of_tweezers_python,
+    nb_of_columns,
+    atoms_in_current_row,
+    atoms_in_target_row,
+    current_frequencies,
+    target_frequencies,
+    tweezer_phases,
+    debug_stream,
+    atoms_to_the_right=None,
+    moves=None,
+):
+    """
+    This function finds the atoms in the row and assign one tweezer to each with the corresponding initial frequency
+    Will avoid any collisions from happening when sorting row by row.
+
+    :param nb_of_tweezers: A QUA variable for the number of required tweezers (int).
+    :param nb_of_tweezers_python: A python variable for the maximum number of available tweezers.
+    :param nb_of_columns: A python variable for the number of column in the array (int).
+    :param atoms_in_current_row: A 1D QUA vector for the atom location in the current row.
+    :param atoms_in_target_row: A 1D QUA vector for the atom location in the target row.
+    :param current_frequencies: A 1D QUA vector for the frequencies of the atoms in the current row.
+    :param target_frequencies: A 1D QUA vector for the frequencies of the atoms in the target row.
+    :param tweezer_phases: A 1D QUA vector for the phases of the tweezers for the current row.
+    :param debug_stream: A QUA stream used to save the tweezer assignments for debug.
+    :param atoms_to_the_right: (optional) A 1D QUA vector with the number of atoms located at or to the right of each
+        site, as returned by count_atoms_to_the_right(). If None, the number of atoms to the right is summed again for
+        each trial atom.
+    :param moves: (optional) A 1D QUA vector of size nb_of_tweezers_python receiving the index of the move of each
+        tweezer in the chirp rate lookup table (target column - source column + nb_of_columns - 1).
+
+    :return: Four QUA 1D vectors for the amplitude, frequencie, phase and detuning of each tweezer to sort the current row.
+    """
+    # QUA variables declaration
+    amplitudes = declare(fixed, size=nb_of_tweezers_python)
+    frequencies = declare(int, size=nb_of_tweezers_python)
+    # Initial phases of the tweezers, read from index 1 by set_tweezers_frequencies_and_phases
+    phases = declare(fixed, value=[phases_list[k % len(phases_list)] for k in range(nb_of_tweezers_python + 1)])
+    detunings = declare(int, size=nb_of_tweezers_python)
+    column = declare(int)
+
+    # Initialize the amplitude vector
+    with for_(column, 0, column < nb_of_tweezers_python, column + 1):
+        assign(amplitudes[column], 0.0)
+        if moves is not None:
+            # Unused tweezers do not move
+            assign(moves[column], nb_of_columns - 1)
+    # Ending index of the current atom to find when scanning to the left
+    previous_atom = declare(int)
+    assign(previous_atom, -1)
+    # Number of assigned atoms
+    atoms_assigned = declare(int)
+    assign(atoms_assigned, 0)
+    # Flag to exit loops once the tweezer is assigned --> replaces break statement
+    current_is_assigned = declare(bool)
+    # Remaining atoms to assign (number_of_tweezers - atoms_assigned)
+    nb_of_atoms_to_assign = declare(int)
+    # Target atoms index
+    target_index = declare(int)
+    assign(target_index, 0)
+    # Current atoms index
+    trial_atom = declare(int)
+    # Total number of atoms located to the right of the current index
+    nb_of_atoms_to_the_right = declare(int)
+    # Corresponding index for calculating the previous number
+    if atoms_to_the_right is None:
+        sum_index = declare(int)
+    # Vector used to find the starting index when scanning to the right (max)
+    max_comp = declare(int, size=2)
+    # starting index when scanning to the right
+    max_result = declare(int)
+    # debugging save to indicate a change of row
+    save(-1, debug_stream)
+    # This logic searches for atoms in the target vector and if there are enough atoms on the right to complete
+    # the sorting, then assign one tweezer to the closest atom on the left.
+    # else, assign one tweezer to the closest atom on the right
+    with while_(atoms_assigned < nb_of_tweezers):
+        # Current tweezer is not assigned yet
+        assign(current_is_assigned, False)
+        # Increment until one target atom is found --> index = target atom location
+        with while_(atoms_in_target_row[target_index] == 0):
+            assign(target_index, target_index + 1)
+        # number of remaining atoms to assign
+        assign(nb_of_atoms_to_assign, nb_of_tweezers - atoms_assigned)
+        # Look in current site and to the left for a suitable atom
+        with for_(trial_atom, target_index, (trial_atom > previous_atom) & ~current_is_assigned, trial_atom - 1):
+            # Number of current atoms located to the right of the current target atom
+            if atoms_to_the_right is None:
+                assign(nb_of_atoms_to_the_right, 0)
+                with for_(sum_index, trial_atom, sum_index < nb_of_columns, sum_index + 1):
+                    assign(nb_of_atoms_to_the_right, nb_of_atoms_to_the_right + atoms_in_current_row[sum_index])
+            else:
+                assign(nb_of_atoms_to_the_right, atoms_to_the_right[trial_atom])
+            # If there are more atoms to the right than needed AND  1 atom is here AND this atom is not already assigned
+            # Then assign a tweezer to this atom
+            with if_((nb_of_atoms_to_the_right >= nb_of_atoms_to_assign) & (atoms_in_current_row[trial_atom] == 1)):
+                # Keep the atom location for subsequent tweezer assignment
+                assign(previous_atom, trial_atom)
+                # Update the flag to exit the if statement and simulate a break
+                assign(current_is_assigned, True)
+        # If no suitable atom was found, look to the right instead
+        with if_(~current_is_assigned):
+            # Find the center before looking to the right of it
+            assign(max_comp[0], previous_atom + 1)
+            assign(max_comp[1], target_index + 1)
+            assign(max_result, Math.max(max_comp))
+            # Look to the right for a suitable atom
+            with for_(trial_atom, max_result, (trial_atom < nb_of_columns) & ~current_is_assigned, trial_atom + 1):
+                # If there is an atom here AND it is not assigned yet, then assign a tweezer to this atom
+                with if_((atoms_in_current_row[trial_atom] == 1)):
+                    # Keep the atom location for subsequent tweezer assignment
+                    assign(previous_atom, trial_atom)
+                    # Update the flag to exit the if statement and simulate a break
+                    assign(current_is_assigned, True)
+        # Once a suitable atom was found, assign a tweezer to it
+        with if_(current_is_assigned):
+            # Save atom to be moved and target to check the tweezer locations
+            save(previous_atom, debug_stream)
+            save(target_index, debug_stream)
+            if moves is not None:
+                # Set the index of the move in the lookup table
+                assign(moves[atoms_assigned], target_index - previous_atom + nb_of_columns - 1)
+            # Got to the next target atom
+            assign(target_index, target_index + 1)
+            # set the amplitude of the tweezer to active (=1)
+            assign(amplitudes[atoms_assigned], 1.0)
+            # update the tweezer freq with that of atom index
+            assign(frequencies[atoms_assigned], current_frequencies[previous_atom])
+            # update the tweezer phase j with that of the atom index i
+            assign(phases[atoms_assigned], tweezer_phases[previous_atom])
+            # Set the detuning vector
+            assign(
+                detunings[atoms_assigned],
+                target_frequencies[atoms_assigned] - frequencies[atoms_assigned],
+            )
+            # Increment the number of assigned atoms
+            assign(atoms_assigned, atoms_assigned + 1)
+
+    return amplitudes, frequencies, phases, detunings
+
+
+def calculate_pulse_length(detunings, pulse_duration, max_rate=None):
+    """
+    This macro derives the maximum and minimum detunings to be applied and derives the minimum chirp pulse duration.
+
+    :param detunings: A 1D QUA vector for each tweezer detuning in Hz (int).
+    :param pulse_duration: A python variable for the default constant chirp pulse duration in ns (int).
+    :param max_rate: A python variable for the maximum allowed chirp rate in Hz/ns. Default is None which corresponds to using the provided default pulse duration
+
+    :return: A QUA variable for the chirp pulse duration in ns (int)
+    """
+    # QUA variables declaration
+    chirp_pulse_duration = declare(int)  # Duration of the frequency chirp
+    # Find the maximum detuning used to set the minimum acceptable pulse duration
+    if max_rate is not None:
+        min_detuning = declare(int)
+        max_detuning = declare(int)
+        assign(min_detuning, Math.min(detunings))
+        assign(max_detuning, Math.max(detunings))  # find the maximum detuning
+        assign(max_detuning, Util.cond(max_detuning > -min_detuning, max_detuning, -min_detuning))
+        assign(chirp_pulse_duration, max_detuning / max_rate)
+        # Minimum pulse duration is 16 ns
+        with if_(max_detuning < 16):
+            assign(chirp_pulse_duration, 16)
+        with else_():
+            assign(chirp_pulse_duration, max_detuning / max_rate)
+    else:
+        # pulse duration is assigned to be constant
+        assign(chirp_pulse_duration, pulse_duration)
+
+    return chirp_pulse_duration
+
+
+def lookup_pulse_length(moves, nb_of_columns, pulse_durations_table):
+    """
+    This macro derives the largest column difference of the moves of the row, which sets its maximum detuning, and
+    reads the corresponding chirp pulse duration from a table precomputed for every possible largest column difference,
+    see pulse_durations_table() in config_array_sorting.py.
+
+    :param moves: A 1D QUA vector with the index of the move of each tweezer in the chirp rate lookup table, i.e. its
+        column difference + nb_of_columns - 1 (int).
+    :param nb_of_columns: A python variable for the number of column in the array (int).
+    :param pulse_durations_table: A 1D QUA vector containing the chirp pulse duration of each largest column difference
+        in ns (int).
+
+    :return: A QUA variable for the chirp pulse duration in ns (int) and a QUA variable for the index of this duration
+        in the table, i.e. the largest column difference (int).
+    """
+    # QUA variables declaration
+    chirp_pulse_duration = declare(int)  # Duration of the frequency chirp
+    duration_index = declare(int)  # Index of the duration in the table
+    min_difference = declare(int)
+    # Find the largest absolute column difference
+    assign(min_difference, Math.min(moves) - (nb_of_columns - 1))
+    assign(duration_index, Math.max(moves) - (nb_of_columns - 1))
+    assign(duration_index, Util.cond(duration_index > -min_difference, duration_index, -min_difference))
+    assign(chirp_pulse_duration, pulse_durations_table[duration_index])
+
+    return chirp_pulse_duration, duration_index
+
+
+def calculate_chirp_rates(nb_of_tweezers_python, detunings, pulse_duration):
+    """
+    This macro derives the constant linear chirp rates needed to arrange the atoms in the current row.
+
+    :param nb_of_tweezers_python: A python variable for the number of available tweezers.
+    :param detunings: A 1D QUA vector for each tweezer detuning in Hz (int).
+    :param pulse_duration: A QUA variable for the chirp pulse duration in ns (int)
+
+    :return: A QUA 1D vector for each tweezer constant chirp rate in mHz/ns
+    """
+    # QUA variables declaration
+    chirp_rates = declare(int, size=nb_of_tweezers_python)
+    j = declare(int)
+    # Calculate the chirp rates for all tweezers.
+    # Each tweezer has its own chirp rate depending on the initial and final position of the arranged atom.
+    with for_(j, 0, j < nb_of_tweezers_python, j + 1):
+        assign(chirp_rates[j], Cast.to_int(detunings[j] / (pulse_duration / 1000)))  # x1000 to go to 'mHz/ns'
+
+    return chirp_rates
+
+
+def calculate_piecewise_chirp_rates(nb_of_tweezers_python, detunings, pulse_duration, nb_of_segments):
+    """
+    This macro derives the piecewise decomposition of the total chirp waveform based on the minimum jerk trajectory.
+
+    :param nb_of_tweezers_python: A python variable for the number of available tweezers.
+    :param detunings: A 1D QUA vector for each tweezer detuning in Hz (int).
+    :param pulse_duration: A QUA variable for the chirp pulse duration in ns (int)
+    :param nb_of_segments: A python variable for the number of segments contained in the picewise chirp (int). No gaps if < 50.
+
+    :return: A Python 2D array whose rows are 1D QUA vectors for each tweezer piecewise chirp rate in mHz/ns
+    """
+    # QUA variables declaration
+    n_segment = declare(int, value=nb_of_segments)
+    # 1D chirp vector for each tweezer in a given row. 1st index must be python and 2nd QUA (fake 2D array)
+    chirp_rates = [declare(int, size=nb_of_segments) for _ in range(nb_of_tweezers_python)]
+    # Minimum jerk trajectory profile, which is the same for all the tweezers
+    linear_pieces = declare(fixed, size=nb_of_segments)
+    tau = declare(fixed)  # Normalized time
+    tau_squared = declare(fixed)  # Normalized time squared
+    segment_step = declare(int)  # Step variable for incrementing the segments
+    one_over_chirp_n_segments = declare(fixed)  # one over the nuber of linear segments
+    assign(one_over_chirp_n_segments, Math.div(1, n_segment))
+    with for_(segment_step, 0, segment_step < n_segment, segment_step + 1):
+        assign(tau, Cast.mul_fixed_by_int(one_over_chirp_n_segments, segment_step + 1))
+        assign(tau_squared, tau * tau)
+        assign(
+            linear_pieces[segment_step],
+            (
+                Cast.mul_fixed_by_int(tau_squared, 30)
+                - Cast.mul_fixed_by_int(tau_squared * tau, 60)
+                + Cast.mul_fixed_by_int(tau_squared * tau_squared, 30)
+            ),
+        )
+    # Calculate the chirp rates for all Tweezers.
+    # Each tweezer has its own chirp rate depending on the initial and final position of the arranged atom.
+    for tweezer_index in range(nb_of_tweezers_python):
+        with for_(segment_step, 0, segment_step < n_segment, segment_step + 1):
+            assign(
+                chirp_rates[tweezer_index][segment_step],
+                Cast.to_int(
+                    Cast.mul_int_by_fixed(detunings[tweezer_index], linear_pieces[segment_step])
+                    / (pulse_duration / 1000)
+                ),
+            )  # /1000 to go to 'mHz/ns'
+
+    return chirp_rates
+
+
+def lookup_chirp_rates(nb_of_tweezers_python, moves, chirp_rates_table, duration_index=None, nb_of_moves=None):
+    """
+    This macro reads the constant linear chirp rates needed to arrange the atoms in the current row from a table
+    precomputed for every signed column difference of a move, see chirp_rates_table() in config_array_sorting.py.
+
+    :param nb_of_tweezers_python: A python variable for the number of available tweezers.
+    :param moves: A 1D QUA vector with the index of the move of each tweezer in the lookup table (int).
+    :param chirp_rates_table: A 1D QUA vector containing the chirp rate of each move in mHz/ns (int).
+    :param duration_index: (optional) A QUA variable for the index of the chirp pulse duration, as returned by
+        lookup_pulse_length(), when the table contains one block of moves per pulse duration (int).
+    :param nb_of_moves: A python variable for the number of moves in each block of the table (int), only needed with
+        duration_index.
+
+    :return: A QUA 1D vector for each tweezer constant chirp rate in mHz/ns
+    """
+    # QUA variables declaration
+    chirp_rates = declare(int, size=nb_of_tweezers_python)
+    j = declare(int)
+    if duration_index is None:
+        with for_(j, 0, j < nb_of_tweezers_python, j + 1):
+            assign(chirp_rates[j], chirp_rates_table[moves[j]])
+    else:
+        first_move = declare(int)
+        assign(first_move, duration_index * nb_of_moves)
+        with for_(j, 0, j < nb_of_tweezers_python, j + 1):
+            assign(chirp_rates[j], chirp_rates_table[first_move + moves[j]])
+
+    return chirp_rates
+
+
+def lookup_piecewise_chirp_rates(
+    nb_of_tweezers_python, moves, chirp_rates_table, nb_of_segments, duration_index=None, nb_of_moves=None
+):
+    """
+    This macro reads the piecewise decomposition of the minimum jerk chirp waveform of each tweezer from a table
+    precomputed for every signed column difference of a move, see chirp_rates_table() in config_array_sorting.py.
+
+    :param nb_of_tweezers_python: A python variable for the number of available tweezers.
+    :param moves: A 1D QUA vector with the index of the move of each tweezer in the lookup table (int).
+    :param chirp_rates_table: A 1D QUA vector containing the nb_of_segments chirp rates of each move in mHz/ns (int).
+    :param nb_of_segments: A python variable for the number of segments contained in the picewise chirp (int).
+    :param duration_index: (optional) A QUA variable for the index of the chirp pulse duration, as returned by
+        lookup_pulse_length(), when the table contains one block of moves per pulse duration (int).
+    :param nb_of_moves: A python variable for the number of moves in each block of the table (int), only needed with
+        duration_index.
+
+    :return: A Python 2D array whose rows are 1D QUA vectors for each tweezer piecewise chirp rate in mHz/ns
+    """
+    # QUA variables declaration
+    chirp_rates = [declare(int, size=nb_of_segments) for _ in range(nb_of_tweezers_python)]
+    first_segment = declare(int)
+    step = declare(int)
+    if duration_index is None:
+        first_move = 0
+    else:
+        first_move = declare(int)
+        assign(first_move, duration_index * nb_of_moves)
+    # Build a 1D chirp vector for each tweezer in a given row. 1st index must be python and 2nd QUA (fake 2D array)
+    for tweezer_index in range(nb_of_tweezers_python):
+        assign(first_segment, (first_move + moves[tweezer_index]) * nb_of_segments)
+        with for_(step, 0, step < nb_of_segments, step + 1):
+            assign(chirp_rates[tweezer_index][step], chirp_rates_table[first_segment + step])
+
+    return chirp_rates
+
+
+def set_tweezers_frequencies_and_phases(nb_of_tweezers_python, current_frequencies, row_frequency, tweezer_phases):
+    """
+    This macro sets the previously calculated frequencies and phases to the corresponding tweezers.
+
+    :param nb_of_tweezers_python: A python variable for the maximum number of available tweezers.
+    :param current_frequencies: A 1D QUA vector for the frequencies of the atoms in the current row.
+    :param row_frequency: A QUA variable for the frequency of the current row in Hz (int)
+    :param tweezer_phases: A 1D QUA vector for the phases of the tweezers for the current row.
+
+    :return: None
+    """
+    # set the phases and frequencies of the tweezers
+    update_frequency("row_selector", row_frequency)
+    for index in range(nb_of_tweezers_python):
+        reset_frame(f"column_{index + 1}")
+        frame_rotation(tweezer_phases[index + 1], "column_{}".format(index + 1))
+        update_frequency("column_{}".format(index + 1), current_frequencies[index])
+
+
+def timestamp_stage(stage):
+    """
+    This macro plays a short marker pulse on the timestamp element and streams the time at which it is played. Since
+    the pulse is played once the preceding real-time computations are completed, it timestamps the end of these
+    computations.
+
+    :param stage: The name of the stream in which the timestamps are saved (str).
+
+    :return: None
+    """
+    play("marker", "timestamp", timestamp_stream=stage)
+
+
+def play_chirp_pulses(
+    nb_of_tweezers_python,
+    amplitudes,
+    chirp_rates,
+    pulse_duration=None,
+    ramp_timestamp_stream=None,
+    ramp_down_timestamp_stream=None,
+):
+    """
+    This macro ramps up the power of the row selector and occupied tweezers, chirps the tweezers and ramps their power
+    down.
+
+    :param nb_of_tweezers_python: A python variable for the maximum number of available tweezers.
+    :param amplitudes: A 1D QUA vector for the amplitude of each tweezer, 0 if unused (fixed).
+    :param chirp_rates: Either a 1D QUA vector for the constant chirp rate of each tweezer in mHz/ns, or a Python list
+        of 1D QUA vectors for the piecewise chirp rates of each tweezer (int).
+    :param pulse_duration: A QUA variable for the chirp pulse duration in clock cycles (int). None uses the default
+        pulse length from the configuration.
+    :param ramp_timestamp_stream: The name of the stream in which the start time of the ramp is saved (str), None to
+        disable it.
+    :param ramp_down_timestamp_stream: The name of the stream in which the start time of the ramp down is saved (str),
+        None to disable it.
+
+    :return: None
+    """
+    # ramp up power of occupied tweezers and row selector
+    play("blackman_up", "row_selector", timestamp_stream=ramp_timestamp_stream)
+    for index in range(nb_of_tweezers_python):
+        play("blackman_up" * amp(amplitudes[index]), f"column_{index + 1}")
+    # chirp tweezers
+    play("constant", "row_selector")
+    for index in range(nb_of_tweezers_python):
+        play(
+            "constant" * amp(amplitudes[index]),
+            f"column_{index + 1}",
+            duration=pulse_duration,
+            chirp=(chirp_rates[index], "mHz/nsec"),
+        )
+    # ramp down power of occupied tweezers
+    play("blackman_down", "row_selector", timestamp_stream=ramp_down_timestamp_stream)
+    for index in range(nb_of_tweezers_python):
+        play("blackman_down" * amp(amplitudes[index]), f"column_{index + 1}")
+
+
+def get_current_group(
+    this_group,
+    nb_of_row_tones_python,
+    nb_of_tweezers_python,
+    row_frequencies_full,
+    row_amplitudes_full,
+    frequencies_full,
+    amplitudes_full,
+    chirp_rates_full,
+):
+    """
+    This macro gets the row tones and the shared tweezers of a group of rows sorted simultaneously from the full 1d
+    vectors derived by the host-side scheduler.
+
+    :param this_group: A QUA variable for the current group (int).
+    :param nb_of_row_tones_python: A python variable for the number of row tones (int).
+    :param nb_of_tweezers_python: A python variable for the maximum number of available tweezers (int).
+    :param row_frequencies_full: A 1D QUA vector for the frequency of each row tone of each group in Hz (int).
+    :param row_amplitudes_full: A 1D QUA vector for the amplitude of each row tone of each group, 0 if unused (fixed).
+    :param frequencies_full: A 1D QUA vector for the initial frequency of each tweezer of each group in Hz (int).
+    :param amplitudes_full: A 1D QUA vector for the amplitude of each tweezer of each group, 0 if unused (fixed).
+    :param chirp_rates_full: A 1D QUA vector for the chirp rate of each tweezer of each group in mHz/ns (int).
+
+    :return: Five QUA 1D vectors for the row tone frequencies and amplitudes, and the tweezer frequencies, amplitudes and
+        chirp rates of the current group.
+    """
+    # QUA variables containing the row tones of the current group
+    row_frequencies = declare(int, size=nb_of_row_tones_python)
+    row_amplitudes = declare(fixed, size=nb_of_row_tones_python)
+    # QUA variables containing the tweezers of the current group
+    frequencies = declare(int, size=nb_of_tweezers_python)
+    amplitudes = declare(fixed, size=nb_of_tweezers_python)
+    chirp_rates = declare(int, size=nb_of_tweezers_python)
+    # Qua variable for looping over the row tones and tweezers
+    j = declare(int)
+    with for_(j, 0, j < nb_of_row_tones_python, j + 1):
+        assign(row_frequencies[j], row_frequencies_full[this_group * nb_of_row_tones_python + j])
+        assign(row_amplitudes[j], row_amplitudes_full[this_group * nb_of_row_tones_python + j])
+    with for_(j, 0, j < nb_of_tweezers_python, j + 1):
+        assign(frequencies[j], frequencies_full[this_group * nb_of_tweezers_python + j])
+        assign(amplitudes[j], amplitudes_full[this_group * nb_of_tweezers_python + j])
+        assign(chirp_rates[j], chirp_rates_full[this_group * nb_of_tweezers_python + j])
+    return row_frequencies, row_amplitudes, frequencies, amplitudes, chirp_rates
+
+
+def get_current_pass(this_pass, nb_of_tones_python, frequencies_full, amplitudes_full, chirp_rates_full):
+    """
+    This macro gets the moving tones of a sorting pass from the full 1d vectors derived by the host-side 2D planner.
+
+    :param this_pass: A QUA variable for the current pass (int).
+    :param nb_of_tones_python: A python variable for the number of moving tones (int).
+    :param frequencies_full: A 1D QUA vector for the initial frequency of each moving tone of each pass in Hz (int).
+    :param amplitudes_full: A 1D QUA vector for the amplitude of each moving tone of each pass, 0 if unused (fixed).
+    :param chirp_rates_full: A 1D QUA vector for the chirp rate of each moving tone of each pass in mHz/ns (int).
+
+    :return: Three QUA 1D vectors for the frequencies, amplitudes and chirp rates of the moving tones of the current pass.
+    """
+    # QUA variables containing the moving tones of the current pass
+    frequencies = declare(int, size=nb_of_tones_python)
+    amplitudes = declare(fixed, size=nb_of_tones_python)
+    chirp_rates = declare(int, size=nb_of_tones_python)
+    # Qua variable for looping over the moving tones
+    j = declare(int)
+    with for_(j, 0, j < nb_of_tones_python, j + 1):
+        assign(frequencies[j], frequencies_full[this_pass * nb_of_tones_python + j])
+        assign(amplitudes[j], amplitudes_full[this_pass * nb_of_tones_python + j])
+        assign(chirp_rates[j], chirp_rates_full[this_pass * nb_of_tones_python + j])
+    return frequencies, amplitudes, chirp_rates
+
+
+def play_sorting_pass(
+    static_element, static_frequency, moving_elements, frequencies, amplitudes, chirp_rates, tweezer_phases
+):
+    """
+    This macro plays a sorting pass: the static tone selects the row (or column) along which the atoms are moved by the
+    frequency chirps of the moving tones. All the tones are ramped up, chirped and ramped down together.
+
+    :param static_element: The element playing the tone selecting the row or column of the pass (str).
+    :param static_frequency: A QUA variable for the frequency of the static tone in Hz (int).
+    :param moving_elements: The elements playing the moving tones (list of str).
+    :param frequencies: A 1D QUA vector for the initial frequency of each moving tone in Hz (int).
+    :param amplitudes: A 1D QUA vector for the amplitude of each moving tone, 0 if unused (fixed).
+    :param chirp_rates: A 1D QUA vector for the chirp rate of each moving tone in mHz/ns (int).
+    :param tweezer_phases: A 1D QUA vector for the phases of the moving tones (fixed).
+
+    :return: None
+    """
+    # set the phases and frequencies of the tones
+    update_frequency(static_element, static_frequency)
+    for index, element in enumerate(moving_elements):
+        reset_frame(element)
+        frame_rotation(tweezer_phases[index], element)
+        update_frequency(element, frequencies[index])
+    align(static_element, *moving_elements)
+    # ramp up power of the tones
+    play("blackman_up", static_element)
+    for index, element in enumerate(moving_elements):
+        play("blackman_up" * amp(amplitudes[index]), element)
+    # chirp the moving tones
+    play("constant", static_element)
+    for index, element in enumerate(moving_elements):
+        play("constant" * amp(amplitudes[index]), element, chirp=(chirp_rates[index], "mHz/nsec"))
+    # ramp down power of the tones
+    play("blackman_down", static_element)
+    for index, element in enumerate(moving_elements):
+        play("blackman_down" * amp(amplitudes[index]), element)
+
+
+###############
+# Simulations #
+###############
+
+
+def get_marker_gaps(job, element, nb_of_gaps):
+    """
+    Returns the dead time between consecutive pairs of marker pulses played by an element, i.e. between the end of the
+    pulse 2 * i and the beginning of the pulse 2 * i + 1. The calculation is based on the simulation and is used to
+    measure the duration of the real-time computations bracketed by the markers.
+
+    :param job: a simulation ``QmJob`` object. ex: job = qmm.simulate()
+    :param element: the element playing the markers (str).
+    :param nb_of_gaps: the number of marker pairs (int).
+    :return: The gap of each pair of markers in clock cycles (numpy array).
+    """
+    pulses = job.simulated_analog_waveforms()["elements"][element]
+    if len(pulses) < 2 * nb_of_gaps:
+        raise RuntimeError("The simulation is too short to play all the markers, increase the simulation duration.")
+    gaps = [
+        pulses[2 * i + 1]["timestamp"] - pulses[2 * i]["timestamp"] - pulses[2 * i]["duration"]
+        for i in range(nb_of_gaps)
+    ]
+    return np.array(gaps) / 4
+
+
+def get_stage_latencies(result_handles, stages, ramp_down=None):
+    """
+    Returns the latency between consecutive stages of each row from the timestamps streamed by timestamp_stage().
+
+    :param result_handles: the ``result_handles`` of the job. ex: res = job.result_handles
+    :param stages: the names of the timestamp streams in chronological order (list of str).
+    :param ramp_down: (optional) the name of the stream timestamping the ramp down of each row and its length in ns, as
+        a tuple (str, int). The last stage, e.g. the start of the ramp, then waits for the pulses of the previous row,
+        and its latency is measured from the later of the previous stage of the same row and the end of the ramp down
+        of the previous row.
+    :return: A dictionary containing, for each pair of consecutive stages "stage_1 -> stage_2", the latency of each row
+        in ns (numpy array).
+    """
+    timestamps = [np.asarray(result_handles.get(stage).fetch_all()["value"], dtype=float) for stage in stages]
+    nb_of_rows = min(len(t) for t in timestamps)
+    timestamps = [t[:nb_of_rows] for t in timestamps]
+    starts = timestamps[:-1]
+    if ramp_down is not None:
+        stream, length = ramp_down
+        ramp_down_start = np.asarray(result_handles.get(stream).fetch_all()["value"], dtype=float)[:nb_of_rows]
+        previous_row_end = ramp_down_start + length
+        starts[-1] = np.maximum(starts[-1], np.concatenate([[-np.inf], previous_row_end[:-1]]))
+    return {f"{stages[i]} -> {stages[i + 1]}": timestamps[i + 1] - starts[i] for i in range(len(stages) - 1)}
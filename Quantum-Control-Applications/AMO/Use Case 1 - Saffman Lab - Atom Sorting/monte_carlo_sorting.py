@@ -0,0 +1,68 @@
+"""
+Monte Carlo simulation of the row by row sorting sequence using the host-side reference planner.
+For each loading probability, a batch of random occupation matrices is sorted with both assignment algorithms and the
+fill fraction of the target, the probability to reach the full target and the fraction of rows with collisions are
+derived.
+"""
+from config_array_sorting import *
+from reference_planner import *
+import matplotlib.pyplot as plt
+import time
+
+##############
+# Parameters #
+##############
+n_shots = int(1e5)  # Number of random occupation matrices per loading probability
+loading_probabilities = np.linspace(0.3, 0.9, 13)
+# Target occupation matrix in 2D
+goal = [
+    ["1", "X", "X", "X", "X", "X", "1"],
+    ["X", "1", "X", "X", "X", "1", "X"],
+    ["X", "X", "1", "1", "1", "X", "X"],
+    ["X", "X", "1", "1", "1", "X", "X"],
+    ["X", "X", "1", "1", "1", "X", "X"],
+    ["X", "1", "X", "X", "X", "1", "X"],
+    ["1", "X", "X", "X", "X", "X", "1"],
+]
+atom_target_list = [[1 if goal[j][i] == "1" else 0 for i in range(number_of_columns)] for j in range(number_of_rows)]
+
+##############
+# Simulation #
+##############
+rng = np.random.default_rng()
+results = {}
+for collision_free in [False, True]:
+    fill, success, collisions = [], [], []
+    start = time.time()
+    for p in loading_probabilities:
+        occupation = rng.random((n_shots, number_of_rows, number_of_columns)) < p
+        sources, destinations = plan_assignments(occupation, atom_target_list, max_number_of_tweezers, collision_free)
+        final_fill = fill_fraction(apply_moves(occupation, sources, destinations), atom_target_list)
+        fill.append(np.mean(final_fill))
+        success.append(np.mean(final_fill == 1))
+        collisions.append(np.mean(detect_collisions(occupation, sources, destinations)))
+    print(
+        f"collision_free={collision_free}: {len(loading_probabilities) * n_shots} occupation matrices sorted in "
+        f"{time.time() - start:.1f} s"
+    )
+    results[collision_free] = (fill, success, collisions)
+
+##########
+# Figure #
+##########
+plt.figure(figsize=(12, 4))
+for collision_free, label in zip([False, True], ["push to the left", "collision free"]):
+    fill, success, collisions = results[collision_free]
+    plt.subplot(131)
+    plt.plot(loading_probabilities, fill, "o-", label=label)
+    plt.subplot(132)
+    plt.plot(loading_probabilities, success, "o-", label=label)
+    plt.subplot(133)
+    plt.plot(loading_probabilities, collisions, "o-", label=label)
+for i, ylabel in enumerate(["Target fill fraction", "Full target probability", "Rows with collisions"]):
+    plt.subplot(131 + i)
+    plt.xlabel("Loading probability")
+    plt.ylabel(ylabel)
+    plt.legend()
+plt.tight_layout()
+plt.show()
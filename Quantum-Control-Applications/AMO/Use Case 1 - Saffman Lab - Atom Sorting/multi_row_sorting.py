@@ -0,0 +1,221 @@
+"""
+Sorting of several rows simultaneously using several row tones.
+The tweezer assignment of each row is derived on the host with the reference planner, and the rows whose moves can be
+shared by the same column tones are grouped by schedule_row_groups(). Each group is then moved in a single chirp window,
+with one row tone per row of the group.
+The gain of skipping the rows with nothing to move is measured against the row by row sorting sequence of
+array_sorting.py, which plays one chirp window per row, and the gain of grouping the rows against the single row tone
+schedule, for the current occupation matrix and for a batch of random occupation matrices.
+"""
+from qm.qua import *
+from qm.QuantumMachinesManager import QuantumMachinesManager
+from qm import SimulationConfig
+from qm import LoopbackInterface
+from config_array_sorting import *
+from macros import *
+from reference_planner import *
+import matplotlib.pyplot as plt
+
+##############
+# Parameters #
+##############
+collision_free = True  # Enables the collision free sorting algorithm
+filling_probability = 0.6  # Probability to find an atom in a given site
+n_shots = 1000  # Number of random occupation matrices for the sorting time comparison
+# Initial occupation matrix in 2D
+atom_location_list = [
+    list(map(int, np.random.choice([0, 1], size=number_of_columns, p=[1 - filling_probability, filling_probability])))
+    for i in range(number_of_rows)
+]
+# Target occupation matrix in 2D
+goal = [
+    ["1", "X", "X", "X", "X", "X", "1"],
+    ["X", "1", "X", "X", "X", "1", "X"],
+    ["X", "X", "1", "1", "1", "X", "X"],
+    ["X", "X", "1", "1", "1", "X", "X"],
+    ["X", "X", "1", "1", "1", "X", "X"],
+    ["X", "1", "X", "X", "X", "1", "X"],
+    ["1", "X", "X", "X", "X", "X", "1"],
+]
+atom_target_list = [[1 if goal[j][i] == "1" else 0 for i in range(number_of_columns)] for j in range(number_of_rows)]
+print("Atom target matrix:")
+print_2d(atom_target_list)
+print("Initial occupation matrix:")
+print_2d(atom_location_list)
+
+##########################
+# Host-side row schedule #
+##########################
+sources, destinations = plan_assignments(atom_location_list, atom_target_list, max_number_of_tweezers, collision_free)
+groups = schedule_row_groups(atom_location_list, sources, destinations, max_number_of_row_tones, max_number_of_tweezers)
+for rows, group_sources, group_destinations in groups:
+    used = group_sources >= 0
+    print(f"rows {rows}: moves {list(zip(group_sources[used].tolist(), group_destinations[used].tolist()))}")
+
+# Row tones and shared tweezers of each group in 1D
+table = chirp_rates_table(column_if, constant_pulse_length)
+group_row_frequencies, group_row_amplitudes = [], []
+group_frequencies, group_amplitudes, group_chirp_rates = [], [], []
+for rows, group_sources, group_destinations in groups:
+    for k in range(max_number_of_row_tones):
+        group_row_frequencies.append(int(row_frequencies_list[rows[k]]) if k < len(rows) else int(row_selector_if))
+        group_row_amplitudes.append(1.0 if k < len(rows) else 0.0)
+    for source, destination in zip(group_sources.tolist(), group_destinations.tolist()):
+        group_frequencies.append(int(column_if[source]) if source >= 0 else int(column_if_first_site))
+        group_amplitudes.append(1.0 if source >= 0 else 0.0)
+        group_chirp_rates.append(table[destination - source + number_of_columns - 1] if source >= 0 else 0)
+if len(groups) == 0:
+    # Already sorted occupation matrix: the QUA vectors cannot be empty
+    group_row_frequencies, group_row_amplitudes = [0] * max_number_of_row_tones, [0.0] * max_number_of_row_tones
+    group_frequencies, group_amplitudes = [0] * max_number_of_tweezers, [0.0] * max_number_of_tweezers
+    group_chirp_rates = [0] * max_number_of_tweezers
+
+# Row tone elements, the first one being the row_selector
+row_selectors = ["row_selector"] + [f"row_selector_{i}" for i in range(2, max_number_of_row_tones + 1)]
+# Get all relevant elements in a list for easy align
+elements = row_selectors + [f"column_{i + 1}" for i in range(max_number_of_tweezers)]
+
+###############
+# QUA program #
+###############
+with program() as multi_row_sorting:
+    data_stream = declare_stream()  # stream used to extract the sorted groups for debug
+    # QUA variable representing the current group
+    current_group = declare(int)
+    # QUA variables containing the row tones and shared tweezers of all the groups
+    group_row_frequencies_qua = declare(int, value=group_row_frequencies)
+    group_row_amplitudes_qua = declare(fixed, value=group_row_amplitudes)
+    group_frequencies_qua = declare(int, value=group_frequencies)
+    group_amplitudes_qua = declare(fixed, value=group_amplitudes)
+    group_chirp_rates_qua = declare(int, value=group_chirp_rates)
+    # QUA variable containing the tweezer phases
+    tweezer_phases_qua = declare(fixed, value=phases_list)
+
+    # Loop over the groups of rows
+    with for_(current_group, 0, current_group < len(groups), current_group + 1):
+        # Get the row tones and shared tweezers of the current group
+        row_frequency_qua, row_amplitude_qua, frequency_qua, amplitude_qua, chirp_rates_qua = get_current_group(
+            current_group,
+            max_number_of_row_tones,
+            max_number_of_tweezers,
+            group_row_frequencies_qua,
+            group_row_amplitudes_qua,
+            group_frequencies_qua,
+            group_amplitudes_qua,
+            group_chirp_rates_qua,
+        )
+        # Assign the frequencies and phases to the tweezers and row tones
+        set_tweezers_frequencies_and_phases(
+            max_number_of_tweezers, frequency_qua, row_frequency_qua[0], tweezer_phases_qua
+        )
+        for k in range(1, max_number_of_row_tones):
+            update_frequency(row_selectors[k], row_frequency_qua[k])
+        save(current_group, data_stream)
+        # align all tweezers/columns and row tones
+        align(*elements)
+        # ramp up power of occupied tweezers and row tones
+        for k in range(max_number_of_row_tones):
+            play("blackman_up" * amp(row_amplitude_qua[k]), row_selectors[k])
+        for element_index in range(max_number_of_tweezers):
+            play("blackman_up" * amp(amplitude_qua[element_index]), f"column_{element_index + 1}")
+        # chirp tweezers
+        for k in range(max_number_of_row_tones):
+            play("constant" * amp(row_amplitude_qua[k]), row_selectors[k])
+        for element_index in range(max_number_of_tweezers):
+            play(
+                "constant" * amp(amplitude_qua[element_index]),
+                f"column_{element_index + 1}",
+                chirp=(chirp_rates_qua[element_index], "mHz/nsec"),
+            )
+        # ramp down power of occupied tweezers and row tones
+        for k in range(max_number_of_row_tones):
+            play("blackman_down" * amp(row_amplitude_qua[k]), row_selectors[k])
+        for element_index in range(max_number_of_tweezers):
+            play("blackman_down" * amp(amplitude_qua[element_index]), f"column_{element_index + 1}")
+
+    with stream_processing():
+        data_stream.save_all("data")
+
+#########################
+# Sorting time analysis #
+#########################
+# Duration of one chirp window in ns
+window_duration = 2 * blackman_pulse_length + constant_pulse_length
+# The row by row sequence plays one window per row, and the single row tone schedule skips the rows with nothing to move
+row_by_row_time = number_of_rows * window_duration
+single_row_time = (
+    len(schedule_row_groups(atom_location_list, sources, destinations, 1, max_number_of_tweezers)) * window_duration
+)
+print(
+    f"\nCurrent occupation matrix: {len(groups) * window_duration / 1e6:.1f} ms with {len(groups)} groups vs "
+    f"{single_row_time / 1e6:.1f} ms with a single row tone (skipping the rows with nothing to move) and "
+    f"{row_by_row_time / 1e6:.1f} ms row by row"
+)
+# Same comparison for random occupation matrices and an increasing number of row tones
+rng = np.random.default_rng()
+occupations = rng.random((n_shots, number_of_rows, number_of_columns)) < filling_probability
+batch_sources, batch_destinations = plan_assignments(
+    occupations, atom_target_list, max_number_of_tweezers, collision_free
+)
+nb_of_row_tones_list = list(range(1, max_number_of_row_tones + 1))
+sorting_times = []
+for nb_of_row_tones in nb_of_row_tones_list:
+    nb_of_groups = [
+        len(
+            schedule_row_groups(
+                occupations[i], batch_sources[i], batch_destinations[i], nb_of_row_tones, max_number_of_tweezers
+            )
+        )
+        for i in range(n_shots)
+    ]
+    sorting_times.append(np.array(nb_of_groups) * window_duration / 1e6)
+# The gain of skipping the rows is measured against the row by row sequence, and the gain of grouping the rows against
+# the single row tone schedule of the same occupation matrices
+print(
+    f"Skipping the rows with nothing to move: {np.mean(sorting_times[0]):.2f} +/- {np.std(sorting_times[0]):.2f} ms "
+    f"vs {row_by_row_time / 1e6:.1f} ms row by row ({n_shots} random occupation matrices)"
+)
+for nb_of_row_tones, times in zip(nb_of_row_tones_list[1:], sorting_times[1:]):
+    print(
+        f"Grouping with {nb_of_row_tones} row tones: {np.mean(times):.2f} +/- {np.std(times):.2f} ms, "
+        f"{np.mean(sorting_times[0] - times):.2f} +/- {np.std(sorting_times[0] - times):.2f} ms saved vs a single row tone"
+    )
+
+plt.figure()
+plt.errorbar(
+    nb_of_row_tones_list,
+    [np.mean(t) for t in sorting_times],
+    yerr=[np.std(t) for t in sorting_times],
+    fmt="o-",
+    label="grouped rows",
+)
+plt.axhline(np.mean(sorting_times[0]), color="k", linestyle=":", label="single row tone")
+plt.axhline(row_by_row_time / 1e6, color="k", linestyle="--", label="row by row")
+plt.xlabel("Number of row tones")
+plt.ylabel("Total sorting time [ms]")
+plt.title(f"Filling probability {filling_probability}")
+plt.legend()
+
+#####################################
+#  Open Communication with the QOP  #
+#####################################
+Simulation = False
+
+qmm = QuantumMachinesManager(host=qop_ip, port=qop_port)
+
+if not Simulation:
+    # Open a quantum machine
+    qm = qmm.open_qm(config)
+    job = qm.execute(multi_row_sorting)
+    res = job.result_handles
+    res.wait_for_all_values()
+    print(f"Sorted groups: {res.get('data').fetch_all()['value'].tolist()}")
+
+else:
+    simulation_duration = 300  # simulate for 2e4 clock cycles or 120µs
+    job = qmm.simulate(
+        config,
+        multi_row_sorting,
+        SimulationConfig(simulation_duration),
+        simulation_interface=LoopbackInterface([("con1", 1, "con1", 1), ("con1", 2, "con1", 2)]),
+    )
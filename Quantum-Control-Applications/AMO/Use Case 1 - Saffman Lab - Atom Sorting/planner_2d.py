@@ -0,0 +1,151 @@
+"""
+Host-side planner rearranging the atoms over the whole array with row and column moves, so that a row short of atoms
+can be filled with the spare atoms of the neighbouring rows.
+The atoms are assigned to the target sites by solving the linear assignment problem (Hungarian algorithm) over the whole
+array, which sets the column to which each row must bring its atoms. The atoms are then moved along the rows to these
+columns, and along the columns to the target rows.
+Every move along a line keeps the order of the atoms of this line, so that no atom is swept over another one. The moves
+are grouped in passes, each pass moving several atoms along a single row (or column) with parallel frequency chirps,
+and the full rearrangement is played as the row passes followed by the column passes.
+"""
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+
+def plan_2d_moves(occupation, target, max_nb_of_row_moves, max_nb_of_column_moves, max_iterations=3):
+    """
+    Derives the passes rearranging the atoms of an occupation matrix into the target matrix.
+    The atoms are assigned to the target sites by minimizing the sum of the squared travelled distances. Since the
+    atoms are first moved along their row to the target column, two atoms of the same row cannot be assigned to the same
+    column: such assignments are penalized and the assignment is solved again, up to max_iterations times, after which
+    the remaining ones are discarded. The spare atoms are then brought to the columns missing atoms, where they fill
+    the target sites left empty.
+
+    :param occupation: The occupation matrix as an array of 0 and 1 of shape (n_rows, n_columns).
+    :param target: The target matrix as an array of 0 and 1 of shape (n_rows, n_columns).
+    :param max_nb_of_row_moves: The maximum number of atoms moved simultaneously along a row, i.e. the number of column
+        tweezers (int).
+    :param max_nb_of_column_moves: The maximum number of atoms moved simultaneously along a column, i.e. the number of
+        row tones (int).
+    :param max_iterations: The maximum number of times the assignment is solved (int).
+
+    :return: The list of passes, each pass being a tuple (axis, line, sources, destinations) where axis is 0 for a row
+        pass (line is the row and the atoms are moved between columns) and 1 for a column pass (line is the column and
+        the atoms are moved between rows), and sources and destinations are the initial and final positions along this
+        line of each tweezer, padded with -1 to the maximum number of simultaneous moves.
+    """
+    occupation = np.array(occupation, dtype=bool)
+    target = np.asarray(target, dtype=bool)
+    atoms = np.argwhere(occupation)
+    sites = np.argwhere(target)
+    if len(atoms) == 0 or len(sites) == 0:
+        return []
+    # Assignment of the atoms to the target sites
+    cost = np.sum((sites[:, None, :] - atoms[None, :, :]) ** 2, axis=-1).astype(float)
+    penalty = float(np.sum(np.square(occupation.shape)))
+    for _ in range(max_iterations):
+        site_index, atom_index = linear_sum_assignment(cost)
+        duplicates = _duplicate_columns(atoms[atom_index, 0], sites[site_index, 1], cost[site_index, atom_index])
+        if not np.any(duplicates):
+            break
+        cost[site_index[duplicates], atom_index[duplicates]] += penalty
+    starts = atoms[atom_index[~duplicates]]
+    ends = sites[site_index[~duplicates]]
+
+    passes = []
+    # Number of atoms missing in each column after discarding the duplicate assignments
+    missing_atoms = np.sum(target, axis=0) - np.bincount(ends[:, 1], minlength=occupation.shape[1])
+    # Row passes bringing the assigned atoms to their target column, and the spare atoms to the incomplete columns
+    for row in range(occupation.shape[0]):
+        columns = np.flatnonzero(occupation[row])
+        assigned_columns = ends[starts[:, 0] == row, 1]
+        new_columns = _line_positions(columns, assigned_columns, occupation.shape[1], preferred=missing_atoms > 0)
+        missing_atoms[np.setdiff1d(new_columns, assigned_columns)] -= 1
+        passes += _line_passes(0, row, columns, new_columns, max_nb_of_row_moves)
+        occupation[row] = False
+        occupation[row, new_columns] = True
+    # Column passes bringing the atoms to the target rows
+    for column in range(occupation.shape[1]):
+        rows = np.flatnonzero(occupation[:, column])
+        assigned_rows = ends[ends[:, 1] == column, 0]
+        # The spare atoms of the column fill the target sites left empty by the assignment
+        empty_target_rows = np.setdiff1d(np.flatnonzero(target[:, column]), assigned_rows)
+        empty_target_rows = empty_target_rows[np.argsort(_distance_to(empty_target_rows, rows), kind="stable")]
+        required_rows = np.concatenate([assigned_rows, empty_target_rows[: len(rows) - len(assigned_rows)]])
+        new_rows = _line_positions(rows, required_rows, occupation.shape[0])
+        passes += _line_passes(1, column, rows, new_rows, max_nb_of_column_moves)
+        occupation[:, column] = False
+        occupation[new_rows, column] = True
+    return passes
+
+
+def apply_passes(occupation, passes):
+    """
+    Derives the occupation matrix after playing the passes returned by plan_2d_moves.
+
+    :param occupation: The occupation matrix as an array of 0 and 1 of shape (n_rows, n_columns).
+    :param passes: The list of passes as returned by plan_2d_moves.
+
+    :return: A boolean array with the same shape as occupation.
+    """
+    occupation = np.array(occupation, dtype=bool)
+    for axis, line, sources, destinations in passes:
+        used = sources >= 0
+        if axis == 0:
+            occupation[line, sources[used]] = False
+            occupation[line, destinations[used]] = True
+        else:
+            occupation[sources[used], line] = False
+            occupation[destinations[used], line] = True
+    return occupation
+
+
+def _duplicate_columns(atom_rows, site_columns, pair_cost):
+    # Assignments bringing a second atom of the same row to the same column, the cheapest one being kept
+    order = np.lexsort((pair_cost, site_columns, atom_rows))
+    duplicates = np.zeros(len(order), dtype=bool)
+    same_as_previous = (np.diff(atom_rows[order]) == 0) & (np.diff(site_columns[order]) == 0)
+    duplicates[order[1:]] = same_as_previous
+    return duplicates
+
+
+def _distance_to(positions, occupied):
+    # Distance from each position to the closest occupied position of the line
+    if len(occupied) == 0:
+        return np.zeros(len(positions))
+    return np.min(np.abs(positions[:, None] - occupied[None, :]), axis=1)
+
+
+def _line_positions(positions, required_positions, length, preferred=None):
+    # New positions of the atoms of a line, including the required ones and completed by the free positions closest to
+    # the atoms of the line, starting with the preferred ones
+    free_positions = np.setdiff1d(np.arange(length), required_positions)
+    distance = _distance_to(free_positions, positions)
+    if preferred is None:
+        free_positions = free_positions[np.argsort(distance, kind="stable")]
+    else:
+        free_positions = free_positions[np.lexsort((distance, ~preferred[free_positions]))]
+    return np.sort(np.concatenate([required_positions, free_positions[: len(positions) - len(required_positions)]]))
+
+
+def _line_passes(axis, line, positions, new_positions, max_nb_of_moves):
+    # Order preserving moves split in passes of at most max_nb_of_moves tweezers. The atoms moving to the right (or
+    # down) are moved first starting from the last one, then the atoms moving to the left (or up) starting from the
+    # first one, so that no atom is swept over another one.
+    forward = np.flatnonzero(new_positions > positions)[::-1]
+    backward = np.flatnonzero(new_positions < positions)
+    passes = []
+    for moves in [forward, backward]:
+        for first in range(0, len(moves), max_nb_of_moves):
+            chunk = np.sort(moves[first : first + max_nb_of_moves])
+            padding = np.full(max_nb_of_moves - len(chunk), -1)
+            passes.append(
+                (
+                    axis,
+                    line,
+                    np.concatenate([positions[chunk], padding]),
+                    np.concatenate([new_positions[chunk], padding]),
+                )
+            )
+    return passes
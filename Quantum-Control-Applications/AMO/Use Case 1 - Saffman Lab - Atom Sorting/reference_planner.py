@@ -0,0 +1,268 @@
+"""
+Host-side reference implementation of the row by row sorting algorithms implemented in QUA in macros.py.
+All the functions below are vectorized over a batch of occupation matrices, so that they can be used as a golden model
+for the debug data saved by the QUA program, or to run fast Monte Carlo simulations of the sorting sequence.
+"""
+
+import numpy as np
+
+
+def plan_assignments(occupation, target, max_nb_of_tweezers, collision_free=True):
+    """
+    Derives the tweezer assignment of each row for a batch of occupation matrices, following the same logic as
+    assign_tweezers_to_atoms (collision_free=False) or assign_tweezers_to_atoms_collision_free (collision_free=True).
+
+    :param occupation: The occupation matrices as an array of 0 and 1 of shape (..., n_rows, n_columns).
+    :param target: The target matrix as an array of 0 and 1 of shape (n_rows, n_columns).
+    :param max_nb_of_tweezers: The maximum number of available tweezers (int).
+    :param collision_free: Whether to follow the collision free algorithm or the one pushing the atoms to the left.
+
+    :return: Two integer arrays of shape (..., n_rows, max_nb_of_tweezers) containing the source and destination
+        columns of each tweezer. Unused tweezers are set to -1.
+    """
+    occupation = np.asarray(occupation, dtype=bool)
+    target = np.broadcast_to(np.asarray(target, dtype=bool), occupation.shape)
+    batch_shape = occupation.shape[:-1]
+    n_columns = occupation.shape[-1]
+    occupation = occupation.reshape(-1, n_columns)
+    target = target.reshape(-1, n_columns)
+    n_tweezers = max_nb_of_tweezers
+
+    # Number of tweezers required for each row (see find_number_of_tweezers)
+    nb_of_tweezers = np.minimum(np.minimum(occupation.sum(axis=1), target.sum(axis=1)), n_tweezers)
+    # Column of the k-th target site of each row, padded with -1
+    target_columns = _ordered_columns(target, n_tweezers)
+    tweezer_index = np.arange(n_tweezers)
+    active = tweezer_index[None, :] < nb_of_tweezers[:, None]
+    destinations = np.where(active, target_columns, -1)
+
+    if not collision_free:
+        # The k-th atom of the row is moved to the k-th target site
+        sources = np.where(active, _ordered_columns(occupation, n_tweezers), -1)
+    else:
+        sources = np.full(destinations.shape, -1)
+        columns = np.arange(n_columns)[None, :]
+        # Number of atoms located at or to the right of each site (see count_atoms_to_the_right)
+        atoms_to_the_right = np.cumsum(occupation[:, ::-1], axis=1)[:, ::-1]
+        previous_atom = np.full(occupation.shape[0], -1)
+        for k in range(n_tweezers):
+            target_index = target_columns[:, k]
+            nb_of_atoms_to_assign = nb_of_tweezers - k
+            # Last site with enough atoms on its right to complete the sorting
+            last_site = np.sum(atoms_to_the_right >= nb_of_atoms_to_assign[:, None], axis=1) - 1
+            # Closest atom on the left of the target site (included) leaving enough atoms on the right
+            upper_bound = np.minimum(target_index, last_site)
+            left_candidates = occupation & (columns > previous_atom[:, None]) & (columns <= upper_bound[:, None])
+            left_atom = np.max(np.where(left_candidates, columns, -1), axis=1)
+            # Otherwise, closest atom on the right of the target site
+            lower_bound = np.maximum(previous_atom, target_index) + 1
+            right_candidates = occupation & (columns >= lower_bound[:, None])
+            right_atom = np.min(np.where(right_candidates, columns, n_columns), axis=1)
+            chosen_atom = np.where(left_atom >= 0, left_atom, right_atom)
+            # In QUA, no suitable atom means that the program would be stuck in the assignment loop
+            assigned = active[:, k] & (chosen_atom < n_columns)
+            sources[:, k] = np.where(assigned, chosen_atom, -1)
+            previous_atom = np.where(assigned, chosen_atom, previous_atom)
+
+    out_shape = batch_shape + (n_tweezers,)
+    return sources.reshape(out_shape), destinations.reshape(out_shape)
+
+
+def derive_detunings(sources, destinations, column_frequencies):
+    """
+    Derives the detuning applied to each tweezer, as done in QUA by the tweezer assignment macros.
+
+    :param sources: The source column of each tweezer as returned by plan_assignments, -1 for unused tweezers.
+    :param destinations: The destination column of each tweezer as returned by plan_assignments.
+    :param column_frequencies: The frequency of each column in Hz (list).
+
+    :return: An integer array with the same shape as sources containing the detunings in Hz (0 for unused tweezers).
+    """
+    column_frequencies = np.asarray(column_frequencies, dtype=int)
+    used = sources >= 0
+    detunings = column_frequencies[np.where(used, destinations, 0)] - column_frequencies[np.where(used, sources, 0)]
+    return np.where(used, detunings, 0)
+
+
+def detect_collisions(occupation, sources, destinations):
+    """
+    Flags the rows in which the planned moves lead to a collision, i.e. a moved atom is swept over an atom that stays
+    in place, or two moved atoms cross each other or end up on the same site.
+
+    :param occupation: The occupation matrices as an array of 0 and 1 of shape (..., n_rows, n_columns).
+    :param sources: The source column of each tweezer as returned by plan_assignments.
+    :param destinations: The destination column of each tweezer as returned by plan_assignments.
+
+    :return: A boolean array of shape (..., n_rows).
+    """
+    static_atoms = _remove_moved_atoms(occupation, sources)
+    used = sources >= 0
+    columns = np.arange(static_atoms.shape[-1])
+    low = np.minimum(sources, destinations)[..., None]
+    high = np.maximum(sources, destinations)[..., None]
+    swept = (columns >= low) & (columns <= high) & used[..., None]
+    sweeps_static_atom = np.any(swept & static_atoms[..., None, :], axis=(-1, -2))
+    # Moved atoms must keep their order and end up on different sites
+    pairs = used[..., :, None] & used[..., None, :]
+    crossing = (sources[..., :, None] < sources[..., None, :]) & (
+        destinations[..., :, None] >= destinations[..., None, :]
+    )
+    return sweeps_static_atom | np.any(crossing & pairs, axis=(-1, -2))
+
+
+def apply_moves(occupation, sources, destinations):
+    """
+    Derives the occupation matrices after moving the atoms according to the planned tweezer assignment.
+
+    :param occupation: The occupation matrices as an array of 0 and 1 of shape (..., n_rows, n_columns).
+    :param sources: The source column of each tweezer as returned by plan_assignments.
+    :param destinations: The destination column of each tweezer as returned by plan_assignments.
+
+    :return: A boolean array with the same shape as occupation.
+    """
+    final_occupation = _remove_moved_atoms(occupation, sources)
+    n_columns = final_occupation.shape[-1]
+    used = sources >= 0
+    # One extra column is used as a sink for the unused tweezers
+    arrived = np.zeros(final_occupation.shape[:-1] + (n_columns + 1,), dtype=bool)
+    np.put_along_axis(arrived, np.where(used, destinations, n_columns), True, axis=-1)
+    return final_occupation | arrived[..., :n_columns]
+
+
+def fill_fraction(occupation, target):
+    """
+    Derives the fraction of the target sites occupied by an atom.
+
+    :param occupation: The occupation matrices as an array of 0 and 1 of shape (..., n_rows, n_columns).
+    :param target: The target matrix as an array of 0 and 1 of shape (n_rows, n_columns).
+
+    :return: An array of shape (...) with the fill fraction of each occupation matrix.
+    """
+    target = np.asarray(target, dtype=bool)
+    return np.sum(np.asarray(occupation, dtype=bool) & target, axis=(-1, -2)) / np.sum(target)
+
+
+def parse_debug_data(data, nb_of_rows, target, max_nb_of_tweezers, collision_free=True):
+    """
+    Converts the debug data saved by the QUA program in data_stream for one sorting sequence into the same format as
+    plan_assignments. Each row starts with a -1 followed by the (atom, target) pairs saved by the assignment macros.
+    When the occupation matrix is acquired with the analog readout, it is saved before the first row.
+
+    :param data: The values saved in data_stream (list or numpy array).
+    :param nb_of_rows: The number of rows in the array (int).
+    :param target: The target matrix as an array of 0 and 1 of shape (n_rows, n_columns).
+    :param max_nb_of_tweezers: The maximum number of available tweezers (int).
+    :param collision_free: Which assignment macro generated the data. assign_tweezers_to_atoms saves the tweezer index
+        instead of the target column.
+
+    :return: The received occupation matrix of shape (n_rows, n_columns) or None if it wasn't saved, and the source and
+        destination columns of each tweezer with shape (n_rows, max_nb_of_tweezers).
+    """
+    data = np.asarray(data, dtype=int)
+    target = np.asarray(target, dtype=bool)
+    row_starts = np.flatnonzero(data == -1)[: nb_of_rows + 1]
+    if len(row_starts) < nb_of_rows:
+        raise ValueError(f"Only {len(row_starts)} rows were found in the debug data.")
+    occupation = data[: row_starts[0]].reshape(nb_of_rows, -1) if row_starts[0] > 0 else None
+    target_columns = _ordered_columns(target, max_nb_of_tweezers)
+    row_ends = np.append(row_starts[1:], len(data))
+    sources = np.full((nb_of_rows, max_nb_of_tweezers), -1)
+    destinations = np.full((nb_of_rows, max_nb_of_tweezers), -1)
+    for row in range(nb_of_rows):
+        pairs = data[row_starts[row] + 1 : row_ends[row]].reshape(-1, 2)
+        sources[row, : len(pairs)] = pairs[:, 0]
+        if collision_free:
+            destinations[row, : len(pairs)] = pairs[:, 1]
+        else:
+            destinations[row, : len(pairs)] = target_columns[row, pairs[:, 1]]
+    return occupation, sources, destinations
+
+
+def schedule_row_groups(occupation, sources, destinations, max_nb_of_row_tones, max_nb_of_tweezers):
+    """
+    Groups the rows of one occupation matrix that can be sorted simultaneously with several row tones.
+    Since every row tone is crossed with every column tone, the rows of a group share the same tweezers: each row gets
+    the union of the moves of the group. The rows are grouped greedily, in order, when the shared moves have distinct
+    sources and destinations, fit in the available tweezers, the tweezers loaded in each row are exactly the ones of its
+    own plan and the empty tweezers neither sweep over an atom nor cross a loaded tweezer. The atoms already on their
+    target site are left in place, so that the rows without any atom to move are not scheduled.
+
+    :param occupation: The occupation matrix as an array of 0 and 1 of shape (n_rows, n_columns).
+    :param sources: The source column of each tweezer as returned by plan_assignments with shape (n_rows, n_tweezers).
+    :param destinations: The destination column of each tweezer as returned by plan_assignments.
+    :param max_nb_of_row_tones: The maximum number of rows sorted simultaneously (int).
+    :param max_nb_of_tweezers: The maximum number of available tweezers (int).
+
+    :return: A list of tuples (rows, sources, destinations) with the rows of each group and the source and destination
+        columns of the shared tweezers, padded with -1 to max_nb_of_tweezers.
+    """
+    occupation = np.asarray(occupation, dtype=bool)
+    groups = []
+    for row in range(occupation.shape[0]):
+        moves = _row_moves(sources[row], destinations[row])
+        if not moves:
+            continue
+        for rows, shared_moves in groups:
+            if len(rows) < max_nb_of_row_tones and _can_share_tweezers(
+                occupation, sources, destinations, rows + [row], shared_moves | moves, max_nb_of_tweezers
+            ):
+                rows.append(row)
+                shared_moves |= moves
+                break
+        else:
+            groups.append(([row], moves))
+    return [(rows, *_pad_moves(shared_moves, max_nb_of_tweezers)) for rows, shared_moves in groups]
+
+
+def _ordered_columns(sites, n_first):
+    # Columns of the first n_first occupied sites of each row in increasing order, padded with -1
+    n_columns = sites.shape[-1]
+    order = np.argsort(~sites, axis=-1, kind="stable")
+    ordered = np.where(np.take_along_axis(sites, order, axis=-1), order, -1)
+    if n_columns < n_first:
+        padding = np.full(sites.shape[:-1] + (n_first - n_columns,), -1)
+        ordered = np.concatenate([ordered, padding], axis=-1)
+    return ordered[..., :n_first]
+
+
+def _remove_moved_atoms(occupation, sources):
+    occupation = np.asarray(occupation, dtype=bool)
+    n_columns = occupation.shape[-1]
+    moved = np.zeros(occupation.shape[:-1] + (n_columns + 1,), dtype=bool)
+    np.put_along_axis(moved, np.where(sources >= 0, sources, n_columns), True, axis=-1)
+    return occupation & ~moved[..., :n_columns]
+
+
+def _row_moves(sources, destinations):
+    # Atoms already on their target site don't need a tweezer when the row is sorted with other rows
+    used = (sources >= 0) & (sources != destinations)
+    return set(zip(sources[used].tolist(), destinations[used].tolist()))
+
+
+def _pad_moves(moves, n_tweezers):
+    # Moves ordered by source column as (sources, destinations) arrays padded with -1
+    ordered = sorted(moves)
+    sources = np.full(n_tweezers, -1)
+    destinations = np.full(n_tweezers, -1)
+    sources[: len(ordered)] = [move[0] for move in ordered]
+    destinations[: len(ordered)] = [move[1] for move in ordered]
+    return sources, destinations
+
+
+def _can_share_tweezers(occupation, sources, destinations, rows, shared_moves, n_tweezers):
+    if len(shared_moves) > n_tweezers:
+        return False
+    if len({move[0] for move in shared_moves}) < len(shared_moves):
+        return False
+    if len({move[1] for move in shared_moves}) < len(shared_moves):
+        return False
+    shared_sources, shared_destinations = _pad_moves(shared_moves, n_tweezers)
+    for row in rows:
+        loaded_moves = {move for move in shared_moves if occupation[row, move[0]]}
+        if loaded_moves != _row_moves(sources[row], destinations[row]):
+            return False
+        if detect_collisions(occupation[row], shared_sources, shared_destinations) and not detect_collisions(
+            occupation[row], sources[row], destinations[row]
+        ):
+            return False
+    return True
@@ -0,0 +1,229 @@
+"""
+Headless verification of the chirp trajectories from the raw ADC traces acquired during the sorting of each row.
+The short-time Fourier transform of all the rows is computed at once with NumPy, frame chunk by frame chunk, and the
+strongest tones of each frame are tracked. Since the collision free sorting keeps the order of the atoms, the k-th tone
+of a row sorted by frequency is always the k-th tweezer, so that no frame to frame association is needed.
+The end frequency of each tweezer is then compared with the target frequencies of the row (target_frequencies_full_python
+in array_sorting.py) to derive a pass/fail flag per row, together with the arrival time of each tweezer on its target.
+To verify every sorting sequence of a continuous loop, track_chirp_ends only transforms a few frames of a decimated
+trace after the end of the chirp of each row, which is enough to check the end frequencies.
+"""
+
+import numpy as np
+import warnings
+
+
+def track_tones(
+    raw_traces,
+    nb_of_tones,
+    sampling_rate=1e9,
+    nfft=2**14,
+    hop=None,
+    frequency_band=None,
+    excluded_frequencies=None,
+    exclusion_width=0.0,
+    min_relative_power=0.01,
+    frames_per_chunk=64,
+):
+    """
+    Tracks the frequency of the strongest tones of each row over time with a short-time Fourier transform.
+
+    :param raw_traces: The raw ADC traces as an array of shape (n_rows, n_samples).
+    :param nb_of_tones: The number of tones to track in each row (int or array of shape (n_rows,)).
+    :param sampling_rate: The sampling rate of the traces in Hz (float).
+    :param nfft: The number of samples of each frame (int).
+    :param hop: The number of samples between two consecutive frames (int), defaults to nfft.
+    :param frequency_band: The (min, max) frequencies in Hz in which the tones are searched (tuple), defaults to the
+        full band.
+    :param excluded_frequencies: A frequency in Hz to ignore in each row, such as the row selector tone, as an array of
+        shape (n_rows,) (optional).
+    :param exclusion_width: The half width in Hz of the band ignored around the excluded frequencies (float).
+    :param min_relative_power: The minimum power of a tone relative to the strongest tone of the row (float).
+    :param frames_per_chunk: The number of frames transformed at once, which bounds the memory usage (int).
+
+    :return: The time in s of the center of each frame as an array of shape (n_frames,) and the frequency in Hz of each
+        tone as an array of shape (n_rows, n_frames, max(nb_of_tones)), sorted by increasing frequency and set to NaN
+        when fewer tones are detected.
+    """
+    raw_traces = np.atleast_2d(np.asarray(raw_traces, dtype=float))
+    n_rows, n_samples = raw_traces.shape
+    hop = nfft if hop is None else hop
+    nb_of_tones = np.broadcast_to(np.asarray(nb_of_tones, dtype=int), (n_rows,))
+    max_nb_of_tones = max(int(np.max(nb_of_tones)), 1)
+    frequencies = np.fft.rfftfreq(nfft, 1 / sampling_rate)
+    in_band, first_bin, last_bin = _search_bins(
+        frequencies, n_rows, frequency_band, excluded_frequencies, exclusion_width
+    )
+
+    window = np.hanning(nfft)
+    frames = np.lib.stride_tricks.sliding_window_view(raw_traces, nfft, axis=-1)[:, ::hop]
+    n_frames = frames.shape[1]
+    tracks = np.full((n_rows, n_frames, max_nb_of_tones), np.nan)
+    peak_powers = np.zeros((n_rows, n_frames, max_nb_of_tones))
+    for start in range(0, n_frames, frames_per_chunk):
+        chunk = slice(start, min(start + frames_per_chunk, n_frames))
+        bins, peak_powers[:, chunk] = _strongest_peaks(
+            frames[:, chunk], window, in_band, first_bin, last_bin, max_nb_of_tones
+        )
+        tracks[:, chunk] = bins * sampling_rate / nfft
+    times = (np.arange(n_frames) * hop + nfft / 2) / sampling_rate
+    return times, _select_tones(tracks, peak_powers, nb_of_tones, min_relative_power)
+
+
+def track_chirp_ends(
+    raw_traces,
+    chirp_ends,
+    nb_of_tones,
+    frequency_band,
+    sampling_rate=1e9,
+    decimation=8,
+    nfft=2**11,
+    nb_of_end_frames=8,
+    excluded_frequencies=None,
+    exclusion_width=0.0,
+    min_relative_power=0.01,
+):
+    """
+    Tracks the frequency of the strongest tones of each row in the nb_of_end_frames consecutive frames following the
+    end of its chirp, which is enough for verify_chirps to check the end frequency of each tweezer on every sorting
+    sequence of a continuous loop. Instead of the full spectrogram of track_tones, only these frames are transformed,
+    on the trace decimated by keeping one sample out of decimation. The tones are then aliased in the Nyquist zone of
+    sampling_rate / decimation that contains frequency_band, from which their frequencies are unfolded. A frame spans
+    nfft * decimation samples: its frequency resolution is the one of a full rate frame of the same duration, for an
+    FFT of nfft samples, while the noise of the other Nyquist zones is folded in the band.
+
+    :param raw_traces: The raw ADC traces as an array of shape (n_rows, n_samples).
+    :param chirp_ends: The sample at which the chirp of each row ends (int or array of shape (n_rows,)). The frames are
+        moved back when they exceed the trace.
+    :param nb_of_tones: The number of tones to track in each row (int or array of shape (n_rows,)).
+    :param frequency_band: The (min, max) frequencies in Hz in which the tones are searched (tuple), within a single
+        Nyquist zone of sampling_rate / decimation.
+    :param sampling_rate: The sampling rate of the traces in Hz (float).
+    :param decimation: The number of samples of the trace per sample of the frames (int).
+    :param nfft: The number of decimated samples of each frame (int).
+    :param nb_of_end_frames: The number of frames of each row (int).
+    :param excluded_frequencies: A frequency in Hz to ignore in each row, such as the row selector tone, as an array of
+        shape (n_rows,) (optional).
+    :param exclusion_width: The half width in Hz of the band ignored around the excluded frequencies (float).
+    :param min_relative_power: The minimum power of a tone relative to the strongest tone of the row (float).
+
+    :return: The time in s of the center of each frame relative to the first frame as an array of shape
+        (nb_of_end_frames,) and the frequency in Hz of each tone as an array of shape
+        (n_rows, nb_of_end_frames, max(nb_of_tones)), as returned by track_tones.
+    """
+    raw_traces = np.atleast_2d(raw_traces)
+    n_rows, n_samples = raw_traces.shape
+    nb_of_tones = np.broadcast_to(np.asarray(nb_of_tones, dtype=int), (n_rows,))
+    max_nb_of_tones = max(int(np.max(nb_of_tones)), 1)
+    span = nb_of_end_frames * nfft * decimation
+    if span > n_samples:
+        raise ValueError(f"The {nb_of_end_frames} frames span {span} samples, more than the {n_samples} of the trace.")
+    zone_width = sampling_rate / decimation / 2
+    zone = int(frequency_band[0] // zone_width)
+    if frequency_band[1] > (zone + 1) * zone_width:
+        raise ValueError("The frequency band spans several Nyquist zones of the decimated trace.")
+    # Frequency of the tones aliased in each bin, mirrored in the odd Nyquist zones
+    aliases = np.fft.rfftfreq(nfft, decimation / sampling_rate)
+    frequencies = zone * zone_width + aliases if zone % 2 == 0 else (zone + 1) * zone_width - aliases
+    in_band, first_bin, last_bin = _search_bins(
+        frequencies, n_rows, frequency_band, excluded_frequencies, exclusion_width
+    )
+
+    # Only the decimated samples of the frames are gathered from the traces
+    starts = np.clip(np.broadcast_to(np.asarray(chirp_ends, dtype=int), (n_rows,)), 0, n_samples - span)
+    samples = starts[:, None] + decimation * np.arange(nb_of_end_frames * nfft)
+    frames = raw_traces[np.arange(n_rows)[:, None], samples].reshape(n_rows, nb_of_end_frames, nfft)
+    bins, peak_powers = _strongest_peaks(frames, np.hanning(nfft), in_band, first_bin, last_bin, max_nb_of_tones)
+    tracks = frequencies[0] + (frequencies[1] - frequencies[0]) * bins
+    times = (np.arange(nb_of_end_frames) + 0.5) * nfft * decimation / sampling_rate
+    return times, _select_tones(tracks, peak_powers, nb_of_tones, min_relative_power)
+
+
+def _search_bins(frequencies, n_rows, frequency_band, excluded_frequencies, exclusion_width):
+    # Frequency bins in which the tones are searched, of shape (n_rows, 1, n_bins) between the first and last bins of
+    # the band, between which the local maxima are searched
+    in_band = np.ones((n_rows, len(frequencies)), dtype=bool)
+    if frequency_band is not None:
+        in_band &= (frequencies >= frequency_band[0]) & (frequencies <= frequency_band[1])
+    if excluded_frequencies is not None:
+        excluded_frequencies = np.asarray(excluded_frequencies, dtype=float)[:, None]
+        in_band &= np.abs(frequencies[None, :] - excluded_frequencies) > exclusion_width
+    bins = np.flatnonzero(np.any(in_band, axis=0))
+    first_bin, last_bin = max(bins[0], 1), min(bins[-1], len(frequencies) - 2)
+    return in_band[:, None, first_bin : last_bin + 1], first_bin, last_bin
+
+
+def _strongest_peaks(frames, window, in_band, first_bin, last_bin, nb_of_peaks):
+    # Fractional bin and power of the strongest local maxima of the power spectrum of each frame, refined by parabolic
+    # interpolation of the log power
+    power = np.abs(np.fft.rfft(frames * window, axis=-1)[..., first_bin - 1 : last_bin + 2]) ** 2
+    center = power[..., 1:-1]
+    is_peak = (center > power[..., :-2]) & (center >= power[..., 2:]) & in_band
+    peak_power = np.where(is_peak, center, 0.0)
+    strongest = np.argsort(peak_power, axis=-1)[..., ::-1][..., :nb_of_peaks]
+    log_power = np.log(power + np.finfo(float).tiny)
+    left, middle, right = (np.take_along_axis(log_power, strongest + k, axis=-1) for k in range(3))
+    curvature = left - 2 * middle + right
+    offset = np.where(curvature < 0, 0.5 * (left - right) / np.where(curvature < 0, curvature, 1), 0.0)
+    return first_bin + strongest + offset, np.take_along_axis(peak_power, strongest, axis=-1)
+
+
+def _select_tones(tracks, peak_powers, nb_of_tones, min_relative_power):
+    # Keep the nb_of_tones strongest tones of each row that are not much weaker than the strongest tone of the row
+    row_max = np.max(peak_powers, axis=(1, 2), keepdims=True)
+    detected = (peak_powers > min_relative_power * row_max) & (np.arange(tracks.shape[-1]) < nb_of_tones[:, None, None])
+    return np.sort(np.where(detected, tracks, np.nan), axis=-1)
+
+
+def verify_chirps(times, tracks, target_frequencies, nb_of_tweezers=None, tolerance=100e3, nb_of_end_frames=8):
+    """
+    Compares the end frequency of each tracked tone with the target frequencies of its row.
+    The k-th tone of a row (by increasing frequency) is compared with the k-th target frequency (by increasing
+    frequency) among the nb_of_tweezers target sites filled by the collision free sorting.
+
+    :param times: The time of each frame as returned by track_tones.
+    :param tracks: The frequency of each tone as returned by track_tones.
+    :param target_frequencies: The target frequency of each site in Hz, 0 for the sites that are not targeted, as an
+        array of shape (n_rows, n_columns).
+    :param nb_of_tweezers: The number of tweezers used in each row as an array of shape (n_rows,), defaults to the
+        number of target sites of each row.
+    :param tolerance: The maximum frequency error in Hz (float).
+    :param nb_of_end_frames: The number of last frames over which the end frequency is averaged (int).
+
+    :return: A boolean array of shape (n_rows,) flagging the rows in which every tweezer reached its target, the end
+        frequency of each tone and the time in s at which each tone reached its target frequency (arrays of shape
+        (n_rows, n_tones), NaN for the unused tones).
+    """
+    target_frequencies = np.asarray(target_frequencies, dtype=float)
+    n_rows, n_tones = tracks.shape[0], tracks.shape[-1]
+    if nb_of_tweezers is None:
+        nb_of_tweezers = np.sum(target_frequencies > 0, axis=1)
+    nb_of_tweezers = np.minimum(np.asarray(nb_of_tweezers, dtype=int), n_tones)
+    # The collision free sorting fills the first target sites of the row, i.e. the highest column frequencies for a
+    # negative column spacing: the filled target frequencies are the nb_of_tweezers first ones in column order
+    expected = np.full((n_rows, n_tones), np.nan)
+    for row in range(n_rows):
+        row_targets = target_frequencies[row][target_frequencies[row] > 0][: nb_of_tweezers[row]]
+        expected[row, : len(row_targets)] = np.sort(row_targets)
+    used = ~np.isnan(expected)
+    # Only the frames in which all the tweezers of the row are detected are used, so that the k-th tone is the k-th
+    # tweezer
+    complete = np.sum(~np.isnan(tracks), axis=-1) == nb_of_tweezers[:, None]
+    tracks = np.where(complete[..., None], tracks, np.nan)
+
+    with warnings.catch_warnings():
+        # Median over the last complete frames, rows without any complete frame give all-NaN slices
+        warnings.simplefilter("ignore", RuntimeWarning)
+        last_frames = np.sort(np.argsort(complete, axis=1, kind="stable")[:, -nb_of_end_frames:], axis=1)
+        end_frequencies = np.nanmedian(np.take_along_axis(tracks, last_frames[..., None], axis=1), axis=1)
+    errors = np.abs(tracks - expected[:, None, :])
+    # Arrival time: first frame after which the tone stays within tolerance of its target
+    away = (errors > tolerance) & ~np.isnan(tracks)
+    last_away = np.where(np.any(away, axis=1), len(times) - 1 - np.argmax(away[:, ::-1], axis=1), -1)
+    arrival_times = np.where(used, times[np.minimum(last_away + 1, len(times) - 1)], np.nan)
+    arrival_times = np.where(used & (last_away == len(times) - 1), np.inf, arrival_times)
+    end_frequencies = np.where(used, end_frequencies, np.nan)
+    with np.errstate(invalid="ignore"):
+        reached = np.abs(end_frequencies - expected) <= tolerance
+    passed = np.all(reached | ~used, axis=1)
+    return passed, end_frequencies, arrival_times
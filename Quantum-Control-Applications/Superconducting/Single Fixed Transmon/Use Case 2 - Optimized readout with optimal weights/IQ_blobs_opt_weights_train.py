@@ -19,10 +19,14 @@ qmm = QuantumMachinesManager(qop_ip)
 # The QUA program #
 ###################
 
-n_runs = 1000
+drift_update = False  # Folds a small batch of shots into the stored weights instead of training them from scratch
+
+n_runs = 100 if drift_update else 1000
 
 lsb = False
 
+streaming_training = False  # Trains chunk by chunk while the program is running, with a bounded memory
+
 rr_qe = "resonator"
 
 cooldown_time = 5 * qubit_T1 // 4
@@ -80,4 +84,9 @@ discriminator = TwoStateDiscriminator(
 )
 
 
-discriminator.train(program=training, plot=True, dry_run=True, correction_method="robust")
+if drift_update:
+    discriminator.update(program=training, alpha=0.2, threshold=0.1)
+elif streaming_training:
+    discriminator.train_streaming(program=training, chunk_size=200, plot=True, correction_method="robust")
+else:
+    discriminator.train(program=training, plot=True, dry_run=True, correction_method="robust")
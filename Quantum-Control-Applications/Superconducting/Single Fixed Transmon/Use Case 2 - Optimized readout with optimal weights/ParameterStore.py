@@ -0,0 +1,170 @@
+from collections.abc import Mapping
+from datetime import datetime
+import numpy as np
+import hashlib
+import pickle
+import json
+import os
+
+
+class ParameterStore:
+    """
+    Versioned store of the calibration parameters of a discriminator, kept in a folder. Each save adds a version to the
+    history, made of named parameters: the numerical ones are saved as .npy files, which are memory-mapped when they
+    are large, and the others (e.g. configuration fragments) are pickled one by one. The files are named by the hash of
+    their content, so that the parameters which did not change between versions are stored once.
+    Loading a version only reads the index of the store, and each parameter is read the first time it is accessed.
+    """
+
+    def __init__(self, path, mmap_threshold=2**16, max_versions=None):
+        """
+        Constructor for the parameter store class.
+        :param path: the folder of the store, created by the first save.
+        :param mmap_threshold: the size in bytes from which the arrays are memory-mapped read-only instead of read.
+        :param max_versions: (optional) the number of versions kept in the history, all of them by default.
+        """
+        self.path = path
+        self.mmap_threshold = mmap_threshold
+        self.max_versions = max_versions
+        self.index_file = os.path.join(path, "index.json")
+
+    def versions(self):
+        """
+        Returns the history of the store.
+        :return: a list with the version number, the save time and the parameter names of each version, oldest first.
+        """
+        return [
+            {"version": entry["version"], "time": entry["time"], "parameters": list(entry["parameters"])}
+            for entry in self._read_index()
+        ]
+
+    def save(self, parameters, amend=False):
+        """
+        Saves the parameters as a new version.
+        :param parameters: a dictionary {name: value}. The numbers and numerical arrays are saved as .npy files, and
+        the other values are pickled.
+        :param amend: whether to replace the last version instead of adding one, e.g. to add parameters derived after
+        the calibration.
+        :return: the version number.
+        """
+        os.makedirs(os.path.join(self.path, "data"), exist_ok=True)
+        index = self._read_index()
+        files = {}
+        for name, value in parameters.items():
+            files[name] = self._write(value)
+        if amend and index:
+            index[-1]["parameters"] = files
+            index[-1]["time"] = datetime.now().isoformat(timespec="seconds")
+        else:
+            version = index[-1]["version"] + 1 if index else 1
+            index.append(
+                {"version": version, "time": datetime.now().isoformat(timespec="seconds"), "parameters": files}
+            )
+        if self.max_versions is not None:
+            index = index[-self.max_versions :]
+        self._write_index(index)
+        self._remove_unused(index)
+        return index[-1]["version"]
+
+    def load(self, version=None):
+        """
+        Returns the parameters of a version, read lazily.
+        :param version: (optional) the version number, the last version by default.
+        :return: a read-only mapping {name: value}, or None if the store is empty.
+        """
+        index = self._read_index()
+        if not index:
+            return None
+        if version is None:
+            return StoredParameters(self, index[-1])
+        for entry in index:
+            if entry["version"] == version:
+                return StoredParameters(self, entry)
+        raise KeyError(f"version {version} is not in the store {self.path}")
+
+    def disk_size(self):
+        """
+        Returns the size in bytes of the files of the store, for all the versions.
+        """
+        if not os.path.isdir(self.path):
+            return 0
+        return sum(
+            entry.stat().st_size
+            for folder in [self.path, os.path.join(self.path, "data")]
+            for entry in os.scandir(folder)
+            if entry.is_file()
+        )
+
+    def _write(self, value):
+        # Writes a parameter into a file named by the hash of its content, unless it already exists
+        array = np.asarray(value) if not isinstance(value, (dict, str)) else None
+        if array is not None and array.dtype != object:
+            header = f"{array.dtype.str}{array.shape}".encode()
+            name = hashlib.sha1(header + array.tobytes()).hexdigest() + ".npy"
+            if not os.path.isfile(os.path.join(self.path, "data", name)):
+                self._write_atomic(name, lambda file: np.save(file, array))
+            return {"file": name, "nbytes": int(array.nbytes)}
+        content = pickle.dumps(value)
+        name = hashlib.sha1(content).hexdigest() + ".pkl"
+        if not os.path.isfile(os.path.join(self.path, "data", name)):
+            self._write_atomic(name, lambda file: file.write(content))
+        return {"file": name, "nbytes": len(content)}
+
+    def _write_atomic(self, name, write):
+        # The file is renamed once complete, so that an interrupted save does not leave a corrupted parameter
+        path = os.path.join(self.path, "data", name)
+        with open(path + ".tmp", "wb") as file:
+            write(file)
+        os.replace(path + ".tmp", path)
+
+    def _read_index(self):
+        if not os.path.isfile(self.index_file):
+            return []
+        with open(self.index_file, "r") as file:
+            return json.load(file)
+
+    def _write_index(self, index):
+        with open(self.index_file + ".tmp", "w") as file:
+            json.dump(index, file, indent=1)
+        os.replace(self.index_file + ".tmp", self.index_file)
+
+    def _remove_unused(self, index):
+        used = {info["file"] for entry in index for info in entry["parameters"].values()}
+        for entry in os.scandir(os.path.join(self.path, "data")):
+            if entry.name not in used:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    # e.g. a file still memory-mapped on Windows, removed by a later save
+                    pass
+
+
+class StoredParameters(Mapping):
+    """
+    The parameters of one version of a ParameterStore, each read from its file the first time it is accessed.
+    """
+
+    def __init__(self, store, entry):
+        self.store = store
+        self.version = entry["version"]
+        self.time = entry["time"]
+        self._files = entry["parameters"]
+        self._values = {}
+
+    def __getitem__(self, name):
+        if name not in self._values:
+            info = self._files[name]
+            path = os.path.join(self.store.path, "data", info["file"])
+            if info["file"].endswith(".npy"):
+                mmap_mode = "r" if info["nbytes"] >= self.store.mmap_threshold else None
+                self._values[name] = np.load(path, mmap_mode=mmap_mode)
+            else:
+                with open(path, "rb") as file:
+                    self._values[name] = pickle.load(file)
+        return self._values[name]
+
+    def __iter__(self):
+        return iter(self._files)
+
+    def __len__(self):
+        return len(self._files)
@@ -0,0 +1,113 @@
+import numpy as np
+
+
+class SphericalGMM:
+    """
+    Gaussian mixture model with spherical covariances in the IQ plane, fitted with a vectorized
+    expectation-maximization.
+    It is used to find the blobs of the 2 or 3 readout states in place of sklearn.mixture.GaussianMixture, and can be
+    warm started from the mu and sigma of a previous calibration.
+    """
+
+    def __init__(self, n_components, tol=1e-10, max_iter=200, reg_covar=1e-12):
+        """
+        Constructor for the spherical Gaussian mixture model class.
+        :param n_components: the number of Gaussian blobs.
+        :param tol: the convergence threshold on the change of the average log-likelihood between two iterations.
+        :param max_iter: the maximum number of expectation-maximization iterations.
+        :param reg_covar: the regularization added to the variances, which keeps them positive.
+        """
+        self.n_components = n_components
+        self.tol = tol
+        self.max_iter = max_iter
+        self.reg_covar = reg_covar
+        self.means_ = None
+        self.sigmas_ = None
+        self.weights_ = None
+        self.converged_ = False
+        self.n_iter_ = 0
+        self.log_likelihood_ = -np.inf
+
+    def fit(self, I, Q, means_init=None, sigmas_init=None):
+        """
+        Fits the mixture to the IQ points.
+        :param I: the I quadrature of the points as an array of shape (n_points,).
+        :param Q: the Q quadrature of the points as an array of shape (n_points,).
+        :param means_init: (optional) the initial [I, Q] center of each blob as an array of shape (n_components, 2),
+        e.g. the mu of a previous calibration. By default, the centers are spread along the main axis of the points.
+        :param sigmas_init: (optional) the initial standard deviation of each blob as an array of shape (n_components,).
+        By default, it is derived from the distance of the points to the closest initial center.
+        :return: the fitted model.
+        """
+        z = np.asarray(I, dtype=float) + 1j * np.asarray(Q, dtype=float)
+        if means_init is None:
+            means = self._initial_means(z)
+        else:
+            means_init = np.asarray(means_init, dtype=float).reshape(self.n_components, 2)
+            means = means_init[:, 0] + 1j * means_init[:, 1]
+        if sigmas_init is None:
+            distances = np.min(self._squared_distances(z, means), axis=1)
+            variances = np.full(self.n_components, np.mean(distances) / 2 + self.reg_covar)
+        else:
+            variances = np.broadcast_to(np.asarray(sigmas_init, dtype=float) ** 2, (self.n_components,))
+            variances = variances + self.reg_covar
+        weights = np.full(self.n_components, 1 / self.n_components)
+
+        self.converged_ = False
+        log_likelihood = -np.inf
+        for self.n_iter_ in range(1, self.max_iter + 1):
+            previous_log_likelihood = log_likelihood
+            log_resp, log_likelihood = self._e_step(z, means, variances, weights)
+            weights, means, variances = self._m_step(z, np.exp(log_resp))
+            if abs(log_likelihood - previous_log_likelihood) < self.tol:
+                self.converged_ = True
+                break
+
+        self.means_ = np.stack([means.real, means.imag], axis=1)
+        self.sigmas_ = np.sqrt(variances)
+        self.weights_ = weights
+        self.log_likelihood_ = log_likelihood
+        return self
+
+    def predict(self, I, Q):
+        """
+        Assigns each IQ point to its most likely blob.
+        :param I: the I quadrature of the points as an array of shape (n_points,).
+        :param Q: the Q quadrature of the points as an array of shape (n_points,).
+        :return: the index of the blob of each point as an array of shape (n_points,).
+        """
+        z = np.asarray(I, dtype=float) + 1j * np.asarray(Q, dtype=float)
+        means = self.means_[:, 0] + 1j * self.means_[:, 1]
+        return np.argmax(self._log_prob(z, means, self.sigmas_**2, self.weights_), axis=1)
+
+    def _initial_means(self, z):
+        # Centers spread between the 5% and 95% quantiles of the projection of the points on their main axis
+        centered = z - np.mean(z)
+        axis = np.exp(0.5j * np.angle(np.mean(centered**2)))
+        projection = np.real(centered * np.conj(axis))
+        quantiles = np.quantile(projection, np.linspace(0.05, 0.95, self.n_components))
+        return np.mean(z) + quantiles * axis
+
+    @staticmethod
+    def _squared_distances(z, means):
+        # Squared distances between the points and the centers, of shape (n_points, n_components)
+        difference = z[:, None] - means[None, :]
+        return difference.real**2 + difference.imag**2
+
+    def _log_prob(self, z, means, variances, weights):
+        # Log of the weighted 2D spherical Gaussian densities, of shape (n_points, n_components)
+        distances = self._squared_distances(z, means)
+        return np.log(weights) - np.log(2 * np.pi * variances) - distances / (2 * variances)
+
+    def _e_step(self, z, means, variances, weights):
+        log_prob = self._log_prob(z, means, variances, weights)
+        log_max = np.max(log_prob, axis=1, keepdims=True)
+        log_norm = log_max + np.log(np.sum(np.exp(log_prob - log_max), axis=1, keepdims=True))
+        return log_prob - log_norm, np.mean(log_norm)
+
+    def _m_step(self, z, resp):
+        counts = np.sum(resp, axis=0) + 10 * np.finfo(float).eps
+        means = (resp.T @ z) / counts
+        distances = self._squared_distances(z, means)
+        variances = np.sum(resp * distances, axis=0) / (2 * counts) + self.reg_covar
+        return counts / len(z), means, variances
@@ -1,12 +1,14 @@
 import numpy as np
-from pandas import DataFrame
 from qm.qua import *
 import os
+import time
 import matplotlib.pyplot as plt
-from sklearn import mixture
 from scipy import signal
 
 from TimeDiffCalibrator import TimeDiffCalibrator
+from PhasorCache import phasor_cache
+from SphericalGMM import SphericalGMM
+from ParameterStore import ParameterStore
 
 
 class StateDiscriminator:
@@ -14,41 +16,71 @@ class StateDiscriminator:
     The state discriminator is a class that generates optimized measure procedure for state discrimination
     of a multi-level qubit.
     .. note:
-        Currently only 3-states discrimination is supported. The setup assumed here includes IQ mixer both in the up-
-        and down-conversion of the readout pulse.
+        The setup assumed here includes IQ mixer both in the up- and down-conversion of the readout pulse.
     """
 
-    def __init__(self, qmm, config, update_tof, rr_qe, path, meas_len, smearing, lsb=False):
+    def __init__(
+        self,
+        qmm,
+        config,
+        update_tof,
+        rr_qe,
+        path,
+        meas_len,
+        smearing,
+        lsb=False,
+        trace_dtype=np.complex128,
+        num_of_states=3,
+    ):
         """
         Constructor for the state discriminator class.
         :param qmm: QuantumMachinesManager object
         :param config: A quantum machine configuration dictionary with the readout resonator element (must be mixInputs
         and have 2 outputs).
         :param rr_qe: A string with the name of the readout resonator element (as specified in the config)
-        :param path: A path to save optimized parameters, namely, integration weights and bias for each state. This file
-        is generated during training, and it is used during the subsequent measure_state procedure.
+        :param path: A path to save optimized parameters, namely, integration weights and bias for each state. They are
+        saved during training in a versioned ParameterStore, in the folder of the path without its extension, and they
+        are used during the subsequent measure_state procedure. A .npz file saved at this path by a former version is
+        loaded when the store is empty.
         :param lsb: defines if the downconversion mixers does a conversion to LO - IF, i.e., lower side band
+        :param trace_dtype: the complex dtype of the raw ADC traces buffer, np.complex64 halves its memory footprint
+        :param num_of_states: the number of states to discriminate, 3 (g, e, f) by default
         """
 
         self.qmm = qmm
         self.config = config
         self.rr_qe = rr_qe
-        self.num_of_states = 3
+        self.num_of_states = num_of_states
         self.path = path
+        self.store = ParameterStore(os.path.splitext(path)[0])
         self.saved_data = None
         self.time_diff = None
         self.update_tof = update_tof
         self.finish_train = 0
         self.mu = dict()
         self.sigma = dict()
+        self.gmm_mu = None
+        self.gmm_sigma = None
         self._load_file(path)
         self.lsb = lsb
         self.meas_len = meas_len
         self.smearing = smearing
+        self.trace_dtype = trace_dtype
+        self.ts = None
+        self.x = None
+        self.seq0 = None
+        self.chunk_size = None
+        self._res_handles = None
 
     def _load_file(self, path):
-        if os.path.isfile(path):
+        self.saved_data = self.store.load()
+        if self.saved_data is None and os.path.isfile(path):
             self.saved_data = np.load(path, allow_pickle=True)
+        if self.saved_data is not None:
+            if "gmm_mu" in self.saved_data:
+                # Warm start of the next 'gmm' correction
+                self.gmm_mu = self.saved_data["gmm_mu"]
+                self.gmm_sigma = self.saved_data["gmm_sigma"]
             self._update_config()
 
     def _get_qe_freq(self, qe):
@@ -60,75 +92,137 @@ class StateDiscriminator:
                 self.qmm, list(self.config["controllers"].keys())[0], self._get_qe_freq(qe)
             )
         rr_freq = self._get_qe_freq(qe)
-        sig = x * np.exp(-1j * 2 * np.pi * rr_freq * 1e-9 * (ts - self.time_diff))
+        # The demodulation phasors are taken from the cache shared by all the discriminators
+        sig = phasor_cache.phasors(rr_freq, self.time_diff, ts)
+        np.conjugate(sig, out=sig)
+        sig *= x
         return sig
 
     def _get_traces(self, qe, correction_method, I_res, Q_res, seq0, sig, use_hann_filter):
         if correction_method == "gmm":
-            data = {"x": I_res, "y": Q_res}
-            x = DataFrame(data, columns=["x", "y"])
-            gmm = mixture.GaussianMixture(
-                n_components=self.num_of_states, covariance_type="spherical", tol=1e-12, reg_covar=1e-12
-            ).fit(x)
-
-            pr_state = gmm.predict(x)
-            mapping = [np.argmax(np.bincount(pr_state[seq0 == i])) for i in range(self.num_of_states)]
-            traces = np.array([np.mean(sig[pr_state == mapping[i], :], axis=0) for i in range(self.num_of_states)])
-
-        elif correction_method == "none" or correction_method == "robust":
-            if correction_method == "none":
-                traces = np.array([np.mean(sig[seq0 == i, :], axis=0) for i in range(self.num_of_states)])
+            if self.gmm_mu is not None and len(self.gmm_mu) == self.num_of_states:
+                # Warm start from the blobs of the previous calibration
+                means_init, sigmas_init = self.gmm_mu, self.gmm_sigma
             else:
-                traces = np.array(
-                    [
-                        np.median(np.real(sig[seq0 == i, :]), axis=0)
-                        + 1j * np.median(np.imag(sig[seq0 == i, :]), axis=0)
-                        for i in range(self.num_of_states)
-                    ]
+                I_sums = np.bincount(seq0, I_res, self.num_of_states)
+                Q_sums = np.bincount(seq0, Q_res, self.num_of_states)
+                means_init = (
+                    np.stack([I_sums, Q_sums], axis=1) / np.bincount(seq0, minlength=self.num_of_states)[:, None]
                 )
+                sigmas_init = None
+            gmm = SphericalGMM(self.num_of_states).fit(I_res, Q_res, means_init, sigmas_init)
+            self.gmm_mu, self.gmm_sigma = gmm.means_, gmm.sigmas_
+
+            pr_state = gmm.predict(I_res, Q_res)
+            # The predicted blob found the most often for each prepared state
+            confusion = np.zeros((self.num_of_states, self.num_of_states), dtype=int)
+            np.add.at(confusion, (seq0, pr_state), 1)
+            traces = self._state_means(sig, pr_state)[np.argmax(confusion, axis=1)]
+
+        elif correction_method == "none":
+            traces = self._state_means(sig, seq0)
+        elif correction_method == "robust":
+            traces = self._state_medians(sig, seq0)
         else:
             raise Exception("unknown correction_method")
 
         if use_hann_filter:
-            rr_freq = self._get_qe_freq(qe)
-            period_ns = int(1 / rr_freq * 1e9)
-            hann = signal.hann(period_ns * 2, sym=True)
-            hann = hann / np.sum(hann)
-            traces = np.array([np.convolve(traces[i, :], hann, "same") for i in range(self.num_of_states)])
+            traces = self._hann_filter(qe, traces)
         return traces
 
+    def _state_means(self, sig, states):
+        # Mean trace of each state, summed for all the states at once by the product with the one-hot states
+        one_hot = np.zeros((self.num_of_states, len(states)), dtype=sig.dtype)
+        one_hot[states, np.arange(len(states))] = 1
+        counts = np.bincount(states, minlength=self.num_of_states)
+        return (one_hot @ sig) / np.maximum(counts, 1)[:, None]
+
+    def _state_medians(self, sig, states):
+        # Median of the real and imaginary parts of the traces of each state. When the states of a training are
+        # interleaved with the same number of shots per state, the median is taken for all the states at once on a
+        # view of the traces.
+        if len(states) % self.num_of_states == 0 and np.array_equal(states, self._prepared_states(0, len(states))):
+            grouped = sig.reshape(len(states) // self.num_of_states, self.num_of_states, -1)
+            return np.median(grouped.real, axis=0) + 1j * np.median(grouped.imag, axis=0)
+        return np.array(
+            [
+                np.median(np.real(sig[states == i, :]), axis=0) + 1j * np.median(np.imag(sig[states == i, :]), axis=0)
+                for i in range(self.num_of_states)
+            ]
+        )
+
+    def _hann_filter(self, qe, traces):
+        rr_freq = self._get_qe_freq(qe)
+        period_ns = int(1 / rr_freq * 1e9)
+        hann = signal.windows.hann(period_ns * 2, sym=True)
+        hann = hann / np.sum(hann)
+        return signal.convolve(traces, hann[None, :], "same")
+
     @staticmethod
     def _quantize_traces(traces):
-        weights = []
-        for i in range(traces.shape[0]):
-            weights.append(np.average(np.reshape(traces[i, :], (-1, 4)), axis=1))
-        return np.array(weights)
+        return np.mean(np.reshape(traces, (traces.shape[0], -1, 4)), axis=2)
 
-    def _execute_and_fetch(self, program, **execute_args):
-        qm = self.qmm.open_qm(self.config)
-        job = qm.execute(program, duration_limit=0, data_limit=0, **execute_args)
-        res_handles = job.result_handles
-        res_handles.wait_for_all_values()
+    def _prepared_states(self, start, stop):
+        # The states of the shots start to stop of a training program, which interleaves the states: the shot n
+        # prepares the state n % num_of_states
+        return np.arange(start, stop) % self.num_of_states
+
+    def _fetch(self, res_handles):
+        # Each stream is fetched once, in the order of the shots, into a preallocated buffer
         I_res = res_handles.get("I").fetch_all()["value"]
-        I_res = np.concatenate([I_res[0::2], I_res[1::2]])
         Q_res = res_handles.get("Q").fetch_all()["value"]
-        Q_res = np.concatenate([Q_res[0::2], Q_res[1::2]])
 
         if I_res.shape != Q_res.shape:
             raise RuntimeError("")
 
-        ts = res_handles.get("adc1").fetch_all()["value"]["timestamp"]
-        ts = np.concatenate([ts[0::2], ts[1::2]])
-        in1 = res_handles.get("adc1").fetch_all()["value"]["value"]
-        in1 = np.concatenate([in1[0::2], in1[1::2]])
-        in2 = res_handles.get("adc2").fetch_all()["value"]
-        in2 = np.concatenate([in2[0::2], in2[1::2]])
-        if not self.lsb:
-            x = in1 + 1j * in2
-        else:
-            x = in1 - 1j * in2
+        adc1 = res_handles.get("adc1").fetch_all()["value"]
+        ts = np.ascontiguousarray(adc1["timestamp"])
+        x = np.empty(adc1.shape, dtype=self.trace_dtype)
+        x.real = adc1["value"]
+        # Release the first input before fetching the second one to bound the peak memory
+        del adc1
+        x.imag = res_handles.get("adc2").fetch_all()["value"]
+        if self.lsb:
+            np.negative(x.imag, out=x.imag)
         return I_res, Q_res, ts, x
 
+    def _execute_and_fetch(self, program, **execute_args):
+        qm = self.qmm.open_qm(self.config)
+        job = qm.execute(program, duration_limit=0, data_limit=0, **execute_args)
+        res_handles = job.result_handles
+        res_handles.wait_for_all_values()
+        return self._fetch(res_handles)
+
+    def _iterate_chunks(self, res_handles, chunk_size):
+        # Yields the I, Q, timestamps, raw traces and prepared states of consecutive chunks of shots as soon as they
+        # are available, the states being labelled as in train()
+        handles = [res_handles.get(name) for name in ["I", "Q", "adc1", "adc2"]]
+        start = 0
+        while True:
+            done = not res_handles.is_processing()
+            available = min(handle.count_so_far() for handle in handles)
+            if available - start >= chunk_size or (done and available > start):
+                stop = min(start + chunk_size, available)
+                I_res, Q_res, adc1, in2 = (handle.fetch(slice(start, stop))["value"] for handle in handles)
+                x = np.empty(in2.shape, dtype=self.trace_dtype)
+                x.real = adc1["value"]
+                x.imag = -in2 if self.lsb else in2
+                yield I_res, Q_res, adc1["timestamp"], x, self._prepared_states(start, stop)
+                start = stop
+            elif done:
+                return
+            else:
+                time.sleep(0.1)
+
+    def _trace_chunks(self):
+        # Yields the timestamps, raw traces and prepared states of the last training, either from memory or chunk by
+        # chunk from the result handles after a streaming training
+        if self.x is not None:
+            yield self.ts, self.x, self.seq0
+        elif self._res_handles is not None:
+            for _, _, ts, x, states in self._iterate_chunks(self._res_handles, self.chunk_size):
+                yield ts, x, states
+
     def train(self, program, use_hann_filter=False, plot=False, correction_method="robust", **execute_args):
         """
         The train procedure is used to calibrate the optimal weights and bias for each state. A file with the optimal
@@ -136,9 +230,11 @@ class StateDiscriminator:
         A training program must be provided in the constructor.
         :param program: a training program. A program that generates training sets. The program should generate equal
         number of training sets for each one of the states. Collection of training sets is achieved by first preparing
-        the qubit in one of the states, and then measure the readout resonator element. The measure command must include
-        streaming of the raw data (the tag must be called "adc") and the final complex demodulation results (which is
-        constructed from 2 dual demodulations) must be saved under the tags "I" and "Q". E.g:
+        the qubit in one of the states, and then measure the readout resonator element. The states must be
+        interleaved, i.e. the shot n prepares the state n % num_of_states (g, e, g, e, ... for two states). The measure
+        command must include streaming of the raw data (the tag must be called "adc") and the final complex
+        demodulation results (which is constructed from 2 dual demodulations) must be saved under the tags "I" and "Q".
+        E.g:
 
             measure("readout", "rr", "adc", dual_demod.full('cos', 'out1', 'sin', 'out2', I),
                                             dual_demod.full('minus_sin', 'out1', 'cos', 'out2', Q))
@@ -147,35 +243,157 @@ class StateDiscriminator:
         :type bool.
         :param plot: Whether or not to plot some figures for debug purposes.
         :type bool
-        :param correction_method: it is possible to use 'gmm', 'robust', or 'none'
+        :param correction_method: it is possible to use 'gmm', 'robust', or 'none'. The 'gmm' correction is warm started
+        from the blobs found by the previous 'gmm' training (self.gmm_mu and self.gmm_sigma, set them to None to start
+        from the mean of each prepared state)
         """
 
         I_res, Q_res, self.ts, self.x = self._execute_and_fetch(program, **execute_args)
+        self.seq0 = self._prepared_states(0, len(I_res))
 
-        measures_per_state = len(I_res) // self.num_of_states
-        self.seq0 = np.array([[i] * measures_per_state for i in range(self.num_of_states)]).flatten()
+        sig = self._downconvert(self.rr_qe, self.x, self.ts)
+        traces = self._get_traces(self.rr_qe, correction_method, I_res, Q_res, self.seq0, sig, use_hann_filter)
+        self._train_from_traces(traces, I_res, Q_res, plot)
+
+    def train_streaming(
+        self,
+        program,
+        chunk_size=1000,
+        use_hann_filter=False,
+        plot=False,
+        correction_method="robust",
+        n_bins=512,
+        **execute_args,
+    ):
+        """
+        The streaming train procedure calibrates the optimal weights and bias for each state like train(), but
+        consumes the raw traces chunk by chunk while the training program is running. Only the running mean of the
+        traces of each state, or a histogram of each sample for correction_method="robust", is kept in memory, so that
+        the memory does not depend on the number of shots.
+        :param program: a training program, see train(), with the same order of the states, so that the same program
+        can be used by both procedures.
+        :param chunk_size: the number of shots processed at once.
+        :type int
+        :param use_hann_filter: Whether or not to use a LPF on the averaged sampled baseband waveforms.
+        :type bool.
+        :param plot: Whether or not to plot some figures for debug purposes.
+        :type bool
+        :param correction_method: it is possible to use 'robust' (approximate median) or 'none' (mean)
+        :param n_bins: the number of histogram bins of each sample used to derive the approximate median.
+        :type int
+        """
+        qm = self.qmm.open_qm(self.config)
+        job = qm.execute(program, duration_limit=0, data_limit=0, **execute_args)
+        self._res_handles = job.result_handles
+        self.chunk_size = chunk_size
+        self.ts, self.x = None, None
+
+        accumulator = _TraceAccumulator(self.num_of_states, correction_method, n_bins)
+        I_res, Q_res, seq0 = [], [], []
+        for I_chunk, Q_chunk, ts, x, states in self._iterate_chunks(self._res_handles, chunk_size):
+            accumulator.add(self._downconvert(self.rr_qe, x, ts), states)
+            I_res.append(I_chunk)
+            Q_res.append(Q_chunk)
+            seq0.append(states)
+        I_res, Q_res, self.seq0 = np.concatenate(I_res), np.concatenate(Q_res), np.concatenate(seq0)
+
+        traces = accumulator.traces()
+        if use_hann_filter:
+            traces = self._hann_filter(self.rr_qe, traces)
+        self._train_from_traces(traces, I_res, Q_res, plot)
+
+    def update(
+        self,
+        program,
+        alpha=0.2,
+        threshold=0.1,
+        use_hann_filter=False,
+        correction_method="none",
+        **execute_args,
+    ):
+        """
+        The update procedure tracks the slow drift of the optimal weights without training them from scratch. The
+        averaged traces of each state of a small batch of shots are folded into the traces of the stored weights with
+        an exponential moving average, and the weights and bias are pushed to the parameter store and to the
+        configuration only when the state assignment changed by more than the threshold since they were last pushed.
+        The moving average is stored in the parameter store, so that the changes below the threshold accumulate over
+        the updates.
+        :param program: a training program, see train(), with fewer shots per state.
+        :param alpha: the weight of the new batch in the moving average, between 0 and 1.
+        :type float
+        :param threshold: the change of the scores of the mean response of each state (see _scores_change) relative to
+        the smallest margin between the states, below which the configuration is not updated.
+        :type float
+        :param use_hann_filter: Whether or not to use a LPF on the averaged sampled baseband waveforms.
+        :type bool.
+        :param correction_method: it is possible to use 'gmm', 'robust', or 'none', see train()
+        :return: True if the weights and bias were pushed to the configuration.
+        """
+        if self.saved_data is None:
+            raise RuntimeError("the discriminator must be trained before being updated")
+        I_res, Q_res, self.ts, self.x = self._execute_and_fetch(program, **execute_args)
+        self.seq0 = self._prepared_states(0, len(I_res))
 
         sig = self._downconvert(self.rr_qe, self.x, self.ts)
         traces = self._get_traces(self.rr_qe, correction_method, I_res, Q_res, self.seq0, sig, use_hann_filter)
-        weights = self._quantize_traces(traces)
+        # The store also holds the parameters added after the training, e.g. mu and sigma
+        data = dict(self.store.load() or self.saved_data)
+        pushed = data["weights"] * self._weights_norm(data["weights"], data["bias"])
+        average = data.get("average_traces", pushed)
+        data["average_traces"] = (1 - alpha) * average + alpha * self._quantize_traces(traces)
+
+        change = self._scores_change(pushed, data["average_traces"])
+        if change > threshold:
+            data["weights"], data["bias"] = self._weights_and_bias(data["average_traces"])
+        # A pushed update is a new version of the store, otherwise only the moving average of the last one changes
+        self.store.save(data, amend=change <= threshold)
+        if change <= threshold:
+            return False
+        self.saved_data = data
+        self.finish_train = 0
+        self._update_config()
+        return True
 
+    @staticmethod
+    def _scores_change(pushed, average):
+        # The scores Re(<x, w_i>) - b_i of the mean responses x of the states, estimated by the moving average, with the
+        # pushed and the updated weights. The noise of the weights is mostly orthogonal to the responses, so that it
+        # changes the scores much less than the weights themselves.
+        scores = [
+            np.real(average @ np.conj(traces).T) - np.linalg.norm(traces, axis=1) ** 2 / 2
+            for traces in [pushed, average]
+        ]
+        margin = np.min(np.diag(scores[1])[:, None] - scores[1] + np.diag(np.full(len(average), np.inf)))
+        return np.max(np.abs(scores[1] - scores[0])) / margin
+
+    @staticmethod
+    def _weights_and_bias(weights):
+        # The quantized traces are normalized to a maximum of 1, and the bias of each state is half of the squared norm
+        # of its traces demodulated by its weights
         norm = np.max(np.abs(weights))
         weights = weights / norm
         bias = (np.linalg.norm(weights * norm, axis=1) ** 2) / norm / 2 * (2**-24) * 4
+        return weights, bias
+
+    @staticmethod
+    def _weights_norm(weights, bias):
+        # The normalization of the weights, derived from the bias of the state of largest weights
+        i = np.argmax(np.linalg.norm(weights, axis=1))
+        return bias[i] / (np.linalg.norm(weights[i]) ** 2 / 2 * (2**-24) * 4)
+
+    def _train_from_traces(self, traces, I_res, Q_res, plot):
+        weights, bias = self._weights_and_bias(self._quantize_traces(traces))
 
-        np.savez(
-            self.path,
-            weights=weights,
-            bias=bias,
-            smearing=self.smearing,
-            meas_len=self.meas_len,
-        )
         self.saved_data = {
             "weights": weights,
             "bias": bias,
             "smearing": self.smearing,
             "meas_len": self.meas_len,
         }
+        if self.gmm_mu is not None:
+            self.saved_data["gmm_mu"] = self.gmm_mu
+            self.saved_data["gmm_sigma"] = self.gmm_sigma
+        self.store.save(self.saved_data)
         self.finish_train = 1
         self._update_config()
 
@@ -235,43 +453,88 @@ class StateDiscriminator:
          complex IN(t_int) signal).
         :param out2: A string with the name second output of the readout resonator (corresponding to the imaginary part
         of the complex IN(t_int) signal).
-        :param res: An integer QUA variable that will receive the discrimination result (0,1 or 2)
+        :param res: An integer QUA variable that will receive the discrimination result (0, 1, ..., num_of_states - 1)
         :param adc: (optional) the stream variable which the raw ADC data will be saved and will appear in result
         analysis scope.
         """
         bias = self.saved_data["bias"]
-        # currently it allows only 3 states
 
-        d1_st0 = declare(fixed)
-        d2_st0 = declare(fixed)
-        d1_st1 = declare(fixed)
-        d2_st1 = declare(fixed)
-        d1_st2 = declare(fixed)
-        d2_st2 = declare(fixed)
-
-        st0 = declare(fixed)
-        st1 = declare(fixed)
-        st2 = declare(fixed)
+        d1_st = declare(fixed, size=self.num_of_states)
+        d2_st = declare(fixed, size=self.num_of_states)
+        st = declare(fixed, size=self.num_of_states)
 
         measure(
             pulse,
             self.rr_qe,
             adc,
-            demod.full(f"state_0_in1_{self.rr_qe}", d1_st0, out1),
-            demod.full(f"state_0_in2_{self.rr_qe}", d2_st0, out2),
-            demod.full(f"state_1_in1_{self.rr_qe}", d1_st1, out1),
-            demod.full(f"state_1_in2_{self.rr_qe}", d2_st1, out2),
-            demod.full(f"state_2_in1_{self.rr_qe}", d1_st2, out1),
-            demod.full(f"state_2_in2_{self.rr_qe}", d2_st2, out2),
+            *[demod.full(f"state_{i}_in1_{self.rr_qe}", d1_st[i], out1) for i in range(self.num_of_states)],
+            *[demod.full(f"state_{i}_in2_{self.rr_qe}", d2_st[i], out2) for i in range(self.num_of_states)],
         )
 
-        assign(st0, d1_st0 + d2_st0 - bias[0])
-        assign(st1, d1_st1 + d2_st1 - bias[1])
-        assign(st2, d1_st2 + d2_st2 - bias[2])
+        for i in range(self.num_of_states):
+            assign(st[i], d1_st[i] + d2_st[i] - bias[i])
+        # A single pass over the scores, instead of comparing all the pairs of states
+        assign(res, Math.argmax(st))
+
+
+class _TraceAccumulator:
+    """
+    Accumulates the downconverted traces of each state chunk by chunk. It keeps either their running sum (mean) or, for
+    the robust correction, a histogram of the real and imaginary parts of each sample from which an approximate median
+    is derived. The histogram range of each sample is set by the first chunk, and the values outside of this range are
+    counted in the edge bins.
+    """
 
-        with if_((st0 >= st1) & (st0 >= st2)):
-            assign(res, 0)
-        with if_((st1 >= st0) & (st1 >= st2)):
-            assign(res, 1)
-        with if_((st2 >= st0) & (st2 >= st1)):
-            assign(res, 2)
+    def __init__(self, num_of_states, correction_method, n_bins):
+        if correction_method not in ["none", "robust"]:
+            raise Exception("the streaming training supports only the 'robust' and 'none' correction methods")
+        self.num_of_states = num_of_states
+        self.robust = correction_method == "robust"
+        self.n_bins = n_bins
+        self.counts = np.zeros(num_of_states, dtype=int)
+        self.sums = None
+        self.histograms = None
+        self.low = None
+        self.width = None
+
+    def add(self, sig, states):
+        if self.sums is None:
+            self.sums = np.zeros((self.num_of_states, sig.shape[1]), dtype=complex)
+            if self.robust:
+                self.histograms = np.zeros((self.num_of_states, 2, sig.shape[1], self.n_bins), dtype=np.int32)
+                self.low = np.zeros((self.num_of_states, 2, sig.shape[1]))
+                self.width = np.zeros((self.num_of_states, 2, sig.shape[1]))
+        if self.robust:
+            self._add_to_histograms(np.stack([np.real(sig), np.imag(sig)], axis=1), states)
+        # The sums of all the states at once, by the product with the one-hot states
+        one_hot = np.zeros((self.num_of_states, len(states)), dtype=sig.dtype)
+        one_hot[states, np.arange(len(states))] = 1
+        self.sums += one_hot @ sig
+        self.counts += np.bincount(states, minlength=self.num_of_states)
+
+    def _add_to_histograms(self, values, states):
+        # values has the shape (shots, 2, samples)
+        for i in np.flatnonzero((self.counts == 0) & (np.bincount(states, minlength=self.num_of_states) > 0)):
+            # The range is twice the spread of the first chunk of the state around its center
+            low, high = np.min(values[states == i], axis=0), np.max(values[states == i], axis=0)
+            center, spread = (low + high) / 2, np.maximum(high - low, np.finfo(float).eps)
+            self.low[i] = center - spread
+            self.width[i] = 2 * spread / self.n_bins
+        bins = np.clip(((values - self.low[states]) / self.width[states]).astype(int), 0, self.n_bins - 1)
+        # Index of the bin in the histograms of all the states, parts and samples
+        cells = np.arange(values.shape[1] * values.shape[2]).reshape(values.shape[1:])
+        flat_bins = bins + self.n_bins * (cells + cells.size * states[:, None, None])
+        self.histograms += np.bincount(flat_bins.ravel(), minlength=self.histograms.size).reshape(self.histograms.shape)
+
+    def traces(self):
+        if not self.robust:
+            return self.sums / self.counts[:, None]
+        # Approximate median, linearly interpolated in the bin where the cumulative count reaches half of the shots
+        cumulative = np.cumsum(self.histograms, axis=-1)
+        half = self.counts[:, None, None] / 2
+        median_bin = np.argmax(cumulative >= half[..., None], axis=-1)
+        in_bin = np.take_along_axis(self.histograms, median_bin[..., None], axis=-1)[..., 0]
+        before = np.take_along_axis(cumulative, median_bin[..., None], axis=-1)[..., 0] - in_bin
+        fraction = (half - before) / np.maximum(in_bin, 1)
+        medians = self.low + (median_bin + fraction) * self.width
+        return medians[:, 0] + 1j * medians[:, 1]
@@ -1,16 +1,43 @@
 from StateDiscriminator import StateDiscriminator
+from PhasorCache import phasor_cache
+from SphericalGMM import SphericalGMM
 import numpy as np
 from qm.qua import *
 
-from pandas import DataFrame
-from sklearn import mixture
 import matplotlib.pyplot as plt
 
 
 class TwoStateDiscriminator(StateDiscriminator):
-    def __init__(self, qmm, config, update_tof, rr_qe, path, meas_len, smearing, lsb):
-        super().__init__(qmm, config, update_tof, rr_qe, path, meas_len, smearing, lsb)
-        self.num_of_states = 2
+    def __init__(
+        self,
+        qmm,
+        config,
+        update_tof,
+        rr_qe,
+        path,
+        meas_len,
+        smearing,
+        lsb,
+        trace_dtype=np.complex128,
+        projection_block_size=1000,
+        projection_dtype=np.float64,
+        weights_tolerance=None,
+    ):
+        """
+        Constructor for the two-state discriminator class, see StateDiscriminator for the other parameters.
+        :param projection_block_size: the number of shots projected at once on the optimal weights to derive mu and
+        sigma, which bounds the memory of the projection
+        :param projection_dtype: the real dtype of the projection, np.float32 halves its memory and speeds it up
+        :param weights_tolerance: (optional) the maximal change of the optimal weights, normalized to a maximum of 1,
+        allowed to merge their adjacent 4 ns segments into longer segments of the integration weights. 0 merges only
+        equal segments, and None (default) keeps one segment per 4 ns. See get_weights_error_bound for the resulting
+        error of the demodulation.
+        """
+        # The integration weights are written by the constructor of StateDiscriminator when the file exists
+        self.weights_tolerance = weights_tolerance
+        super().__init__(qmm, config, update_tof, rr_qe, path, meas_len, smearing, lsb, trace_dtype, 2)
+        self.projection_block_size = projection_block_size
+        self.projection_dtype = projection_dtype
 
     def _update_config(self):
         weights = self.saved_data["weights"]
@@ -20,19 +47,17 @@ class TwoStateDiscriminator(StateDiscriminator):
             self.mu = self.saved_data["mu"].tolist()
             self.sigma = self.saved_data["sigma"].tolist()
         b_vec = weights[0, :] - weights[1, :]
-        # create empty list where the opt_weights will be put in the current
-        # format of int_weights
-        w_plus_cos = []
-        w_minus_sin = []
-        w_plus_sin = []
-        w_minus_cos = []
-
-        # assigning integration weights to list of tuples
-        for i in range(smearing // 4, (meas_len + smearing) // 4):
-            w_plus_cos.append((np.real(b_vec)[i], 4))
-            w_minus_sin.append((np.imag(-b_vec)[i], 4))
-            w_plus_sin.append((np.imag(b_vec)[i], 4))
-            w_minus_cos.append((np.real(-b_vec)[i], 4))
+        values, durations = self._compress_weights(b_vec[smearing // 4 : (meas_len + smearing) // 4])
+        if self.weights_tolerance is not None:
+            # mu and sigma are derived with the weights actually used by the demodulation
+            b_vec = b_vec.copy()
+            b_vec[smearing // 4 : (meas_len + smearing) // 4] = np.repeat(values, durations // 4)
+        self.b_vec = b_vec
+        # create the lists of tuples (value, duration) of the opt_weights, in the current format of int_weights
+        w_plus_cos = [(float(np.real(v)), int(d)) for v, d in zip(values, durations)]
+        w_minus_sin = [(float(np.imag(-v)), int(d)) for v, d in zip(values, durations)]
+        w_plus_sin = [(float(np.imag(v)), int(d)) for v, d in zip(values, durations)]
+        w_minus_cos = [(float(np.real(-v)), int(d)) for v, d in zip(values, durations)]
 
         self.config["integration_weights"][f"opt_cos_{self.rr_qe}"] = {"cosine": w_plus_cos, "sine": w_minus_sin}
         self._add_iw_to_all_pulses(f"opt_cos_{self.rr_qe}")
@@ -49,39 +74,118 @@ class TwoStateDiscriminator(StateDiscriminator):
         if self.finish_train == 1:
             self._IQ_mu_sigma(b_vec)
 
-    def _IQ_mu_sigma(self, b_vec):
-        out1 = np.real(self.x) * 2**-12
-        if not self.lsb:
-            out2 = np.imag(self.x) * 2**-12
-            sign = 1
-        else:
-            out2 = -np.imag(self.x) * 2**-12
-            sign = -1
+    def update(self, program, *args, **kwargs):
+        """
+        See StateDiscriminator.update. When the weights are pushed, mu and sigma are derived again from the shots of the
+        update projected on the pushed weights, since those of the stored weights no longer describe the results of
+        measure_state.
+        :return: True if the weights and bias were pushed to the configuration.
+        """
+        if not super().update(program, *args, **kwargs):
+            return False
+        self._IQ_mu_sigma(self.b_vec)
+        return True
+
+    def _compress_weights(self, b_vec):
+        """
+        Merges the adjacent 4 ns segments of the optimal weights into segments whose real and imaginary parts stay
+        within 2 * weights_tolerance of each other, with their mid-range values, such that no sample of the cosine and
+        sine integration weights changes by more than weights_tolerance. The three integration weights share the
+        segments, so that the dual demodulations stay the real and imaginary parts of the same complex weights.
+        :param b_vec: the complex optimal weights, one per 4 ns.
+        :return: the complex value and the duration in ns of each segment.
+        """
+        if self.weights_tolerance is None or len(b_vec) == 0:
+            return b_vec, np.full(len(b_vec), 4)
+        values, durations = [], []
+        start = 0
+        re_min = re_max = b_vec[0].real
+        im_min = im_max = b_vec[0].imag
+        for i in range(1, len(b_vec) + 1):
+            if i < len(b_vec):
+                re, im = b_vec[i].real, b_vec[i].imag
+                if (
+                    max(re_max, re) - min(re_min, re) <= 2 * self.weights_tolerance
+                    and max(im_max, im) - min(im_min, im) <= 2 * self.weights_tolerance
+                ):
+                    re_min, re_max = min(re_min, re), max(re_max, re)
+                    im_min, im_max = min(im_min, im), max(im_max, im)
+                    continue
+            values.append((re_min + re_max) / 2 + 1j * (im_min + im_max) / 2)
+            durations.append(4 * (i - start))
+            if i < len(b_vec):
+                start = i
+                re_min = re_max = re
+                im_min = im_max = im
+        return np.array(values), np.array(durations)
+
+    def get_weights_error_bound(self):
+        """
+        Returns the bound of the change of the demodulation results, in the units of II, QQ and the threshold, caused
+        by the compression of the integration weights with weights_tolerance. Each complex weight changes by at most
+        sqrt(2) * weights_tolerance and each complex ADC sample is at most sqrt(2) * 2048, hence a change of at most
+        2**-24 * 4096 * weights_tolerance = weights_tolerance * 2**-12 per ns of the readout.
+        :return: the maximal error of the demodulation results for full-scale ADC samples, 0 without compression.
+        """
+        if not self.weights_tolerance:
+            return 0.0
+        return self.weights_tolerance * self.saved_data["meas_len"] * 2**-12
+
+    def _project(self, ts, x, b_vec):
+        # Demodulation of the raw traces with the optimal integration weights, as done in the FPGA.
+        # With the phasor p = cos + 1j * sin of the samples and the weights w, the terms cos * Re(w) - sin * Im(w) and
+        # cos * Im(w) + sin * Re(w) are the real and imaginary parts of p * w. Since the phasor of a shot is the cached
+        # table rotated by the phase of its first timestamp, the sums over the samples reduce to the products of the
+        # traces with the single vector table * w, done block of shots by block of shots to bound the memory.
+        sign = -1 if self.lsb else 1
         rr_freq = self._get_qe_freq(self.rr_qe)
-        cos = np.cos(2 * np.pi * rr_freq * 1e-9 * (self.ts - self.time_diff))
-        sin = np.sin(2 * np.pi * rr_freq * 1e-9 * (self.ts - self.time_diff))
-        b_vec = np.repeat(b_vec, 4)
-        I_res = np.sum(out1 * (cos * np.real(b_vec) + sin * np.imag(-b_vec)), axis=1) + np.sum(
-            out2 * (cos * np.imag(b_vec) + sin * np.real(b_vec)) * sign, axis=1
-        )
-        Q_res = np.sum(out2 * (cos * np.real(b_vec) + sin * np.imag(-b_vec)), axis=1) - np.sum(
-            out1 * (cos * np.imag(b_vec) + sin * np.real(b_vec)) * sign, axis=1
-        )
-        I_res *= 2**-12
-        Q_res *= 2**-12
+        real_dtype = np.dtype(self.projection_dtype)
+        weighted_table = phasor_cache.get(rr_freq, self.time_diff, x.shape[1]) * np.repeat(b_vec, 4)
+        weighted_table = np.stack([weighted_table.real, weighted_table.imag], axis=1).astype(real_dtype)
+        I_res = np.empty(len(x))
+        Q_res = np.empty(len(x))
+        for start in range(0, len(x), self.projection_block_size):
+            block = slice(start, start + self.projection_block_size)
+            out1 = x[block].real.astype(real_dtype)
+            out2 = x[block].imag.astype(real_dtype)
+            if self.lsb:
+                np.negative(out2, out=out2)
+            starts = ts[block, :1]
+            if np.all(ts[block, -1:] - starts == x.shape[1] - 1):
+                rotation = np.exp(1j * 2 * np.pi * rr_freq * 1e-9 * starts[:, 0])
+                z1 = out1 @ weighted_table
+                z2 = out2 @ weighted_table
+                z1 = rotation * (z1[:, 0] + 1j * z1[:, 1])
+                z2 = rotation * (z2[:, 0] + 1j * z2[:, 1])
+            else:
+                # Timestamps that are not consecutive: the phasor of each sample is computed
+                phasor = phasor_cache.phasors(rr_freq, self.time_diff, ts[block]) * np.repeat(b_vec, 4)
+                z1 = np.sum(out1 * phasor, axis=1)
+                z2 = np.sum(out2 * phasor, axis=1)
+            I_res[block] = z1.real + sign * z2.imag
+            Q_res[block] = z2.real - sign * z1.imag
+        I_res *= 2**-24
+        Q_res *= 2**-24
+        return I_res, Q_res
+
+    def _IQ_mu_sigma(self, b_vec):
+        I_res, Q_res, seq0 = [], [], []
+        # The traces are projected chunk by chunk after a streaming training
+        for ts, x, states in self._trace_chunks():
+            I_chunk, Q_chunk = self._project(ts, x, b_vec)
+            I_res.append(I_chunk)
+            Q_res.append(Q_chunk)
+            seq0.append(states)
+        I_res, Q_res, seq0 = np.concatenate(I_res), np.concatenate(Q_res), np.concatenate(seq0)
         import matplotlib.pyplot as plt
 
         plt.figure()
         for i in range(self.num_of_states):
-            I_ = I_res[self.seq0 == i]
-            Q_ = Q_res[self.seq0 == i]
-            data = {"x": I_, "y": Q_}
-            x = DataFrame(data, columns=["x", "y"])
-            gmm = mixture.GaussianMixture(n_components=1, covariance_type="spherical", tol=1e-12, reg_covar=1e-12).fit(
-                x
-            )
+            I_ = I_res[seq0 == i]
+            Q_ = Q_res[seq0 == i]
+            gmm = SphericalGMM(n_components=1).fit(I_, Q_)
             self.mu[i] = gmm.means_[0]
-            self.sigma[i] = np.sqrt(gmm.covariances_[0])
+            self.sigma[i] = gmm.sigmas_[0]
             theta = np.linspace(0, 2 * np.pi, 100)
             a = self.sigma[i] * np.cos(theta) + self.mu[i][0]
             b = self.sigma[i] * np.sin(theta) + self.mu[i][1]
@@ -93,10 +197,10 @@ class TwoStateDiscriminator(StateDiscriminator):
         plt.ylabel("Q")
         plt.legend()
         plt.show()
-        data = dict(np.load(self.path))
-        data["mu"] = self.mu
-        data["sigma"] = self.sigma
-        np.savez(self.path, **data)
+        data = dict(self.store.load())
+        data["mu"] = np.array([self.mu[i] for i in range(self.num_of_states)])
+        data["sigma"] = np.array([self.sigma[i] for i in range(self.num_of_states)])
+        self.store.save(data, amend=True)
 
     def plot_sigma_mu(self):
         theta = np.linspace(0, 2 * np.pi, 100)
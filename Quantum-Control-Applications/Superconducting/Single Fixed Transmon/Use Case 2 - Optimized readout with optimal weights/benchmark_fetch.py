@@ -0,0 +1,94 @@
+"""
+Benchmark of the fetch of the raw ADC traces used to train the StateDiscriminator.
+The result handles of a training job are emulated with random data, and the previous fetch (each stream fetched for
+every field, de-interleaved with np.concatenate and combined with in1 + 1j * in2) is compared with
+StateDiscriminator._fetch, which fetches each stream once into a preallocated complex buffer, in the order of the shots
+(the state of each shot being derived from its index instead of reordering the shots).
+The wall time and the peak memory allocated by each fetch are reported for an increasing number of shots.
+"""
+from StateDiscriminator import StateDiscriminator
+import numpy as np
+import tracemalloc
+import time
+
+##############
+# Parameters #
+##############
+n_shots_list = [1000, 5000, 10000]  # Total number of measurements
+trace_len = 2000  # Raw ADC trace length in ns
+lsb = False
+
+
+class FakeResult:
+    def __init__(self, data):
+        self.data = data
+
+    def fetch_all(self):
+        # fetch_all() returns a new copy of the data at every call
+        return {"value": self.data.copy()}
+
+
+class FakeResultHandles:
+    def __init__(self, n_shots):
+        rng = np.random.default_rng(0)
+        adc1 = np.empty((n_shots, trace_len), dtype=[("value", float), ("timestamp", np.int64)])
+        adc1["value"] = rng.integers(-2048, 2048, size=(n_shots, trace_len))
+        adc1["timestamp"] = np.arange(trace_len)[None, :] + 10000 * np.arange(n_shots)[:, None]
+        self.results = {
+            "I": FakeResult(rng.standard_normal(n_shots)),
+            "Q": FakeResult(rng.standard_normal(n_shots)),
+            "adc1": FakeResult(adc1),
+            "adc2": FakeResult(rng.integers(-2048, 2048, size=(n_shots, trace_len)).astype(float)),
+        }
+
+    def get(self, name):
+        return self.results[name]
+
+
+def previous_fetch(res_handles):
+    I_res = res_handles.get("I").fetch_all()["value"]
+    I_res = np.concatenate([I_res[0::2], I_res[1::2]])
+    Q_res = res_handles.get("Q").fetch_all()["value"]
+    Q_res = np.concatenate([Q_res[0::2], Q_res[1::2]])
+    ts = res_handles.get("adc1").fetch_all()["value"]["timestamp"]
+    ts = np.concatenate([ts[0::2], ts[1::2]])
+    in1 = res_handles.get("adc1").fetch_all()["value"]["value"]
+    in1 = np.concatenate([in1[0::2], in1[1::2]])
+    in2 = res_handles.get("adc2").fetch_all()["value"]
+    in2 = np.concatenate([in2[0::2], in2[1::2]])
+    if not lsb:
+        x = in1 + 1j * in2
+    else:
+        x = in1 - 1j * in2
+    return I_res, Q_res, ts, x
+
+
+def measure(fetch, res_handles):
+    tracemalloc.start()
+    start = time.perf_counter()
+    output = fetch(res_handles)
+    duration = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return output, duration, peak
+
+
+#############
+# Benchmark #
+#############
+discriminators = {
+    dtype: StateDiscriminator(None, {}, False, "rr", "", trace_len, 0, lsb=lsb, trace_dtype=dtype)
+    for dtype in [np.complex128, np.complex64]
+}
+for n_shots in n_shots_list:
+    res_handles = FakeResultHandles(n_shots)
+    reference, duration, peak = measure(previous_fetch, res_handles)
+    print(f"{n_shots} shots of {trace_len} ns: previous fetch {duration:.2f} s, peak memory {peak / 2**20:.0f} MB")
+    for dtype, discriminator in discriminators.items():
+        output, duration, peak = measure(discriminator._fetch, res_handles)
+        # The even shots followed by the odd shots, as returned by the previous fetch
+        order = np.concatenate([np.arange(0, n_shots, 2), np.arange(1, n_shots, 2)])
+        for expected, value in zip(reference, output):
+            assert np.allclose(expected, value[order])
+        print(f"    {np.dtype(dtype).name} buffer {duration:.2f} s, peak memory {peak / 2**20:.0f} MB")
+    del res_handles
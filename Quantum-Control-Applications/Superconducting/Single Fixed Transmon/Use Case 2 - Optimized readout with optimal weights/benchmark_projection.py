@@ -0,0 +1,93 @@
+"""
+Benchmark of the projection of the raw ADC traces on the optimal weights used by TwoStateDiscriminator._IQ_mu_sigma.
+The raw traces of a training run are emulated with random data, and the previous projection (full shots x samples cos
+and sin matrices multiplied with the repeated weights) is compared with TwoStateDiscriminator._project, which projects
+the traces block of shots by block of shots on the cached demodulation table, in float64 and float32.
+The wall time and the peak memory allocated by each projection are reported for an increasing number of shots.
+"""
+from TwoStateDiscriminator import TwoStateDiscriminator
+import numpy as np
+import tracemalloc
+import time
+
+##############
+# Parameters #
+##############
+n_shots_list = [1000, 5000, 10000]  # Total number of measurements
+trace_len = 2000  # Raw ADC trace length in ns
+rr_freq = 63.7e6  # Readout resonator intermediate frequency in Hz
+time_diff = 36  # Time difference in ns
+projection_block_size = 1000  # Number of shots projected at once
+lsb = False
+
+
+def previous_projection(ts, x, b_vec):
+    out1 = np.real(x) * 2**-12
+    if not lsb:
+        out2 = np.imag(x) * 2**-12
+        sign = 1
+    else:
+        out2 = -np.imag(x) * 2**-12
+        sign = -1
+    cos = np.cos(2 * np.pi * rr_freq * 1e-9 * (ts - time_diff))
+    sin = np.sin(2 * np.pi * rr_freq * 1e-9 * (ts - time_diff))
+    b_vec = np.repeat(b_vec, 4)
+    I_res = np.sum(out1 * (cos * np.real(b_vec) + sin * np.imag(-b_vec)), axis=1) + np.sum(
+        out2 * (cos * np.imag(b_vec) + sin * np.real(b_vec)) * sign, axis=1
+    )
+    Q_res = np.sum(out2 * (cos * np.real(b_vec) + sin * np.imag(-b_vec)), axis=1) - np.sum(
+        out1 * (cos * np.imag(b_vec) + sin * np.real(b_vec)) * sign, axis=1
+    )
+    I_res *= 2**-12
+    Q_res *= 2**-12
+    return I_res, Q_res
+
+
+def measure(project, ts, x, b_vec):
+    tracemalloc.start()
+    start = time.perf_counter()
+    output = project(ts, x, b_vec)
+    duration = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return output, duration, peak
+
+
+#############
+# Benchmark #
+#############
+config = {"elements": {"rr": {"intermediate_frequency": rr_freq}}}
+discriminators = {}
+for dtype in [np.float64, np.float32]:
+    discriminators[dtype] = TwoStateDiscriminator(
+        None,
+        config,
+        False,
+        "rr",
+        "",
+        trace_len,
+        0,
+        lsb,
+        projection_block_size=projection_block_size,
+        projection_dtype=dtype,
+    )
+    discriminators[dtype].time_diff = time_diff
+
+rng = np.random.default_rng(0)
+b_vec = rng.standard_normal(trace_len // 4) + 1j * rng.standard_normal(trace_len // 4)
+for n_shots in n_shots_list:
+    ts = np.arange(trace_len)[None, :] + 10000 * np.arange(n_shots)[:, None]
+    x = np.empty((n_shots, trace_len), dtype=np.complex128)
+    x.real = rng.integers(-2048, 2048, size=(n_shots, trace_len))
+    x.imag = rng.integers(-2048, 2048, size=(n_shots, trace_len))
+    reference, duration, peak = measure(previous_projection, ts, x, b_vec)
+    print(f"{n_shots} shots of {trace_len} ns: previous projection {duration:.2f} s, peak memory {peak / 2**20:.0f} MB")
+    scale = np.max(np.abs(reference))
+    for dtype, discriminator in discriminators.items():
+        output, duration, peak = measure(discriminator._project, ts, x, b_vec)
+        error = max(np.max(np.abs(expected - value)) for expected, value in zip(reference, output)) / scale
+        print(
+            f"    {np.dtype(dtype).name} blocks {duration:.2f} s, peak memory {peak / 2**20:.0f} MB, "
+            f"relative error {error:.1e}"
+        )
+    del ts, x
@@ -0,0 +1,161 @@
+"""
+Benchmark of the compression of the optimal integration weights written by TwoStateDiscriminator._update_config.
+The optimal weights of a training run are emulated by the difference of the ring-up of the readout resonator for the
+states g and e, plus the noise of their estimation from n_train traces. For each weights_tolerance, the number of
+(value, duration) segments of the integration weights, the size of the configuration and the time of its conversion
+by the qm package (validation and serialization to the message sent to the QOP by open_qm) are reported, together with
+the maximal change of the demodulation results of random full-scale ADC traces, its bound, and the distance between
+the demodulation results of the g and e responses for comparison.
+When qop_ip is given, the time to open a quantum machine with the configuration and to compile measure_state is
+reported as well.
+"""
+from TwoStateDiscriminator import TwoStateDiscriminator
+from qm import QuantumMachinesManager, generate_qua_script
+from qm.qua import *
+import numpy as np
+import tempfile
+import json
+import time
+import os
+
+##############
+# Parameters #
+##############
+readout_lens = [1000, 4000, 16000]  # Readout lengths in ns
+weights_tolerances = [None, 0, 0.005, 0.02, 0.05]  # Tolerances of the compression, None for one segment per 4 ns
+rr_freq = 63.7e6  # Readout resonator intermediate frequency in Hz
+time_diff = 36  # Time difference in ns
+ring_up_time = 200  # Ring-up time of the readout resonator in ns
+amplitude = 50  # Amplitude of the readout signal in ADC units
+n_train = 10000  # Number of training traces per state, which sets the noise of the optimal weights
+n_shots = 1000  # Number of random ADC traces demodulated to measure the error
+qop_ip = None  # IP address of the QOP, None to only convert the configuration offline
+rng = np.random.default_rng(0)
+
+
+def readout_config(readout_len):
+    return {
+        "controllers": {
+            "con1": {
+                "analog_outputs": {1: {"offset": 0.0}, 2: {"offset": 0.0}},
+                "analog_inputs": {1: {"offset": 0.0}, 2: {"offset": 0.0}},
+            }
+        },
+        "elements": {
+            "rr": {
+                "mixInputs": {"I": ("con1", 1), "Q": ("con1", 2), "lo_frequency": 6e9, "mixer": "mixer_rr"},
+                "intermediate_frequency": rr_freq,
+                "operations": {"readout": "readout_pulse"},
+                "outputs": {"out1": ("con1", 1), "out2": ("con1", 2)},
+                "time_of_flight": 24,
+                "smearing": 0,
+            }
+        },
+        "pulses": {
+            "readout_pulse": {
+                "operation": "measurement",
+                "length": readout_len,
+                "waveforms": {"I": "readout_wf", "Q": "zero_wf"},
+                "integration_weights": {},
+                "digital_marker": "ON",
+            }
+        },
+        "waveforms": {
+            "readout_wf": {"type": "constant", "sample": 0.1},
+            "zero_wf": {"type": "constant", "sample": 0.0},
+        },
+        "digital_waveforms": {"ON": {"samples": [(1, 0)]}},
+        "integration_weights": {},
+        "mixers": {"mixer_rr": [{"intermediate_frequency": rr_freq, "lo_frequency": 6e9, "correction": [1, 0, 0, 1]}]},
+    }
+
+
+def training_data(readout_len):
+    # Optimal weights of the states g and e, normalized as in StateDiscriminator._train_from_traces
+    t = np.arange(0, readout_len, 4)
+    ring_up = 1 - np.exp(-t / ring_up_time)
+    noise = 1 / np.sqrt(n_train)
+    weights = np.array([ring_up * np.exp(1j * phase) for phase in [0.3, 2.1]])
+    weights += noise * (rng.standard_normal(weights.shape) + 1j * rng.standard_normal(weights.shape))
+    norm = np.max(np.abs(weights))
+    weights /= norm
+    bias = (np.linalg.norm(weights * norm, axis=1) ** 2) / norm / 2 * (2**-24) * 4
+    return {
+        "weights": weights,
+        "bias": bias,
+        "smearing": 0,
+        "meas_len": readout_len,
+        "mu": [[0, 0]] * 2,
+        "sigma": [1, 1],
+    }
+
+
+def responses(weights, ts):
+    # Noiseless ADC traces of the g and e states, whose average is the optimal weights of each state
+    phase = 2 * np.pi * rr_freq * 1e-9 * (ts - time_diff)
+    return [amplitude * np.repeat(w, 4) * np.exp(1j * phase) for w in weights]
+
+
+def segments(config):
+    return sum(len(w) for iw in config["integration_weights"].values() for w in iw.values())
+
+
+def measure_state_program(discriminator):
+    with program() as prog:
+        res = declare(bool)
+        discriminator.measure_state("readout", "out1", "out2", res)
+    return prog
+
+
+#############
+# Benchmark #
+#############
+QuantumMachinesManager.set_capabilities_offline()
+qmm = QuantumMachinesManager(host=qop_ip) if qop_ip is not None else None
+for readout_len in readout_lens:
+    path = os.path.join(tempfile.mkdtemp(), "optimal_params.npz")
+    data = training_data(readout_len)
+    np.savez(path, **data)
+    ts = np.arange(readout_len)[None, :] + 10000 * np.arange(n_shots)[:, None]
+    x = rng.integers(-2048, 2048, size=(n_shots, readout_len)) + 1j * rng.integers(-2048, 2048, (n_shots, readout_len))
+    reference = None
+    print(f"{readout_len} ns readout:")
+    for tolerance in weights_tolerances:
+        config = readout_config(readout_len)
+        discriminator = TwoStateDiscriminator(
+            qmm, config, False, "rr", path, readout_len, 0, False, weights_tolerance=tolerance
+        )
+        discriminator.time_diff = time_diff
+        prog = measure_state_program(discriminator)
+        conversion = np.inf
+        for _ in range(3):
+            # the best of 3, the first conversion also initializing the qm package
+            start = time.perf_counter()
+            generate_qua_script(prog, config)
+            conversion = min(conversion, time.perf_counter() - start)
+
+        # The demodulation with the compressed weights, expanded back to one value per 4 ns
+        iw = config["integration_weights"]["opt_cos_rr"]
+        b_vec = np.repeat([v for v, _ in iw["cosine"]], [d // 4 for _, d in iw["cosine"]]) - 1j * np.repeat(
+            [v for v, _ in iw["sine"]], [d // 4 for _, d in iw["sine"]]
+        )
+        II, _ = discriminator._project(ts, x, b_vec)
+        if reference is None:
+            reference = II
+        error = np.max(np.abs(II - reference))
+        I_ge, Q_ge = discriminator._project(ts[:2], np.array(responses(data["weights"], ts[0])), b_vec)
+        distance = np.abs(I_ge[0] - I_ge[1] + 1j * (Q_ge[0] - Q_ge[1]))
+        line = (
+            f"    tolerance {tolerance}: {segments(config)} segments, "
+            f"config of {len(json.dumps(config)) / 1e3:.0f} kB, "
+            f"conversion {1e3 * conversion:.1f} ms, demodulation error {error:.1e} "
+            f"(bound {discriminator.get_weights_error_bound():.1e}, g-e distance {distance:.1e})"
+        )
+        if qmm is not None:
+            start = time.perf_counter()
+            qm = qmm.open_qm(config)
+            opened = time.perf_counter()
+            qm.compile(prog)
+            line += f", open_qm {opened - start:.2f} s, compile {time.perf_counter() - opened:.2f} s"
+            qm.close()
+        print(line)
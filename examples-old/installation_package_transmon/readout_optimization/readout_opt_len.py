@@ -19,10 +19,7 @@ qmm = QuantumMachinesManager()
 qm = qmm.open_qm(config)
 
 
-def opt_len(time):  # will update time in nanoseconds
-
-    # update the configuration file
-    ###############################
+def update_readout_len(time):  # will update time in nanoseconds
     config["pulses"]["readout_pulse"]["length"] = time
     config["integration_weights"]["cos_weights"]["cosine"] = [(1.0, time)]
     config["integration_weights"]["cos_weights"]["sine"] = [(0.0, time)]
@@ -37,6 +34,13 @@ def opt_len(time):  # will update time in nanoseconds
     config["integration_weights"]["rotated_minus_sin_weights"]["cosine"] = [(-np.sin(rotation_angle), time)]
     config["integration_weights"]["rotated_minus_sin_weights"]["sine"] = [(-np.cos(rotation_angle), time)]
 
+
+def opt_len(time):  # will update time in nanoseconds
+
+    # update the configuration file
+    ###############################
+    update_readout_len(time)
+
     ###################
     # The QUA program #
     ###################
@@ -145,19 +149,155 @@ def opt_len(time):  # will update time in nanoseconds
         return SNR
 
 
+def demod_prefixes(adc1, adc2):
+    """
+    Dual demodulation of raw ADC traces with constant integration weights for all the readout lengths at once.
+    The products of the traces with the demodulation phasor are summed over each 4 ns, the resolution of the
+    integration weights, and the cumulative sum of these sums gives I + 1j * Q for every length multiple of 4 ns.
+    :param adc1: the out1 traces as an array of shape (n_shots, max_len).
+    :param adc2: the out2 traces as an array of shape (n_shots, max_len).
+    :return: I + 1j * Q as an array of shape (n_shots, max_len // 4), the column k being the length 4 * (k + 1) ns.
+    """
+    t = np.arange(adc1.shape[1])
+    z = (adc1 + 1j * adc2) * np.exp(-1j * 2 * np.pi * resonator_if * 1e-9 * t)
+    z = np.sum(np.reshape(z, (len(z), -1, 4)), axis=2)
+    return np.cumsum(z, axis=1) * 2**-12
+
+
+def opt_len_from_traces(max_len):  # will update time in nanoseconds
+
+    # update the configuration file
+    ###############################
+    update_readout_len(max_len)
+
+    ###################
+    # The QUA program #
+    ###################
+
+    n_avg = 1000  # number of averages
+
+    cooldown_time = 50000 // 4  # qubit decay time
+
+    with program() as rr_traces:
+
+        # Declare QUA variables
+        ###################
+        n = declare(int)  # variable for average loop
+        n_st = declare_stream()  # stream for 'n'
+        adc_g_st = declare_stream(adc_trace=True)  # raw ADC traces of the ground state
+        adc_e_st = declare_stream(adc_trace=True)  # raw ADC traces of the excited state
+
+        # Pulse sequence
+        ################
+        with for_(n, 0, n < n_avg, n + 1):
+
+            # ground state traces
+            wait(cooldown_time, "qubit")  # wait for qubit to decay
+            align("qubit", "resonator")
+            reset_phase("resonator")  # same demodulation phase for all the traces
+            measure("readout", "resonator", adc_g_st)
+
+            align()  # global align
+
+            # excited state traces
+            wait(cooldown_time, "qubit")  # wait for qubit to decay
+            play("pi", "qubit")  # to populate |e> state
+            align("qubit", "resonator")
+            reset_phase("resonator")
+            measure("readout", "resonator", adc_e_st)
+
+            save(n, n_st)
+
+        # Stream processing
+        ###################
+        with stream_processing():
+            n_st.save("iteration")
+            adc_g_st.input1().save_all("adc1_g")
+            adc_g_st.input2().save_all("adc2_g")
+            adc_e_st.input1().save_all("adc1_e")
+            adc_e_st.input2().save_all("adc2_e")
+
+    #######################
+    # Simulate or execute #
+    #######################
+
+    simulate = False
+
+    if simulate:
+        # simulation properties
+        simulate_config = SimulationConfig(
+            duration=100000,
+            simulation_interface=LoopbackInterface(([("con1", 1, "con1", 1)])),
+        )
+        job = qmm.simulate(config, rr_traces, simulate_config)  # do simulation with qmm
+        job.get_simulated_samples().con1.plot()  # visualize played pulses
+
+    else:
+        # The quantum machine opened at the top uses the readout length of configuration.py
+        job = qmm.open_qm(config).execute(rr_traces)  # execute QUA program with the readout of max_len
+
+        res_handles = job.result_handles  # get access to handles
+        res_handles.wait_for_all_values()
+
+        # I + 1j * Q of every shot for every readout length
+        zg = demod_prefixes(
+            res_handles.get("adc1_g").fetch_all()["value"], res_handles.get("adc2_g").fetch_all()["value"]
+        )
+        ze = demod_prefixes(
+            res_handles.get("adc1_e").fetch_all()["value"], res_handles.get("adc2_e").fetch_all()["value"]
+        )
+
+        # same SNR as opt_len()
+        Z = np.mean(ze, axis=0) - np.mean(zg, axis=0)
+        var = (
+            np.var(zg.real, axis=0) + np.var(zg.imag, axis=0) + np.var(ze.real, axis=0) + np.var(ze.imag, axis=0)
+        ) / 4
+        SNR = ((np.abs(Z)) ** 2) / (2 * var)
+
+        # assignment fidelity with a threshold in the middle of the blobs, along the axis separating them
+        axis = np.conj(Z) / np.abs(Z)
+        pg = np.real(zg * axis)
+        pe = np.real(ze * axis)
+        threshold = (np.mean(pg, axis=0) + np.mean(pe, axis=0)) / 2
+        fidelity = 1 - (np.mean(pg > threshold, axis=0) + np.mean(pe < threshold, axis=0)) / 2
+
+        lens = 4 * np.arange(1, zg.shape[1] + 1)
+        assert lens[-1] == max_len, f"the traces are {lens[-1]} ns long instead of {max_len} ns"
+        return lens, SNR, fidelity
+
+
 ###############
 # Python loop #
 ###############
 
+use_raw_traces = True  # Derive the SNR of all the readout lengths from the raw traces of a single job
 
-SNRs = np.zeros(4)
-lens = np.zeros(4)
-j = 0
+if use_raw_traces:
+    results = opt_len_from_traces(1000)
 
-for i in range(200, 1000, 200):
-    SNRs[j] = opt_len(i)
-    lens[j] = i
-    j += 1
+    if results is None:
+        # The program was simulated, there are no traces to derive the SNR from
+        lens, SNRs = [], []
+    else:
+        lens, SNRs, fidelities = results
+
+        plt.figure()
+        plt.plot(lens, fidelities, ".-")
+        plt.xlabel("Readout lenght [ns]")
+        plt.ylabel("Assignment fidelity")
+        plt.title("Readout optimization")
+        print(f"Best SNR for a readout length of {lens[np.argmax(SNRs)]} ns")
+        print(f"Best assignment fidelity for a readout length of {lens[np.argmax(fidelities)]} ns")
+
+else:
+    SNRs = np.zeros(4)
+    lens = np.zeros(4)
+    j = 0
+
+    for i in range(200, 1000, 200):
+        SNRs[j] = opt_len(i)
+        lens[j] = i
+        j += 1
 
 plt.figure()
 plt.plot(lens, SNRs, ".-")
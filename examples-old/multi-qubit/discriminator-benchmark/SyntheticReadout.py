@@ -0,0 +1,210 @@
+import numpy as np
+
+
+class SyntheticReadout:
+    """
+    Synthesizes the raw ADC traces of the dispersive readout of one or several (multiplexed) transmons prepared in the
+    states g, e or f, so that the state discriminators can be trained and benchmarked without a fridge.
+    The field of each readout resonator rings up towards the steady state set by the dispersive shift of the state of
+    its qubit, the qubits decay during the readout (e -> g and f -> e -> g), and the fields of all the resonators are
+    summed on the two ADC inputs with Gaussian noise, as after the down-conversion by an IQ mixer.
+    """
+
+    def __init__(
+        self,
+        intermediate_frequencies=(50e6,),
+        readout_len=1000,
+        snr=3.0,
+        T1=20e3,
+        time_of_flight=0,
+        crosstalk=0.0,
+        amplitude=50.0,
+        kappa=5e6,
+        chis=(-1e6, 1e6, 3e6),
+        time_diff=0,
+        shot_period=10000,
+        seed=None,
+    ):
+        """
+        Constructor for the synthetic readout class.
+        :param intermediate_frequencies: the intermediate frequency in Hz of each readout resonator.
+        :param readout_len: the length in ns of the readout pulse and of the raw ADC traces.
+        :param snr: the signal to noise ratio of the readout of each resonator, defined as the distance between its g and
+        e responses divided by the standard deviation of the noise, both integrated with the optimal (matched) filter
+        over the readout window.
+        :param T1: the relaxation time in ns of the e state, the f state decaying twice faster. None disables the decay.
+        :param time_of_flight: the delay in ns between the start of the acquisition window and the arrival of the
+        readout signal, i.e. the error of the time_of_flight of the configuration.
+        :param crosstalk: the fraction of the dispersive shift of each qubit seen by the resonators of the other qubits.
+        :param amplitude: the amplitude in ADC units of the resonator field on resonance. The noise derived from the
+        snr must stay within the 12 bits range of the ADC.
+        :param kappa: the linewidth in Hz of the readout resonators.
+        :param chis: the dispersive shift in Hz of the resonator frequency for each qubit state.
+        :param time_diff: the time difference in ns between the reception of the signal and its timestamp.
+        :param shot_period: the time in ns between the starts of two consecutive measurements.
+        :param seed: the seed of the random generator.
+        """
+        self.intermediate_frequencies = list(intermediate_frequencies)
+        self.rr_num = len(self.intermediate_frequencies)
+        self.readout_len = readout_len
+        self.snr = snr
+        self.T1 = T1
+        self.time_of_flight = time_of_flight
+        self.crosstalk = crosstalk
+        self.amplitude = amplitude
+        self.kappa = kappa
+        self.chis = np.asarray(chis, dtype=float)
+        self.num_of_states = len(self.chis)
+        self.time_diff = time_diff
+        self.shot_period = shot_period
+        self.rng = np.random.default_rng(seed)
+        self.noise = self._noise_from_snr()
+
+    def _noise_from_snr(self):
+        # The g and e responses of a resonator without decay nor crosstalk, for which the squared distance integrated
+        # with the matched filter is the sum of the squared distances of the samples
+        field = self._field(np.array([[0], [1]]), np.full((2, 1, 1), np.inf), apply_crosstalk=False)[0]
+        return np.sqrt(np.sum(np.abs(field[0] - field[1]) ** 2)) / self.snr
+
+    def _decay_times(self, states):
+        # Time of each decay of the qubits during the readout, of shape (n_shots, rr_num, num_of_states - 1), the k-th
+        # decay being inf when the qubit reached g before or does not decay before the end of the readout
+        decays = np.full(states.shape + (self.num_of_states - 1,), np.inf)
+        if self.T1 is None:
+            return decays
+        # the level n decays towards n - 1 with the rate n / T1, starting when the level is reached
+        levels = states[..., None] - np.arange(self.num_of_states - 1)
+        durations = self.rng.exponential(1.0, decays.shape) * self.T1 / np.maximum(levels, 1)
+        return np.cumsum(np.where(levels >= 1, durations, np.inf), axis=-1)
+
+    def _field(self, states, decays, apply_crosstalk=True):
+        # Integrates the field of each resonator sample by sample, the state of the qubits being constant between two
+        # decays, with the exact solution of da/dt = -(kappa / 2 + 1j * 2 * pi * chi) * a + kappa / 2 * amplitude
+        half_kappa = np.pi * self.kappa * 1e-9
+        field = np.empty((states.shape[1], states.shape[0], self.readout_len), dtype=complex)
+        a = np.zeros(states.shape, dtype=complex)
+        for t in range(self.readout_len):
+            chi = self.chis[states - np.sum(decays <= t, axis=-1)]
+            if apply_crosstalk and self.crosstalk:
+                chi = chi + self.crosstalk * (np.sum(chi, axis=1, keepdims=True) - chi)
+            rate = half_kappa + 1j * 2 * np.pi * chi * 1e-9
+            steady = self.amplitude * half_kappa / rate
+            a = steady + (a - steady) * np.exp(-rate)
+            field[:, :, t] = a.T
+        return field
+
+    def generate(self, states, phase_reset=False):
+        """
+        Synthesizes the raw ADC traces of the multiplexed readout of qubits prepared in the given states.
+        :param states: the state of each qubit in each measurement, as an array of shape (n_shots, rr_num), or of shape
+        (n_shots,) for a single resonator.
+        :param phase_reset: whether the phase of the resonators is reset before each measurement, in which case the
+        timestamps of all the measurements start at 0, as in the training program of the NNStateDiscriminator.
+        :return: the out1 and out2 traces in ADC units and their timestamps in ns, as arrays of shape
+        (n_shots, readout_len).
+        """
+        states = np.asarray(states, dtype=int).reshape(len(states), -1)
+        field = self._field(states, self._decay_times(states))
+        if self.time_of_flight:
+            field = np.roll(field, self.time_of_flight, axis=-1)
+            field[..., : self.time_of_flight] = 0
+        ts = np.arange(self.readout_len)[None, :]
+        if not phase_reset:
+            ts = ts + self.shot_period * np.arange(len(states))[:, None]
+        else:
+            ts = np.broadcast_to(ts, (len(states), self.readout_len))
+        x = self.noise * (self.rng.standard_normal(field.shape[1:]) + 1j * self.rng.standard_normal(field.shape[1:]))
+        for freq, field_k in zip(self.intermediate_frequencies, field):
+            x += field_k * np.exp(1j * 2 * np.pi * freq * 1e-9 * (ts - self.time_diff))
+        # 12 bits ADC
+        adc1 = np.clip(np.round(x.real), -2048, 2047)
+        adc2 = np.clip(np.round(x.imag), -2048, 2047)
+        return adc1, adc2, np.ascontiguousarray(ts, dtype=np.int64)
+
+
+class SyntheticResult:
+    """
+    Result handle of one stream of the emulated quantum machine, holding all the values of the stream.
+    """
+
+    def __init__(self, data):
+        self.data = data
+
+    def fetch_all(self):
+        return self.data.copy()
+
+    def fetch(self, item):
+        return self.data[item].copy()
+
+    def count_so_far(self):
+        return len(self.data)
+
+
+class SyntheticResultHandles:
+    """
+    Result handles of a job of the emulated quantum machine, whose streams are given as structured arrays.
+    """
+
+    def __init__(self, streams):
+        self._results = {name: SyntheticResult(data) for name, data in streams.items()}
+
+    def get(self, name):
+        return self._results[name]
+
+    def __getattr__(self, name):
+        # streams such as adc_input1 are also accessed as attributes
+        try:
+            return self.__dict__["_results"][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def wait_for_all_values(self):
+        pass
+
+    def is_processing(self):
+        return False
+
+    @staticmethod
+    def stream(values, timestamps=None):
+        """
+        Returns the values of a stream as saved by save_all(), i.e. a structured array with the field 'value', and the
+        field 'timestamp' for a stream saved with_timestamps().
+        :param values: the values of the stream, which can also be the structured array of another stream.
+        :param timestamps: (optional) the timestamps of the values.
+        :return: a structured array with the same shape as values.
+        """
+        values = np.asarray(values)
+        fields = [("value", values.dtype)]
+        if timestamps is not None:
+            fields.append(("timestamp", np.int64))
+        data = np.empty(values.shape, dtype=fields)
+        data["value"] = values
+        if timestamps is not None:
+            data["timestamp"] = timestamps
+        return data
+
+
+class SyntheticQuantumMachinesManager:
+    """
+    Emulates the QuantumMachinesManager used by the discriminators to run their training programs. The programs are
+    not executed: each call to execute() returns a job whose result handles are the next streams given to the
+    constructor, which must be those saved by the program.
+    """
+
+    def __init__(self, jobs):
+        """
+        Constructor for the emulated quantum machines manager.
+        :param jobs: an iterable of dictionaries {stream name: structured array}, one per executed program.
+        """
+        self.jobs = iter(jobs)
+
+    def open_qm(self, config):
+        return self
+
+    def execute(self, program, **execute_args):
+        return _SyntheticJob(SyntheticResultHandles(next(self.jobs)))
+
+
+class _SyntheticJob:
+    def __init__(self, result_handles):
+        self.result_handles = result_handles
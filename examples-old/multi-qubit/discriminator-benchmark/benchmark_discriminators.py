@@ -0,0 +1,259 @@
+"""
+Offline benchmark of the state discriminators: the StateDiscriminator (3 and 5 states, and the streaming training of
+3 states) and the TwoStateDiscriminator of the Use Case 2 of the single fixed transmon, the multilevel
+StateDiscriminator and the NNStateDiscriminator.
+The raw ADC traces of the training and test measurements are synthesized by SyntheticReadout, and the training
+programs are replaced by an emulated quantum machine returning these traces in the streams of each program.
+For each discriminator, the wall time and the peak memory of the training are reported, together with the assignment
+fidelity of the test measurements, derived by emulating the demodulation of the OPX with the integration weights
+exported to the configuration and the state assignment of measure_state.
+"""
+import matplotlib
+
+matplotlib.use("Agg")  # the trainings plot figures
+
+from SyntheticReadout import SyntheticReadout, SyntheticResultHandles, SyntheticQuantumMachinesManager
+from qm.qua import play
+import numpy as np
+import importlib
+import tempfile
+import tracemalloc
+import time
+import sys
+import os
+
+##############
+# Parameters #
+##############
+n_train = 2000  # Number of training measurements per state
+n_test = 2000  # Number of test measurements per state
+readout_len = 1000  # Readout length in ns
+rr_freqs = [50e6, 61e6, 73e6]  # Intermediate frequencies of the multiplexed resonators of the NNStateDiscriminator
+snr = 3.0  # Signal to noise ratio of the readout of each resonator
+T1 = 20e3  # Qubit relaxation time in ns
+time_of_flight = 0  # Delay of the readout signal in the acquisition window in ns
+crosstalk = 0.02  # Fraction of the dispersive shift of each qubit seen by the other resonators
+nn_combinations = 600  # Number of prepared states of the qubits in the training of the NNStateDiscriminator
+nn_avg = 10  # Number of averaged measurements of each state in the training of the NNStateDiscriminator
+nn_method = "lda"  # Training method of the NNStateDiscriminator
+chis = [-1e6, 1e6, 3e6, 5e6, 7e6]  # Dispersive shifts in Hz of the resonator for the states g, e, f, ...
+seed = 0
+
+root = os.path.dirname(os.path.abspath(__file__))
+use_case_2 = os.path.join(
+    root,
+    "..",
+    "..",
+    "..",
+    "Quantum-Control-Applications",
+    "Superconducting",
+    "Single Fixed Transmon",
+    "Use Case 2 - Optimized readout with optimal weights",
+)
+multilevel = os.path.join(root, "..", "multilevel-discriminator")
+multiplexed = os.path.join(root, "..", "multiplexed-multilevel-NN-discriminator")
+
+
+def load_class(folder, module_name):
+    """
+    Imports a discriminator class from the folder of its example. The folders contain modules with the same names
+    (StateDiscriminator, TimeDiffCalibrator, ...), which are removed from sys.modules before and after the import so
+    that each class uses the modules of its own folder.
+
+    :param folder: The folder of the example.
+    :param module_name: The name of the module, which is also the name of the class.
+    :return: The class.
+    """
+    local_modules = [name[:-3] for name in os.listdir(folder) if name.endswith(".py")]
+    for name in local_modules:
+        sys.modules.pop(name, None)
+    sys.path.insert(0, folder)
+    try:
+        return getattr(importlib.import_module(module_name), module_name)
+    finally:
+        sys.path.remove(folder)
+        for name in local_modules:
+            sys.modules.pop(name, None)
+
+
+def readout_config(resonators, freqs):
+    config = {"controllers": {"con1": {}}, "elements": {}, "pulses": {}, "integration_weights": {}}
+    for i, (rr, freq) in enumerate(zip(resonators, freqs)):
+        config["elements"][rr] = {"intermediate_frequency": freq, "time_of_flight": 24, "smearing": 0}
+        config["pulses"]["readout_pulse_" + str(i)] = {"length": readout_len, "integration_weights": {}}
+    return config
+
+
+def demod_full(config, iw, adc, freq, ts, time_diff):
+    """
+    Emulates demod.full of the OPX, which integrates the samples of an ADC input multiplied by the cosine and sine
+    integration weights of the configuration, given for each 4 ns or as (value, duration) tuples.
+
+    :return: The demodulation result of each measurement.
+    """
+    weights = []
+    for values in [config["integration_weights"][iw]["cosine"], config["integration_weights"][iw]["sine"]]:
+        if len(values) and isinstance(values[0], tuple):
+            weights.append(np.repeat([v for v, _ in values], [d for _, d in values])[: adc.shape[1]])
+        else:
+            weights.append(np.repeat(values, 4)[: adc.shape[1]])
+    phase = 2 * np.pi * freq * 1e-9 * (ts - time_diff)
+    return np.sum(adc * (weights[0] * np.cos(phase) + weights[1] * np.sin(phase)), axis=1) * 2**-24
+
+
+def dual_demod_iq(adc1, adc2, freq, ts, time_diff):
+    # I and Q of the training programs, demodulated with constant weights
+    z = np.sum((adc1 + 1j * adc2) * np.exp(-1j * 2 * np.pi * freq * 1e-9 * (ts - time_diff)), axis=1) * 2**-24
+    return z.real, z.imag
+
+
+def interleave(num_of_states, n):
+    # Order of the states in the training programs of the Use Case 2 discriminators: the shot i prepares the state
+    # i % num_of_states
+    return np.tile(np.arange(num_of_states), n)
+
+
+def fidelity(assigned, prepared, num_of_states):
+    return np.mean([np.mean(assigned[prepared == i] == i) for i in range(num_of_states)])
+
+
+def measure(train):
+    tracemalloc.start()
+    start = time.perf_counter()
+    train()
+    duration = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return duration, peak
+
+
+def report(name, duration, peak, fidelities):
+    print(
+        f"{name}: training {duration:.2f} s, peak memory {peak / 2**20:.0f} MB, "
+        f"assignment fidelity {np.mean(fidelities):.3f}"
+        + (f" {np.round(fidelities, 3)}" if len(fidelities) > 1 else "")
+    )
+
+
+def benchmark_single(folder, module_name, num_of_states, streaming=False):
+    # Discriminators of a single resonator, trained with the states prepared in blocks
+    readout = SyntheticReadout(
+        [rr_freqs[0]], readout_len, snr, T1, time_of_flight, chis=chis[:num_of_states], seed=seed
+    )
+    two_states = module_name == "TwoStateDiscriminator"
+    if folder == use_case_2:
+        prepared = interleave(num_of_states, n_train)
+    else:
+        prepared = np.repeat(np.arange(num_of_states), n_train)
+    adc1, adc2, ts = readout.generate(prepared)
+    I, Q = dual_demod_iq(adc1, adc2, rr_freqs[0], ts, readout.time_diff)
+    stream = SyntheticResultHandles.stream
+    if folder == use_case_2:
+        job = {"I": stream(I), "Q": stream(Q), "adc1": stream(stream(adc1, ts)), "adc2": stream(adc2)}
+    else:
+        job = {"I": stream(I), "Q": stream(Q), "adc_input1": stream(adc1, ts), "adc_input2": stream(adc2, ts)}
+    del adc1, adc2, ts
+
+    qmm = SyntheticQuantumMachinesManager([job])
+    config = readout_config(["rr"], [rr_freqs[0]])
+    path = os.path.join(tempfile.mkdtemp(), "discriminator_params.npz")
+    cls = load_class(folder, module_name)
+    if two_states:
+        discriminator = cls(qmm, config, False, "rr", path, readout_len, 0, False)
+        suffix = "_rr"
+    elif folder == use_case_2:
+        discriminator = cls(qmm, config, False, "rr", path, readout_len, 0, False, num_of_states=num_of_states)
+        suffix = "_rr"
+    else:
+        discriminator = cls(qmm, config, "rr", num_of_states, path)
+        suffix = ""
+    discriminator.time_diff = readout.time_diff
+    if streaming:
+        # The same job as train(), consumed chunk by chunk
+        duration, peak = measure(lambda: discriminator.train_streaming(None))
+    elif folder == use_case_2:
+        duration, peak = measure(lambda: discriminator.train(None))
+    else:
+        duration, peak = measure(lambda: discriminator.train(None, use_hann_filter=False))
+
+    prepared = np.repeat(np.arange(num_of_states), n_test)
+    adc1, adc2, ts = readout.generate(prepared)
+    args = (rr_freqs[0], ts, readout.time_diff)
+    if two_states:
+        II = demod_full(config, "opt_cos_rr", adc1, *args) + demod_full(config, "opt_sin_rr", adc2, *args)
+        assigned = (II < discriminator.get_threshold()).astype(int)
+    else:
+        bias = discriminator.saved_data["bias"]
+        scores = [
+            demod_full(config, f"state_{i}_in1{suffix}", adc1, *args)
+            + demod_full(config, f"state_{i}_in2{suffix}", adc2, *args)
+            - bias[i]
+            for i in range(num_of_states)
+        ]
+        assigned = np.argmax(scores, axis=0)
+    return duration, peak, [fidelity(assigned, prepared, num_of_states)]
+
+
+def benchmark_nn():
+    rr_num = len(rr_freqs)
+    readout = SyntheticReadout(rr_freqs, readout_len, snr, T1, time_of_flight, crosstalk, seed=seed)
+    rng = np.random.default_rng(seed)
+    NNStateDiscriminator = load_class(multiplexed, "NNStateDiscriminator")
+    resonators = ["rr" + str(i) for i in range(rr_num)]
+    qubits = ["qb" + str(i) for i in range(rr_num)]
+    states = rng.integers(0, 3, (nn_combinations, rr_num))
+
+    def jobs(max_states):
+        # The training program measures avg_n times all the states of its chunk, after a phase reset
+        for start in range(0, len(states), max_states):
+            adc1, adc2, _ = readout.generate(np.tile(states[start : start + max_states], (nn_avg, 1)), True)
+            raw1 = SyntheticResultHandles.stream(adc1)
+            raw2 = SyntheticResultHandles.stream(adc2)
+            yield {
+                name: raw for j in range(rr_num) for name, raw in [("raw1_" + str(j), raw1), ("raw2_" + str(j), raw2)]
+            }
+
+    def prepare_qubits(state, qubits):
+        for i, s in enumerate(state):
+            play("prepare" + str(s), qubits[i])
+
+    path = os.path.join(tempfile.mkdtemp(), "nn")
+    config = readout_config(resonators, rr_freqs)
+    discriminator = NNStateDiscriminator(None, config, resonators, qubits, ["rr0"], path)
+    discriminator.qmm = SyntheticQuantumMachinesManager(jobs(discriminator.MAX_STATES))
+    discriminator.generate_training_data(prepare_qubits, "readout", nn_avg, states, 1, calibrate_dc_offset=False)
+    discriminator.time_diff = readout.time_diff
+    duration, peak = measure(lambda: discriminator.train(calibrate_time_diff=False, method=nn_method))
+
+    prepared = rng.integers(0, 3, (3 * n_test, rr_num))
+    adc1, adc2, ts = readout.generate(prepared, phase_reset=True)
+    fidelities = []
+    for k in range(rr_num):
+        args = (rr_freqs[k], ts, readout.time_diff)
+        out1 = demod_full(discriminator.config, "optimal_w1_" + str(k), adc1, *args)
+        out2 = demod_full(discriminator.config, "optimal_w2_" + str(k), adc2, *args)
+        W, b = discriminator.final_weights[k]
+        scores = np.outer(out1, W[0]) + np.outer(out2, W[1]) + b * 2**-12
+        fidelities.append(fidelity(np.argmax(scores, axis=1), prepared[:, k], 3))
+    return duration, peak, fidelities
+
+
+#############
+# Benchmark #
+#############
+for name, benchmark in [
+    ("Use Case 2 StateDiscriminator", lambda: benchmark_single(use_case_2, "StateDiscriminator", 3)),
+    ("Use Case 2 StateDiscriminator (5 states)", lambda: benchmark_single(use_case_2, "StateDiscriminator", 5)),
+    (
+        "Use Case 2 StateDiscriminator (streaming)",
+        lambda: benchmark_single(use_case_2, "StateDiscriminator", 3, streaming=True),
+    ),
+    ("Use Case 2 TwoStateDiscriminator", lambda: benchmark_single(use_case_2, "TwoStateDiscriminator", 2)),
+    ("multilevel StateDiscriminator", lambda: benchmark_single(multilevel, "StateDiscriminator", 3)),
+    (f"NNStateDiscriminator ({nn_method}, {len(rr_freqs)} resonators)", benchmark_nn),
+]:
+    try:
+        report(name, *benchmark())
+    except ImportError as error:
+        # e.g. an example written for another version of the qm package
+        print(f"{name}: skipped, {error}")
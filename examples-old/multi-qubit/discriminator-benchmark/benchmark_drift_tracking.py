@@ -0,0 +1,137 @@
+"""
+Offline benchmark of the incremental update of the StateDiscriminator of the Use Case 2 of the single fixed transmon,
+which folds small batches of shots into the stored weights with an exponential moving average, against a full
+training from scratch at each recalibration.
+The readout resonator drifts by resonator_drift at each step. At each step, the assignment fidelity of the weights of
+the initial training (stale), of the incrementally updated weights and of the weights of a full training is derived
+from synthesized test measurements, as in benchmark_discriminators.py. The recalibration time is the acquisition time
+of the shots of the training program, estimated with the repetition time of the measurements, plus the wall time of
+the training or of the update.
+"""
+import matplotlib
+
+matplotlib.use("Agg")  # the trainings plot figures
+
+from SyntheticReadout import SyntheticReadout, SyntheticResultHandles, SyntheticQuantumMachinesManager
+import numpy as np
+import tempfile
+import time
+import sys
+import os
+
+##############
+# Parameters #
+##############
+n_train = 2000  # Number of measurements per state of a full training
+n_batch = 200  # Number of measurements per state of an incremental update
+n_test = 2000  # Number of test measurements per state
+n_steps = 8  # Number of recalibrations
+resonator_drift = 100e3  # Drift of the resonator frequency in Hz between two recalibrations
+alpha = 0.3  # Weight of a new batch in the moving average of the update
+threshold = 0.1  # Change of the scores relative to the margin between the states below which the config is kept
+repetition_time = 100e3  # Time between two measurements of the training program in ns, e.g. 5 T1 for the reset
+readout_len = 1000  # Readout length in ns
+rr_freq = 50e6  # Intermediate frequency of the readout resonator in Hz
+snr = 3.0  # Signal to noise ratio of the readout
+seed = 0
+
+root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(
+    0,
+    os.path.join(
+        root,
+        "..",
+        "..",
+        "..",
+        "Quantum-Control-Applications",
+        "Superconducting",
+        "Single Fixed Transmon",
+        "Use Case 2 - Optimized readout with optimal weights",
+    ),
+)
+from StateDiscriminator import StateDiscriminator
+
+
+def training_job(readout, n):
+    # Streams of the training program, which interleaves the states: the shot i prepares the state i % 3
+    adc1, adc2, ts = readout.generate(np.tile(np.arange(3), n))
+    z = np.sum((adc1 + 1j * adc2) * np.exp(-1j * 2 * np.pi * rr_freq * 1e-9 * (ts - readout.time_diff)), axis=1)
+    stream = SyntheticResultHandles.stream
+    return {
+        "I": stream(z.real * 2**-24),
+        "Q": stream(z.imag * 2**-24),
+        "adc1": stream(stream(adc1, ts)),
+        "adc2": stream(adc2),
+    }
+
+
+def discriminator_fidelity(discriminator, adc1, adc2, ts, prepared):
+    # Emulated demodulation with the integration weights of the configuration, one value per 4 ns
+    phase = 2 * np.pi * rr_freq * 1e-9 * (ts - discriminator.time_diff)
+    sig = (adc1 + 1j * adc2) * np.exp(-1j * phase)
+    bias = discriminator.saved_data["bias"]
+    scores = []
+    for i in range(3):
+        iw = discriminator.config["integration_weights"][f"state_{i}_in1_rr"]
+        w = np.repeat(np.array(iw["cosine"]) - 1j * np.array(iw["sine"]), 4)
+        scores.append(np.real(sig @ np.conj(w)) * 2**-24 - bias[i])
+    assigned = np.argmax(scores, axis=0)
+    return np.mean([np.mean(assigned[prepared == i] == i) for i in range(3)])
+
+
+def new_discriminator(readout, path):
+    config = {
+        "elements": {"rr": {"intermediate_frequency": rr_freq, "time_of_flight": 24, "smearing": 0}},
+        "pulses": {"readout_pulse": {"length": readout_len, "integration_weights": {}}},
+        "integration_weights": {},
+    }
+    discriminator = StateDiscriminator(None, config, False, "rr", path, readout_len, 0)
+    discriminator.time_diff = readout.time_diff
+    return discriminator
+
+
+def train(discriminator, readout, n):
+    discriminator.qmm = SyntheticQuantumMachinesManager([training_job(readout, n)])
+    start = time.perf_counter()
+    discriminator.train(None, correction_method="none")
+    return time.perf_counter() - start
+
+
+def update(discriminator, readout, n):
+    discriminator.qmm = SyntheticQuantumMachinesManager([training_job(readout, n)])
+    start = time.perf_counter()
+    pushed = discriminator.update(None, alpha, threshold)
+    return time.perf_counter() - start, pushed
+
+
+#############
+# Benchmark #
+#############
+readout = SyntheticReadout([rr_freq], readout_len, snr, seed=seed)
+folder = tempfile.mkdtemp()
+stale = new_discriminator(readout, os.path.join(folder, "stale.npz"))
+train(stale, readout, n_train)
+incremental = new_discriminator(readout, os.path.join(folder, "incremental.npz"))
+train(incremental, readout, n_train)
+
+full_time, update_time, pushes = 0.0, 0.0, 0
+print("step: fidelity of the stale / incrementally updated / fully retrained weights")
+for step in range(1, n_steps + 1):
+    readout.chis += resonator_drift
+    duration, pushed = update(incremental, readout, n_batch)
+    update_time += duration + 3 * n_batch * repetition_time * 1e-9
+    pushes += pushed
+    full = new_discriminator(readout, os.path.join(folder, f"full_{step}.npz"))
+    full_time += train(full, readout, n_train) + 3 * n_train * repetition_time * 1e-9
+
+    prepared = np.repeat(np.arange(3), n_test)
+    adc1, adc2, ts = readout.generate(prepared)
+    fidelities = [discriminator_fidelity(d, adc1, adc2, ts, prepared) for d in [stale, incremental, full]]
+    print(
+        f"{step} ({step * resonator_drift / 1e3:.0f} kHz): {' / '.join(f'{f:.3f}' for f in fidelities)}"
+        + (", configuration updated" if pushed else "")
+    )
+print(
+    f"recalibration time: full training {full_time / n_steps:.2f} s, incremental update {update_time / n_steps:.2f} s "
+    f"({full_time / update_time:.1f}x faster), {pushes} of {n_steps} updates pushed to the configuration"
+)
@@ -6,6 +6,7 @@ import matplotlib.pyplot as plt
 from scipy import signal
 
 from TimeDiffCalibrator import TimeDiffCalibrator
+from PhasorCache import phasor_cache
 
 
 class StateDiscriminator:
@@ -61,7 +62,10 @@ class StateDiscriminator:
             """
             self.time_diff = TimeDiffCalibrator.calibrate(self.qmm, list(self.config["controllers"].keys())[0])
         rr_freq = self._get_qe_freq(qe)
-        sig = x * np.exp(-1j * 2 * np.pi * rr_freq * 1e-9 * (ts - self.time_diff))
+        # The demodulation phasors are taken from the cache shared by all the discriminators
+        sig = phasor_cache.phasors(rr_freq, self.time_diff, ts)
+        np.conjugate(sig, out=sig)
+        sig *= x
         return sig
 
     def _get_traces(self, qe, seq0, sig, use_hann_filter):
@@ -0,0 +1,154 @@
+import numpy as np
+from scipy.optimize import minimize
+
+
+class LinearDiscriminantTrainer:
+    """
+    Trains the same linear structure as the neural network of the NNStateDiscriminator without TensorFlow: a demodulation
+    weight vector per input (out1 and out2) followed by a final layer mapping the two demodulation results to the
+    scores of the states.
+    With method='lda', the demodulation weights are the Fisher discriminant directions of each input and the final layer
+    is the linear discriminant analysis of the two demodulation results, all in closed form. With method='logistic', this
+    solution is refined with L-BFGS on the cross-entropy loss minimized by the neural network, with an L2 penalty.
+    """
+
+    @staticmethod
+    def fit(raw1cos, raw1sin, raw2cos, raw2sin, states, num_of_states, method="lda", shrinkage=0.5, max_iter=200):
+        """
+        Trains the demodulation weights and the final layer of one resonator.
+        :param raw1cos: the quantized out1 traces multiplied by the cosine, as an array of shape (n_traces, n_weights).
+        :param raw1sin: the quantized out1 traces multiplied by the sine.
+        :param raw2cos: the quantized out2 traces multiplied by the cosine.
+        :param raw2sin: the quantized out2 traces multiplied by the sine.
+        :param states: the prepared state of each trace as an array of shape (n_traces,).
+        :param num_of_states: the number of states.
+        :param method: 'lda' or 'logistic'.
+        :param shrinkage: the shrinkage of the within-state covariance towards a scaled identity (between 0 and 1), which
+        regularizes the Fisher directions when there are fewer traces than weights. It is also the strength of the L2
+        penalty of the 'logistic' method.
+        :param max_iter: the maximum number of L-BFGS iterations of the 'logistic' method.
+        :return: the cos1, sin1, cos2 and sin2 weights as arrays of shape (n_weights, 1) and the final layer [W, b] with W
+        of shape (2, num_of_states) and b of shape (num_of_states,), as the weights of the Keras layers.
+        """
+        n_weights = raw1cos.shape[1]
+        states = np.asarray(states, dtype=int)
+        x1 = np.hstack([raw1cos, raw1sin])
+        x2 = np.hstack([raw2cos, raw2sin])
+        w1 = LinearDiscriminantTrainer.fisher_direction(x1, states, num_of_states, shrinkage)
+        # The out2 direction separates the states along the discriminant axis complementary to the one of out1
+        w2 = LinearDiscriminantTrainer.fisher_direction(x2, states, num_of_states, shrinkage, deflate=x1 @ w1)
+        features = np.stack([x1 @ w1, x2 @ w2], axis=1)
+        W, b = LinearDiscriminantTrainer.lda_layer(features, states, num_of_states)
+        if method == "logistic":
+            w1, w2, W, b = LinearDiscriminantTrainer._refine(
+                x1, x2, states, num_of_states, w1, w2, W, b, shrinkage, max_iter
+            )
+        elif method != "lda":
+            raise Exception("unknown training method")
+        return w1[:n_weights, None], w1[n_weights:, None], w2[:n_weights, None], w2[n_weights:, None], [W, b]
+
+    @staticmethod
+    def fisher_direction(x, states, num_of_states, shrinkage=0.5, deflate=None):
+        """
+        Returns the direction maximizing the ratio of the between-state to the within-state variance of the projection
+        of x, normalized to a unit within-state standard deviation.
+        :param x: the features as an array of shape (n_traces, n_features).
+        :param states: the prepared state of each trace as an array of shape (n_traces,).
+        :param num_of_states: the number of states.
+        :param shrinkage: the shrinkage of the within-state covariance towards a scaled identity.
+        :param deflate: (optional) an already found projection of shape (n_traces,), whose separation of the state means
+        is removed from the between-state covariance when there are more than 2 states.
+        """
+        priors = np.bincount(states, minlength=num_of_states) / len(states)
+        means = LinearDiscriminantTrainer.state_means(x, states, num_of_states)
+        centered_means = means - priors @ means
+        within = x - means[states]
+        s_w = within.T @ within / len(states)
+        s_w = (1 - shrinkage) * s_w + shrinkage * np.trace(s_w) / s_w.shape[0] * np.eye(s_w.shape[0])
+        if deflate is not None and num_of_states > 2:
+            # Remove the state pattern already separated by the other projection, in the prior-weighted state space
+            deflate_means = LinearDiscriminantTrainer.state_means(deflate[:, None], states, num_of_states)[:, 0]
+            pattern = np.sqrt(priors) * (deflate_means - priors @ deflate_means)
+            pattern /= np.linalg.norm(pattern)
+            weighted_means = (np.eye(num_of_states) - np.outer(pattern, pattern)) @ (
+                np.sqrt(priors)[:, None] * centered_means
+            )
+        else:
+            weighted_means = np.sqrt(priors)[:, None] * centered_means
+        # Generalized eigenvalue problem s_b w = lambda s_w w, solved in the whitened space of s_w
+        cholesky = np.linalg.cholesky(s_w)
+        whitened_means = np.linalg.solve(cholesky, weighted_means.T)
+        u = np.linalg.svd(whitened_means, full_matrices=False)[0][:, 0]
+        return np.linalg.solve(cholesky.T, u)
+
+    @staticmethod
+    def state_means(x, states, num_of_states):
+        """
+        Returns the mean of the features of each state, for all the states at once by the product with the one-hot
+        states instead of a mask per state.
+        :param x: the features as an array of shape (n_traces, n_features).
+        :param states: the prepared state of each trace as an array of shape (n_traces,).
+        :param num_of_states: the number of states.
+        :return: the means as an array of shape (num_of_states, n_features).
+        """
+        one_hot = np.zeros((num_of_states, len(states)))
+        one_hot[states, np.arange(len(states))] = 1
+        return (one_hot @ x) / np.maximum(one_hot.sum(axis=1), 1)[:, None]
+
+    @staticmethod
+    def lda_layer(features, states, num_of_states):
+        """
+        Returns the linear discriminant analysis of the features with a covariance shared by all the states.
+        :param features: the features as an array of shape (n_traces, n_features).
+        :param states: the prepared state of each trace as an array of shape (n_traces,).
+        :param num_of_states: the number of states.
+        :return: W of shape (n_features, num_of_states) and b of shape (num_of_states,) such that the score of each
+        state is features @ W + b.
+        """
+        priors = np.bincount(states, minlength=num_of_states) / len(states)
+        means = LinearDiscriminantTrainer.state_means(features, states, num_of_states)
+        within = features - means[states]
+        covariance = within.T @ within / len(states)
+        W = np.linalg.solve(covariance, means.T)
+        b = -0.5 * np.sum(means.T * W, axis=0) + np.log(priors)
+        return W, b
+
+    @staticmethod
+    def _refine(x1, x2, states, num_of_states, w1, w2, W, b, l2, max_iter):
+        # L-BFGS on the softmax cross-entropy of the scores [x1 @ w1, x2 @ w2] @ W + b, as the neural network. The
+        # averaged training traces are usually separable, and the unpenalized loss then vanishes by scaling up the
+        # weights, or fits the noise of the traces when they are not. The L2 penalty of the demodulation weights is
+        # scaled by the mean within-state variance of their input, so that it does not depend on the scale of the
+        # traces.
+        one_hot = np.eye(num_of_states)[states]
+        sizes = np.cumsum([len(w1), len(w2), W.size])
+        scales = [
+            l2 * np.mean((x - LinearDiscriminantTrainer.state_means(x, states, num_of_states)[states]) ** 2)
+            for x in [x1, x2]
+        ]
+
+        def loss_and_gradient(params):
+            v1, v2, V, c = np.split(params, sizes)
+            V = V.reshape(W.shape)
+            out = np.stack([x1 @ v1, x2 @ v2], axis=1)
+            scores = out @ V + c
+            scores -= np.max(scores, axis=1, keepdims=True)
+            log_p = scores - np.log(np.sum(np.exp(scores), axis=1, keepdims=True))
+            loss = -np.sum(one_hot * log_p) / len(states)
+            loss += (scales[0] * v1 @ v1 + scales[1] * v2 @ v2 + l2 * np.sum(V**2)) / 2
+            g_scores = (np.exp(log_p) - one_hot) / len(states)
+            g_out = g_scores @ V.T
+            gradient = np.concatenate(
+                [
+                    x1.T @ g_out[:, 0] + scales[0] * v1,
+                    x2.T @ g_out[:, 1] + scales[1] * v2,
+                    (out.T @ g_scores + l2 * V).ravel(),
+                    g_scores.sum(0),
+                ]
+            )
+            return loss, gradient
+
+        params = np.concatenate([w1, w2, W.ravel(), b])
+        result = minimize(loss_and_gradient, params, jac=True, method="L-BFGS-B", options={"maxiter": max_iter})
+        w1, w2, W, b = np.split(result.x, sizes)
+        return w1, w2, W.reshape(2, num_of_states), b
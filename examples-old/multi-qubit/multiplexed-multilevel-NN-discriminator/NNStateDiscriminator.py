@@ -1,5 +1,8 @@
 from DCoffsetCalibrator import DCoffsetCalibrator
 from TimeDiffCalibrator import TimeDiffCalibrator
+from PhasorCache import phasor_cache
+from LinearDiscriminantTrainer import LinearDiscriminantTrainer
+from ParameterStore import ParameterStore
 
 from qm.qua import *
 
@@ -7,8 +10,8 @@ import h5py
 import pickle
 import numpy as np
 import os
-import tensorflow as tf
-from tensorflow.keras.constraints import max_norm
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 
 class NNStateDiscriminator:
@@ -16,11 +19,10 @@ class NNStateDiscriminator:
     The state discriminator is a class that generates optimized measure procedure for state discrimination
     of a multiplexed multi-level qubit system.
     .. note:
-        Currently only 3-states discrimination is supported. The setup assumed here includes IQ mixer both in the up-
-        and down-conversion of the readout pulse.
+        The setup assumed here includes IQ mixer both in the up- and down-conversion of the readout pulse.
     """
 
-    def __init__(self, qmm, config: dict, resonators, qubits, calibrate_with, path):
+    def __init__(self, qmm, config: dict, resonators, qubits, calibrate_with, path, num_of_states=3):
         """
         Constructor for the state discriminator class.
         :param qmm: A QuantumMachineManager object
@@ -30,12 +32,13 @@ class NNStateDiscriminator:
         :param calibrate_with: list of Quantum elements to use for the calibration of the time delay and the DC offset.
                                 It's recommended to use a group of readout resonators which cover all used controllers.
         :param path: A folder to save the raw data, training parameters, optimized weights
+        :param num_of_states: The number of states of each qubit, 3 ('g','e','f') by default
         """
 
         self.qmm = qmm
         self.config = config
         self.rr_num = len(resonators)
-        self.num_of_states = 3  # for 'g','e','f'
+        self.num_of_states = num_of_states
         self.path = path
         self.resonators = resonators
         self.qubits = qubits
@@ -44,10 +47,14 @@ class NNStateDiscriminator:
         self._create_dir()
         self.time_diff = 0
         self.MAX_STATES = 200  # Max number of states for the training program - due to memory limitation
-        self.number_of_raw_data_files = None
+        self.raw_data_file = self.path + "\\" + "raw_data.hdf5"
+        self.chunk_size = 2**20  # Size in bytes of the compressed chunks of the raw data traces
+        self.average_buffer_size = 2**25  # Size in bytes of the traces read at once when averaging the raw data
         self.final_weights = None  # Contains the final layer for the classification of demodulation results
         self.qua_vars = None
         self.load_config_from_file = True
+        # Versions of the trained parameters, read lazily with the large weight arrays memory-mapped
+        self.store = ParameterStore(self.path + "\\" + "optimal_params")
         self._load_file()
 
     def _create_dir(self):
@@ -59,22 +66,33 @@ class NNStateDiscriminator:
             print("Successfully created the directory %s " % self.path)
 
     def _load_file(self):
-        if os.path.isdir(self.path):
-            try:
-                file = open(self.path + "\\" + "optimal_params.pkl", "rb")
-                data = pickle.load(file)
-                file.close()
-                if self.load_config_from_file:
-                    self.config = data["config"]
-                    print(f"ATTENTION: The configuration was loaded from the file {self.path}\\optimal_params.pkl")
-                    print(
-                        "To use a new imported configuration set: self.load_config_from_file=False\n"
-                        "or use a new directory path or delete the optimal_params.pkl file"
-                    )
-                self.final_weights = data["final_weights"]
-
-            except FileNotFoundError:
-                pass
+        params = self.store.load()
+        if params is not None:
+            final_weights = [[W, b] for W, b in zip(params["final_W"], params["final_b"])]
+            source = f"version {params.version} of {self.store.path}"
+        elif os.path.isfile(self.path + "\\" + "optimal_params.pkl"):
+            # Parameters saved before the parameter store
+            with open(self.path + "\\" + "optimal_params.pkl", "rb") as file:
+                params = pickle.load(file)
+            final_weights = params["final_weights"]
+            source = f"the file {self.path}\\optimal_params.pkl"
+        else:
+            return
+        assert all(
+            len(b) == self.num_of_states for _, b in final_weights
+        ), "The number of states of the saved weights differs from num_of_states"
+        self.final_weights = final_weights
+        if self.load_config_from_file:
+            self.config = params["config"]
+            print(f"ATTENTION: The configuration was loaded from {source}")
+            print(
+                "To use a new imported configuration set: self.load_config_from_file=False\n"
+                "or use a new directory path or delete the optimal_params store"
+            )
+        if "demod_weights" in params:
+            # The configuration of the store, or the imported one, gets the demodulation weights of the store
+            for j, weights in enumerate(params["demod_weights"]):
+                self._export_weights(j, *weights[:, :, None], self.final_weights[j])
 
     def _training_program(self, prepare_qubits, readout_op, avg_n, states, wait_time, with_timestamps):
         with program() as train:
@@ -118,6 +136,7 @@ class NNStateDiscriminator:
         wait_time: int,
         calibrate_dc_offset=True,
         with_timestamps=False,
+        append=False,
         **execute_args,
     ):
         """
@@ -133,7 +152,7 @@ class NNStateDiscriminator:
 
                                 where 'qubits' is a list of quantum elements corresponding to the qubits, and
                                 "prepare0","prepare1","prepare2" are calibrated pulses corresponding to the preparation
-                                of states 0,1,2 (g,e,f) for the different qubits.
+                                of states 0,1,2 (g,e,f) for the different qubits, up to "prepare{num_of_states - 1}".
         :param readout_op: A string with the name of the readout operation used for reading out the state of the readout
                             resonator. Th operation should have the same name for all resonators.
         :param avg_n: Number of measurement to average, for a larger noise a large averaging number is required
@@ -153,6 +172,8 @@ class NNStateDiscriminator:
         :param calibrate_dc_offset: whether to calibrate the DC offset on analog inputs
         :param with_timestamps: whether to save timestamps with the raw ADC data. Saving timestamps increases the
                                 memory used and the processing time.
+        :param append: whether to append the data to the existing raw data file instead of overwriting it. The
+                       readout pulses and number of qubits must be the same as for the existing data.
         :param execute_args: optional QuantumMachine additional execution arguments
         :return:
         """
@@ -161,36 +182,42 @@ class NNStateDiscriminator:
             self._calibrate_dc_offset(**execute_args)
 
         QM = self.qmm.open_qm(self.config)
-        self.number_of_raw_data_files = len(states) // self.MAX_STATES + 1 - (len(states) % self.MAX_STATES == 0)
+        number_of_jobs = len(states) // self.MAX_STATES + 1 - (len(states) % self.MAX_STATES == 0)
         if len(states) > self.MAX_STATES:
             # divide the data and states into chunks of size at most MAX_STATES
             print(
                 f"ATTENTION: Due to a larger number of states than MAX_STATES ({self.MAX_STATES}) the data will be "
-                f"divided into multiple files"
+                f"generated in multiple blocks"
             )
 
-        for i in range(self.number_of_raw_data_files):
-            if i == self.number_of_raw_data_files - 1:
-                idx = [i * self.MAX_STATES, len(states)]
-            else:
-                idx = [i * self.MAX_STATES, (i + 1) * self.MAX_STATES]
-
-            print(f"Generating data file {i}...")
-            job = QM.execute(
-                self._training_program(
-                    prepare_qubits,
-                    readout_op,
-                    avg_n,
-                    states[idx[0] : idx[1]],
-                    wait_time,
-                    with_timestamps,
-                ),
-                **execute_args,
-            )
-            job.result_handles.wait_for_all_values()
+        # The data of each job is appended as a block to a single chunked and compressed file, which the training
+        # averages chunk by chunk without loading it in memory
+        raw_data = h5py.File(self.raw_data_file, "a" if append else "w")
+        try:
+            for i in range(number_of_jobs):
+                if i == number_of_jobs - 1:
+                    idx = [i * self.MAX_STATES, len(states)]
+                else:
+                    idx = [i * self.MAX_STATES, (i + 1) * self.MAX_STATES]
+
+                print(f"Generating data block {i}...")
+                job = QM.execute(
+                    self._training_program(
+                        prepare_qubits,
+                        readout_op,
+                        avg_n,
+                        states[idx[0] : idx[1]],
+                        wait_time,
+                        with_timestamps,
+                    ),
+                    **execute_args,
+                )
+                job.result_handles.wait_for_all_values()
 
-            print("Writing raw data to file...")
-            self._save_data(i, job, states[idx[0] : idx[1]], avg_n, with_timestamps)
+                print("Writing raw data to file...")
+                self._save_data(raw_data, job, states[idx[0] : idx[1]], avg_n)
+        finally:
+            raw_data.close()
 
     def _calibrate_dc_offset(self, **execute_args):
         already_calibrated = set()
@@ -209,25 +236,48 @@ class NNStateDiscriminator:
                     f"but no outputs were defined on that element."
                 )
 
-    def _save_data(self, idx, job, states, avg_n, with_timestamps):
-        raw_data = h5py.File(self.path + "\\" + f"raw_data_{idx}.hdf5", "w")
-        if with_timestamps:
-            raw_data.create_dataset("with_timestamps", data=np.array([1]))
-        else:
-            raw_data.create_dataset("with_timestamps", data=np.array([0]))
+    def _save_data(self, raw_data, job, states, avg_n):
         for j in range(self.rr_num):
+            for name in ["raw1_" + str(j), "raw2_" + str(j)]:
+                data = job.result_handles.get(name).fetch_all()["value"]
+                if data.dtype.names:
+                    # saved with timestamps
+                    self._append_dataset(raw_data, name, data["value"])
+                    self._append_dataset(raw_data, name + "_timestamps", data["timestamp"])
+                else:
+                    self._append_dataset(raw_data, name, data)
+        self._append_block(raw_data, states, avg_n)
+
+    def _append_dataset(self, raw_data, name, data):
+        data = np.asarray(data)
+        if name not in raw_data:
+            # extendable along the measurements, in compressed chunks of whole traces
+            rows = max(1, self.chunk_size // (data.itemsize * int(np.prod(data.shape[1:]))))
             raw_data.create_dataset(
-                "raw1_" + str(j),
-                data=job.result_handles.get("raw1_" + str(j)).fetch_all()["value"],
-            )
-            raw_data.create_dataset(
-                "raw2_" + str(j),
-                data=job.result_handles.get("raw2_" + str(j)).fetch_all()["value"],
+                name,
+                shape=(0,) + data.shape[1:],
+                maxshape=(None,) + data.shape[1:],
+                dtype=data.dtype,
+                chunks=(rows,) + data.shape[1:],
+                compression="gzip",
+                compression_opts=4,
+                shuffle=True,
             )
-
-        raw_data.create_dataset("states", data=np.array(states))
-        raw_data.create_dataset("N", data=np.array([avg_n]))
-        raw_data.close()
+        dataset = raw_data[name]
+        dataset.resize(dataset.shape[0] + data.shape[0], axis=0)
+        dataset[-data.shape[0] :] = data
+
+    def _append_block(self, raw_data, states, avg_n):
+        # A block is the data of one training job: its first measurement, first state, number of states and number
+        # of averages. Its measurements are ordered as for n in range(avg_n): for state in states.
+        states = np.array(states)
+        if "blocks" in raw_data:
+            first_row, first_state, n_states, N = raw_data["blocks"][-1]
+            block = [first_row + n_states * N, first_state + n_states, len(states), avg_n]
+        else:
+            block = [0, 0, len(states), avg_n]
+        self._append_dataset(raw_data, "blocks", np.array([block], dtype=np.int64))
+        self._append_dataset(raw_data, "states", states)
 
     def _calibrate_time_diff(self, calibrate_dc_offset, **execute_args):
         if calibrate_dc_offset:
@@ -256,31 +306,47 @@ class NNStateDiscriminator:
 
     @staticmethod
     def _down_cos(freq, time_diff, readout_len):
-        return np.cos(2 * np.pi * freq * 1e-9 * np.linspace(0 - time_diff, readout_len - 1 - time_diff, readout_len))
+        return phasor_cache.get(freq, time_diff, readout_len).real
 
     @staticmethod
     def _down_sin(freq, time_diff, readout_len):
-        return np.sin(2 * np.pi * freq * 1e-9 * np.linspace(0 - time_diff, readout_len - 1 - time_diff, readout_len))
+        return phasor_cache.get(freq, time_diff, readout_len).imag
 
-    @staticmethod
-    def _reshape_and_average_raw_data(raw, N, with_timestamps):
-        if with_timestamps:
-            return np.mean(np.reshape(raw["value"], (N, -1, raw["value"].shape[1])), axis=0)
-        else:
-            return np.mean(np.reshape(raw, (N, -1, raw.shape[1])), axis=0)
+    def _reshape_and_average_raw_data(self, raw, block):
+        """
+        Averages the raw traces of a data block over its avg_n repetitions without loading the whole block, by
+        accumulating the traces of a few states at a time.
+        :param raw: the HDF5 dataset of the traces, of shape (n_measurements, readout_len).
+        :param block: the first measurement, first state, number of states and number of averages of the block.
+        :return: the averaged traces of the states of the block, of shape (n_states, readout_len).
+        """
+        first_row, _, n_states, N = (int(x) for x in block)
+        states_per_read = max(1, self.average_buffer_size // (8 * raw.shape[1]))
+        average = np.empty((n_states, raw.shape[1]))
+        for start in range(0, n_states, states_per_read):
+            stop = min(start + states_per_read, n_states)
+            accumulator = np.zeros((stop - start, raw.shape[1]))
+            for n in range(N):
+                accumulator += raw[first_row + n * n_states + start : first_row + n * n_states + stop]
+            average[start:stop] = accumulator / N
+        return average
 
     def train(
         self,
-        data_files_idx=None,
+        data_blocks_idx=None,
         epochs=1000,
         kernel_initializer="glorot_uniform",
         calibrate_time_diff=True,
         calibrate_dc_offset=True,
+        method="keras",
+        shrinkage=0.5,
+        n_workers=1,
         **execute_args,
     ):
         """
 
-        :param data_files_idx: Indexes of the data files to train with, i.e [0,1,22,51]
+        :param data_blocks_idx: Indexes of the data blocks to train with, i.e [0,1,22,51]. By default, all the blocks
+                                of the raw data file are used
 
         :param epochs:              Number of training epochs. Increase for a better classification
 
@@ -290,168 +356,231 @@ class NNStateDiscriminator:
 
         :param calibrate_time_diff: Whether to calibrate the time difference before the training
         :param calibrate_dc_offset: Whether to calibrate the DC offset when calibrating the time difference
+        :param method:              'keras' to train the neural network with TensorFlow, or 'lda' (closed form) and
+                                    'logistic' (L-BFGS) to train the same weights with NumPy in a fraction of the time,
+                                    see LinearDiscriminantTrainer
+        :param shrinkage:           Regularization of the 'lda' and 'logistic' methods, between 0 and 1
+        :param n_workers:           Number of processes training the resonators in parallel, one resonator per
+                                    process. The calling script must be protected by if __name__ == "__main__": when
+                                    n_workers > 1 on Windows and macOS
         :return:
         """
-        if not data_files_idx:
-            if not self.number_of_raw_data_files:
-                self.number_of_raw_data_files = 1
-            data_files_idx = np.arange(self.number_of_raw_data_files)
         if calibrate_time_diff:
             self._calibrate_time_diff(calibrate_dc_offset, **execute_args)
-        raw_data_files = [h5py.File(self.path + "\\" + f"raw_data_{i}.hdf5", "r") for i in data_files_idx]
+        train_resonator = partial(
+            self._train_resonator,
+            data_blocks_idx=data_blocks_idx,
+            method=method,
+            epochs=epochs,
+            kernel_initializer=kernel_initializer,
+            shrinkage=shrinkage,
+        )
 
-        final_weights = []
-        models = []
+        if n_workers > 1:
+            # Each worker opens the raw data file read-only and trains one resonator at a time
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                results = list(executor.map(train_resonator, range(self.rr_num)))
+        else:
+            results = [train_resonator(j) for j in range(self.rr_num)]
 
-        for j in range(self.rr_num):
-            ###################################################
-            #                  prepare data                   #
-            # - take the average over samples to reduce noise #
-            # - combine the data from all the generated files #
-            ###################################################
-            readout_len = self.config["pulses"]["readout_pulse_" + str(j)]["length"]
-
-            raw1 = np.vstack(
-                [
-                    self._reshape_and_average_raw_data(raw["raw1_" + str(j)], raw["N"][0], raw["with_timestamps"][0])
-                    for raw in raw_data_files
-                ]
-            )
-            raw2 = np.vstack(
-                [
-                    self._reshape_and_average_raw_data(raw["raw2_" + str(j)], raw["N"][0], raw["with_timestamps"][0])
-                    for raw in raw_data_files
-                ]
-            )
+        # The configuration is updated in the order of the resonators, whatever the order in which the workers finish
+        self._save_params(results)
 
-            labels = np.vstack(
-                [[tf.one_hot(s[j], self.num_of_states) for s in raw["states"]] for raw in raw_data_files]
-            )
-            labels = labels[: raw1.shape[0], :]
-            freq = self.config["elements"][self.resonators[j]]["intermediate_frequency"]
-
-            # multiply raw input signals by cos/sin with the appropriate frequency
-            raw1cos = self._quantize_traces(raw1 * (2**-12) * self._down_cos(freq, self.time_diff, readout_len))
-            raw1sin = self._quantize_traces(raw1 * (2**-12) * self._down_sin(freq, self.time_diff, readout_len))
-            raw2cos = self._quantize_traces(raw2 * (2**-12) * self._down_cos(freq, self.time_diff, readout_len))
-            raw2sin = self._quantize_traces(raw2 * (2**-12) * self._down_sin(freq, self.time_diff, readout_len))
-
-            ########################
-            # build neural network #
-            ########################
-            in1sin = tf.keras.Input(shape=(int(readout_len / 4),), name="in1sin")
-            in1sin_dense = tf.keras.layers.Dense(
-                1,
-                name="in1sindense",
-                bias_constraint=max_norm(0),
-                kernel_initializer=kernel_initializer,
-            )(in1sin)
-            in1cos = tf.keras.Input(shape=(int(readout_len / 4),), name="in1cos")
-            in1cos_dense = tf.keras.layers.Dense(
-                1,
-                name="in1cosdense",
-                bias_constraint=max_norm(0),
-                kernel_initializer=kernel_initializer,
-            )(in1cos)
-            in1add = in1cos_dense + in1sin_dense
-
-            in2sin = tf.keras.Input(shape=(int(readout_len / 4),), name="in2sin")
-            in2sin_dense = tf.keras.layers.Dense(
-                1,
-                name="in2sindense",
-                bias_constraint=max_norm(0),
-                kernel_initializer=kernel_initializer,
-            )(in2sin)
-            in2cos = tf.keras.Input(shape=(int(readout_len / 4),), name="in2cos")
-            in2cos_dense = tf.keras.layers.Dense(
-                1,
-                name="in2cosdense",
-                bias_constraint=max_norm(0),
-                kernel_initializer=kernel_initializer,
-            )(in2cos)
-            in2add = in2cos_dense + in2sin_dense
-
-            inputs = tf.keras.layers.concatenate([in1add, in2add])
-
-            final = tf.keras.layers.Dense(self.num_of_states, name="final", activation="softmax")(inputs)
-            model = tf.keras.models.Model(inputs=[in1cos, in1sin, in2cos, in2sin], outputs=final)
-            loss_fn = tf.keras.losses.categorical_crossentropy
-            model.compile(optimizer="adam", loss=loss_fn, metrics=["accuracy"])
-
-            # optional plotting of the model
-            # tf.keras.utils.plot_model(model, to_file="model.png", show_shapes=True)
-
-            model.fit(
-                {
-                    "in1sin": raw1sin,
-                    "in1cos": raw1cos,
-                    "in2sin": raw2sin,
-                    "in2cos": raw2cos,
-                },
-                {"final": labels},
-                epochs=epochs,
-            )
+    def _save_params(self, results):
+        """
+        Exports the trained weights of each resonator to the configuration, and saves them as a new version of the
+        parameter store. The demodulation weights are saved once as an array, and are exported again to the
+        configuration when loaded, so that the saved configuration is shared by the versions of the store.
+        :param results: the cos1, sin1, cos2 and sin2 demodulation weights of shape (n, 1) and the final layer [W, b]
+        of each resonator.
+        """
+        self.final_weights = [self._export_weights(j, *weights) for j, weights in enumerate(results)]
+        config = dict(self.config)
+        config["integration_weights"] = {
+            name: iw for name, iw in self.config["integration_weights"].items() if not name.startswith("optimal_w")
+        }
+        self.store.save(
+            {
+                "config": config,
+                "final_W": np.array([W for W, _ in self.final_weights]),
+                "final_b": np.array([b for _, b in self.final_weights]),
+                # rounded as in the configuration
+                "demod_weights": np.array([np.around(np.hstack(weights[:4]).T, 4) for weights in results]),
+            }
+        )
 
-            model.save(self.path + "\\" + "resonator_model_" + str(j))
-            models.append(model)
-
-            ###################
-            # extract weights #
-            ###################
-            cos1_weights = model.get_layer("in1cosdense").get_weights()[0]
-            sin1_weights = model.get_layer("in1sindense").get_weights()[0]
-            cos2_weights = model.get_layer("in2cosdense").get_weights()[0]
-            sin2_weights = model.get_layer("in2sindense").get_weights()[0]
-            current_final_weights = model.get_layer("final").get_weights()
-
-            # scale weights to make sure the weights within fixed point 2.19 limits
-            scale = np.max(
-                np.abs(
-                    [
-                        cos1_weights.T * raw1cos + sin1_weights.T * raw1sin,
-                        cos1_weights.T * raw1cos + sin1_weights.T * raw1sin,
-                        cos2_weights.T * raw2cos + sin2_weights.T * raw2sin,
-                        cos2_weights.T * raw2cos + sin2_weights.T * raw2sin,
-                    ]
-                )
+    def __getstate__(self):
+        # The QuantumMachinesManager and the QUA variables are not sent to the training workers
+        state = self.__dict__.copy()
+        state["qmm"] = None
+        state["qua_vars"] = None
+        return state
+
+    def _train_resonator(self, j, data_blocks_idx, method, epochs, kernel_initializer, shrinkage):
+        with h5py.File(self.raw_data_file, "r") as raw_data:
+            raw1cos, raw1sin, raw2cos, raw2sin, states = self._prepare_training_data(raw_data, j, data_blocks_idx)
+        if method == "keras":
+            weights = self._fit_keras(j, raw1cos, raw1sin, raw2cos, raw2sin, states, epochs, kernel_initializer)
+        else:
+            weights = LinearDiscriminantTrainer.fit(
+                raw1cos, raw1sin, raw2cos, raw2sin, states, self.num_of_states, method, shrinkage
             )
-            cos1_weights = cos1_weights / scale
-            sin1_weights = sin1_weights / scale
-            cos2_weights = cos2_weights / scale
-            sin2_weights = sin2_weights / scale
-            current_final_weights = np.array(current_final_weights) / scale
-
-            ######################################
-            # update config with optimal weights #
-            ######################################
-            # out1
-            self.config["integration_weights"]["optimal_w1_" + str(j)] = {
-                # rounding weights to be in the range of precision of the fixed point
-                "cosine": list(np.around(cos1_weights.T[0], 4)),
-                "sine": list(np.around(sin1_weights.T[0], 4)),
-            }
-            # out2
-            self.config["integration_weights"]["optimal_w2_" + str(j)] = {
-                "cosine": list(np.around(cos2_weights.T[0], 4)),
-                "sine": list(np.around(sin2_weights.T[0], 4)),
-            }
+        return self._scale_weights(*weights, raw1cos, raw1sin, raw2cos, raw2sin)
+
+    def _prepare_training_data(self, raw_data, j, data_blocks_idx=None):
+        ###################################################
+        #                  prepare data                   #
+        # - take the average over samples to reduce noise #
+        # - combine the data from the selected blocks     #
+        ###################################################
+        readout_len = self.config["pulses"]["readout_pulse_" + str(j)]["length"]
+        blocks = raw_data["blocks"][:]
+        if data_blocks_idx is not None and len(data_blocks_idx):
+            blocks = blocks[np.asarray(data_blocks_idx)]
+
+        raw1 = np.vstack([self._reshape_and_average_raw_data(raw_data["raw1_" + str(j)], block) for block in blocks])
+        raw2 = np.vstack([self._reshape_and_average_raw_data(raw_data["raw2_" + str(j)], block) for block in blocks])
+
+        states = np.concatenate([raw_data["states"][block[1] : block[1] + block[2], j] for block in blocks])
+        freq = self.config["elements"][self.resonators[j]]["intermediate_frequency"]
+
+        # multiply raw input signals by cos/sin with the appropriate frequency
+        raw1cos = self._quantize_traces(raw1 * (2**-12) * self._down_cos(freq, self.time_diff, readout_len))
+        raw1sin = self._quantize_traces(raw1 * (2**-12) * self._down_sin(freq, self.time_diff, readout_len))
+        raw2cos = self._quantize_traces(raw2 * (2**-12) * self._down_cos(freq, self.time_diff, readout_len))
+        raw2sin = self._quantize_traces(raw2 * (2**-12) * self._down_sin(freq, self.time_diff, readout_len))
+        return raw1cos, raw1sin, raw2cos, raw2sin, states
+
+    def _fit_keras(self, j, raw1cos, raw1sin, raw2cos, raw2sin, states, epochs, kernel_initializer):
+        # TensorFlow is only required by this training method
+        import tensorflow as tf
+        from tensorflow.keras.constraints import max_norm
+
+        readout_len = self.config["pulses"]["readout_pulse_" + str(j)]["length"]
+        labels = np.eye(self.num_of_states)[states]
+
+        ########################
+        # build neural network #
+        ########################
+        in1sin = tf.keras.Input(shape=(int(readout_len / 4),), name="in1sin")
+        in1sin_dense = tf.keras.layers.Dense(
+            1,
+            name="in1sindense",
+            bias_constraint=max_norm(0),
+            kernel_initializer=kernel_initializer,
+        )(in1sin)
+        in1cos = tf.keras.Input(shape=(int(readout_len / 4),), name="in1cos")
+        in1cos_dense = tf.keras.layers.Dense(
+            1,
+            name="in1cosdense",
+            bias_constraint=max_norm(0),
+            kernel_initializer=kernel_initializer,
+        )(in1cos)
+        in1add = in1cos_dense + in1sin_dense
+
+        in2sin = tf.keras.Input(shape=(int(readout_len / 4),), name="in2sin")
+        in2sin_dense = tf.keras.layers.Dense(
+            1,
+            name="in2sindense",
+            bias_constraint=max_norm(0),
+            kernel_initializer=kernel_initializer,
+        )(in2sin)
+        in2cos = tf.keras.Input(shape=(int(readout_len / 4),), name="in2cos")
+        in2cos_dense = tf.keras.layers.Dense(
+            1,
+            name="in2cosdense",
+            bias_constraint=max_norm(0),
+            kernel_initializer=kernel_initializer,
+        )(in2cos)
+        in2add = in2cos_dense + in2sin_dense
+
+        inputs = tf.keras.layers.concatenate([in1add, in2add])
+
+        final = tf.keras.layers.Dense(self.num_of_states, name="final", activation="softmax")(inputs)
+        model = tf.keras.models.Model(inputs=[in1cos, in1sin, in2cos, in2sin], outputs=final)
+        loss_fn = tf.keras.losses.categorical_crossentropy
+        model.compile(optimizer="adam", loss=loss_fn, metrics=["accuracy"])
+
+        # optional plotting of the model
+        # tf.keras.utils.plot_model(model, to_file="model.png", show_shapes=True)
+
+        model.fit(
+            {
+                "in1sin": raw1sin,
+                "in1cos": raw1cos,
+                "in2sin": raw2sin,
+                "in2cos": raw2cos,
+            },
+            {"final": labels},
+            epochs=epochs,
+        )
 
-            self.config["pulses"]["readout_pulse_" + str(j)]["integration_weights"][
-                "optimal_w1_" + str(j)
-            ] = "optimal_w1_" + str(j)
-            self.config["pulses"]["readout_pulse_" + str(j)]["integration_weights"][
-                "optimal_w2_" + str(j)
-            ] = "optimal_w2_" + str(j)
+        model.save(self.path + "\\" + "resonator_model_" + str(j))
 
-            final_weights.append(current_final_weights)
+        ###################
+        # extract weights #
+        ###################
+        cos1_weights = model.get_layer("in1cosdense").get_weights()[0]
+        sin1_weights = model.get_layer("in1sindense").get_weights()[0]
+        cos2_weights = model.get_layer("in2cosdense").get_weights()[0]
+        sin2_weights = model.get_layer("in2sindense").get_weights()[0]
+        current_final_weights = model.get_layer("final").get_weights()
+        return cos1_weights, sin1_weights, cos2_weights, sin2_weights, current_final_weights
 
-        for f in raw_data_files:
-            f.close()
-        self.final_weights = final_weights
-        data = {"config": self.config, "final_weights": final_weights}
-        file = open(self.path + "\\" + f"optimal_params.pkl", "wb")
-        pickle.dump(data, file)
-        file.close()
+    @staticmethod
+    def _scale_weights(
+        cos1_weights,
+        sin1_weights,
+        cos2_weights,
+        sin2_weights,
+        current_final_weights,
+        raw1cos,
+        raw1sin,
+        raw2cos,
+        raw2sin,
+    ):
+        # scale weights to make sure the weights within fixed point 2.19 limits
+        scale = np.max(
+            np.abs(
+                [
+                    cos1_weights.T * raw1cos + sin1_weights.T * raw1sin,
+                    cos1_weights.T * raw1cos + sin1_weights.T * raw1sin,
+                    cos2_weights.T * raw2cos + sin2_weights.T * raw2sin,
+                    cos2_weights.T * raw2cos + sin2_weights.T * raw2sin,
+                ]
+            )
+        )
+        cos1_weights = cos1_weights / scale
+        sin1_weights = sin1_weights / scale
+        cos2_weights = cos2_weights / scale
+        sin2_weights = sin2_weights / scale
+        current_final_weights = [weights / scale for weights in current_final_weights]
+        return cos1_weights, sin1_weights, cos2_weights, sin2_weights, current_final_weights
+
+    def _export_weights(self, j, cos1_weights, sin1_weights, cos2_weights, sin2_weights, current_final_weights):
+        ######################################
+        # update config with optimal weights #
+        ######################################
+        # out1
+        self.config["integration_weights"]["optimal_w1_" + str(j)] = {
+            # rounding weights to be in the range of precision of the fixed point
+            "cosine": list(np.around(cos1_weights.T[0], 4)),
+            "sine": list(np.around(sin1_weights.T[0], 4)),
+        }
+        # out2
+        self.config["integration_weights"]["optimal_w2_" + str(j)] = {
+            "cosine": list(np.around(cos2_weights.T[0], 4)),
+            "sine": list(np.around(sin2_weights.T[0], 4)),
+        }
+
+        self.config["pulses"]["readout_pulse_" + str(j)]["integration_weights"][
+            "optimal_w1_" + str(j)
+        ] = "optimal_w1_" + str(j)
+        self.config["pulses"]["readout_pulse_" + str(j)]["integration_weights"][
+            "optimal_w2_" + str(j)
+        ] = "optimal_w2_" + str(j)
+
+        return current_final_weights
 
     def initialize(self):
         """
@@ -473,14 +602,18 @@ class NNStateDiscriminator:
             value=np.hstack([self.final_weights[i][1] * (2**-12) for i in range(self.rr_num)]).tolist(),
         )
 
-    def measure_state(self, readout_op, result, adc=None):
+    def measure_state(self, readout_op, result, adc=None, unrolled=False):
         """
         This procedure generates a macro of QUA commands for measuring the readout resonator and discriminating between
         the states of the qubit.
         :param readout_op: A string with the readout operation name for all resonators.
-        :param result: stream or Qua variable that will receive the discrimination result (0,1 or 2)
+        :param result: stream or Qua variable that will receive the discrimination result (0, 1, ..., num_of_states - 1)
         :param adc: (optional) the stream variable which the raw ADC data will be saved and will appear in result
         analysis scope.
+        :param unrolled: (optional) whether to unroll the state assignment at compile time, with the final layer
+        weights as constants and constant indices, instead of QUA loops indexing the weight arrays. It removes the loop
+        and index arithmetic between the end of the demodulation and the result, at the cost of a program growing with
+        the number of resonators. False by default.
         """
         # readout measurement
         align(*self.resonators)
@@ -494,6 +627,23 @@ class NNStateDiscriminator:
                 demod.full("optimal_w2_" + str(k), self.qua_vars["out2"][k], "out2"),
             )
         # state assignment
+        if unrolled:
+            self._unrolled_state_assignment(result)
+        else:
+            self._looped_state_assignment(result)
+        align(*self.resonators)
+
+    def _unrolled_state_assignment(self, result):
+        out1, out2, res = self.qua_vars["out1"], self.qua_vars["out2"], self.qua_vars["res"]
+        for i in range(self.rr_num):
+            W, b = self.final_weights[i]
+            for j in range(self.num_of_states):
+                # same values as the w and b arrays declared by initialize()
+                assign(res[j], float(W[0][j]) * out1[i] + float(W[1][j]) * out2[i] + float(b[j] * 2**-12))
+            assign(self.qua_vars["temp"], Math.argmax(res))
+            save(self.qua_vars["temp"], result)
+
+    def _looped_state_assignment(self, result):
         with for_(
             self.qua_vars["i"],
             0,
@@ -516,4 +666,3 @@ class NNStateDiscriminator:
                 )
             assign(self.qua_vars["temp"], Math.argmax(self.qua_vars["res"]))
             save(self.qua_vars["temp"], result)
-        align(*self.resonators)
@@ -0,0 +1,74 @@
+from collections import OrderedDict
+import numpy as np
+
+
+class PhasorCache:
+    """
+    Least recently used cache of the demodulation phasors exp(1j * 2 * pi * freq * (t - time_diff)) used to digitally
+    down-convert the raw ADC traces. The tables are keyed by (intermediate frequency, time difference, readout length,
+    timestamp offset), so that repeated trainings and the trainings of several resonators sharing the same parameters
+    reuse them instead of recomputing them.
+    """
+
+    def __init__(self, maxsize=32):
+        """
+        Constructor for the phasor cache class.
+        :param maxsize: the maximum number of tables kept in the cache, the least recently used one being evicted first.
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._tables = OrderedDict()
+
+    def get(self, freq, time_diff, readout_len, offset=0):
+        """
+        Returns the phasor exp(1j * 2 * pi * freq * (offset + t - time_diff)) for t = 0, ..., readout_len - 1 ns.
+        :param freq: the intermediate frequency in Hz.
+        :param time_diff: the time difference in ns between the reception of the signal and its timestamp.
+        :param readout_len: the number of samples of the readout window.
+        :param offset: the timestamp in ns of the first sample of the window.
+        :return: a read-only complex array of length readout_len, the real and imaginary parts being the cosine and
+        sine demodulation vectors.
+        """
+        key = (float(freq), float(time_diff), int(readout_len), int(offset))
+        table = self._tables.get(key)
+        if table is None:
+            self.misses += 1
+            table = np.exp(1j * 2 * np.pi * freq * 1e-9 * (np.arange(readout_len) + (offset - time_diff)))
+            table.flags.writeable = False
+            self._tables[key] = table
+            if len(self._tables) > self.maxsize:
+                self._tables.popitem(last=False)
+        else:
+            self.hits += 1
+            self._tables.move_to_end(key)
+        return table
+
+    def phasors(self, freq, time_diff, ts):
+        """
+        Returns the phasor exp(1j * 2 * pi * freq * (ts - time_diff)) for the timestamps of a set of raw ADC traces.
+        The timestamps of each trace being consecutive, the phasor of each trace is the cached table rotated by the phase
+        of its first timestamp, which replaces the n_shots * readout_len complex exponentials by n_shots of them.
+        :param freq: the intermediate frequency in Hz.
+        :param time_diff: the time difference in ns between the reception of the signal and its timestamp.
+        :param ts: the timestamps in ns of the samples as an array of shape (..., readout_len).
+        :return: a new complex array with the same shape as ts.
+        """
+        ts = np.asarray(ts)
+        readout_len = ts.shape[-1]
+        starts = ts[..., :1]
+        if np.all(ts[..., -1:] - starts == readout_len - 1):
+            return self.get(freq, time_diff, readout_len) * np.exp(1j * 2 * np.pi * freq * 1e-9 * starts)
+        return np.exp(1j * 2 * np.pi * freq * 1e-9 * (ts - time_diff))
+
+    def clear(self):
+        """
+        Removes all the tables from the cache.
+        """
+        self._tables.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# Shared by all the discriminators of the process
+phasor_cache = PhasorCache()
@@ -0,0 +1,98 @@
+"""
+Latency of the real-time state assignment of NNStateDiscriminator.measure_state for 2, 5 and 10 multiplexed readout
+resonators, with the assignment in QUA loops indexing the weight arrays and unrolled at compile time with constant
+weights and indices.
+The latency is measured with the simulator as the time between the end of the last ADC acquisition, i.e. the end of
+the demodulation, and the start of a short pulse played by the first resonator right after measure_state, which waits
+for the assignment of the states of all the qubits. The size of the generated QUA program is reported as well, and
+only the size when qop_ip is None.
+The demodulation and final layer weights are random, since only the timing is of interest here.
+"""
+from example_configuration import config, lo_freq
+from NNStateDiscriminator import NNStateDiscriminator
+from qm import QuantumMachinesManager, SimulationConfig, generate_qua_script
+from qm.qua import *
+import numpy as np
+import tempfile
+import copy
+import os
+
+##############
+# Parameters #
+##############
+rr_nums = [2, 5, 10]  # Numbers of multiplexed readout resonators
+qop_ip = None  # IP address of the QOP or simulator, None to only report the size of the programs
+simulation_duration = 3000  # Duration of the simulation in clock cycles
+rng = np.random.default_rng(0)
+
+
+def multiplexed_config(rr_num):
+    """
+    Returns a copy of the example configuration with rr_num readout resonators, all based on the first one of
+    example_configuration.py, and a short 'marker' operation on the first resonator.
+
+    :param rr_num: The number of readout resonators.
+    :return: The configuration dictionary.
+    """
+    multiplexed = copy.deepcopy(config)
+    template = multiplexed["elements"]["rr0"]
+    for i in range(rr_num):
+        freq = 50e6 + 5e6 * i
+        multiplexed["elements"]["rr" + str(i)] = copy.deepcopy(template)
+        multiplexed["elements"]["rr" + str(i)]["intermediate_frequency"] = freq
+        multiplexed["elements"]["rr" + str(i)]["mixInputs"]["mixer"] = "mixer_rr" + str(i)
+        multiplexed["elements"]["rr" + str(i)]["operations"] = {"readout": "readout_pulse_" + str(i)}
+        multiplexed["pulses"]["readout_pulse_" + str(i)] = copy.deepcopy(config["pulses"]["readout_pulse_0"])
+        multiplexed["mixers"]["mixer_rr" + str(i)] = [
+            {"intermediate_frequency": freq, "lo_frequency": lo_freq, "correction": [1, 0, 0, 1]}
+        ]
+    multiplexed["elements"]["rr0"]["operations"]["marker"] = "marker_pulse"
+    multiplexed["pulses"]["marker_pulse"] = {
+        "operation": "control",
+        "length": 16,
+        "waveforms": {"I": "const_wf", "Q": "zero_wf"},
+    }
+    return multiplexed
+
+
+def latency_program(discriminator, unrolled):
+    with program() as prog:
+        discriminator.initialize()
+        discriminator.measure_state("readout", "result", unrolled=unrolled)
+        play("marker", discriminator.resonators[0])
+    return prog
+
+
+#############
+# Benchmark #
+#############
+qmm = QuantumMachinesManager(host=qop_ip) if qop_ip is not None else None
+for rr_num in rr_nums:
+    resonators = ["rr" + str(i) for i in range(rr_num)]
+    qubits = ["qb" + str(i) for i in range(rr_num)]
+    path = os.path.join(tempfile.mkdtemp(), "latency")
+    discriminator = NNStateDiscriminator(qmm, multiplexed_config(rr_num), resonators, qubits, ["rr0"], path)
+    readout_len = discriminator.config["pulses"]["readout_pulse_0"]["length"]
+    discriminator.final_weights = [
+        discriminator._export_weights(
+            j,
+            *[0.1 * rng.uniform(-1, 1, (readout_len // 4, 1)) for _ in range(4)],
+            [rng.uniform(-1, 1, (2, discriminator.num_of_states)), rng.uniform(-1, 1, discriminator.num_of_states)],
+        )
+        for j in range(rr_num)
+    ]
+    for unrolled in [False, True]:
+        prog = latency_program(discriminator, unrolled)
+        program_lines = len(generate_qua_script(prog).splitlines())
+        mode = "unrolled" if unrolled else "loops"
+        if qmm is None:
+            print(f"{rr_num} resonators, {mode}: QUA program of {program_lines} lines")
+            continue
+        job = qmm.simulate(discriminator.config, prog, SimulationConfig(simulation_duration))
+        report = job.get_simulated_waveform_report()
+        demod_end = max(adc.end_time for adc in report.adc_acquisitions)
+        marker_start = min(wf.timestamp for wf in report.analog_waveforms if wf.pulse_name == "marker_pulse")
+        print(
+            f"{rr_num} resonators, {mode}: {marker_start - demod_end} ns from the end "
+            f"of the demodulation to the result, QUA program of {program_lines} lines"
+        )
@@ -0,0 +1,148 @@
+"""
+Benchmark of the ParameterStore against the single files in which the discriminators saved their parameters before:
+the optimal_params.pkl of the NNStateDiscriminator (the pickled configuration and final layer) and the .npz file of the
+StateDiscriminator of the Use Case 2 of the single fixed transmon.
+The trained parameters are synthesized with the shapes of the real ones, for each number of resonators and readout
+length. The load time of the NNStateDiscriminator is reported for the pickle file and for the store, both when only the
+final layer used by measure_state is read (the other parameters being read lazily) and when all the parameters are
+loaded into the configuration by NNStateDiscriminator._load_file. The load time of the StateDiscriminator is the time
+to read its weights. The disk size is reported for one calibration, and for a history of n_versions calibrations kept
+as one file per calibration or as the versions of one store.
+The files are read from the page cache, so that the load times of a cold disk are larger for all the formats.
+"""
+from NNStateDiscriminator import NNStateDiscriminator
+from ParameterStore import ParameterStore
+import numpy as np
+import contextlib
+import tempfile
+import pickle
+import time
+import io
+import os
+
+##############
+# Parameters #
+##############
+rr_nums = [2, 5, 10]  # Numbers of multiplexed resonators of the NNStateDiscriminator
+readout_lens = [1000, 4000, 16000]  # Readout lengths in ns
+n_versions = 10  # Number of calibrations in the history
+num_of_states = 3  # Number of states of each qubit
+n_repeats = 5  # The load times are the best of n_repeats
+rng = np.random.default_rng(0)
+
+
+def readout_config(rr_num, readout_len):
+    config = {"controllers": {"con1": {}}, "elements": {}, "pulses": {}, "integration_weights": {}}
+    for j in range(rr_num):
+        config["elements"]["rr" + str(j)] = {"intermediate_frequency": 50e6 + 10e6 * j, "time_of_flight": 24}
+        config["pulses"]["readout_pulse_" + str(j)] = {"length": readout_len, "integration_weights": {}}
+    return config
+
+
+def nn_results(rr_num, readout_len):
+    # The cos1, sin1, cos2 and sin2 demodulation weights and the final layer [W, b] of each resonator
+    n = readout_len // 4
+    return [
+        [
+            *(rng.uniform(-1, 1, (n, 1)) for _ in range(4)),
+            [rng.standard_normal((2, num_of_states)), rng.standard_normal(num_of_states)],
+        ]
+        for _ in range(rr_num)
+    ]
+
+
+def uc2_data(readout_len):
+    # The parameters saved by StateDiscriminator.update, the largest file of the Use Case 2
+    n = readout_len // 4
+    weights = rng.standard_normal((num_of_states, n)) + 1j * rng.standard_normal((num_of_states, n))
+    return {
+        "weights": weights,
+        "bias": rng.standard_normal(num_of_states),
+        "smearing": 0,
+        "meas_len": readout_len,
+        "average_traces": weights * 1e3,
+    }
+
+
+def best_time(load):
+    duration = np.inf
+    for _ in range(n_repeats):
+        start = time.perf_counter()
+        load()
+        duration = min(duration, time.perf_counter() - start)
+    return duration
+
+
+def new_nn_discriminator(rr_num, readout_len, folder):
+    resonators = ["rr" + str(j) for j in range(rr_num)]
+    qubits = ["qb" + str(j) for j in range(rr_num)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        return NNStateDiscriminator(
+            None, readout_config(rr_num, readout_len), resonators, qubits, ["rr0"], folder, num_of_states
+        )
+
+
+def load_nn(discriminator):
+    with contextlib.redirect_stdout(io.StringIO()):
+        discriminator._load_file()
+
+
+def load_final_layer(store):
+    params = store.load()
+    return params["final_W"], params["final_b"]
+
+
+def kB(size):
+    return f"{size / 1e3:.0f} kB"
+
+
+#############
+# Benchmark #
+#############
+print("NNStateDiscriminator, optimal_params.pkl vs ParameterStore:")
+for rr_num in rr_nums:
+    for readout_len in readout_lens:
+        folder = tempfile.mkdtemp()
+        discriminator = new_nn_discriminator(rr_num, readout_len, os.path.join(folder, "nn"))
+        pkl_sizes = []
+        for version in range(n_versions):
+            discriminator._save_params(nn_results(rr_num, readout_len))
+            # The file written by the train procedure before the parameter store
+            pkl = os.path.join(folder, f"optimal_params_{version}.pkl")
+            with open(pkl, "wb") as file:
+                pickle.dump({"config": discriminator.config, "final_weights": discriminator.final_weights}, file)
+            pkl_sizes.append(os.path.getsize(pkl))
+            if version == 0:
+                store_size = discriminator.store.disk_size()
+
+        def load_pkl():
+            with open(pkl, "rb") as file:
+                return pickle.load(file)
+
+        print(
+            f"    {rr_num} resonators, {readout_len} ns: load {1e3 * best_time(load_pkl):.2f} ms (pkl) / "
+            f"{1e3 * best_time(lambda: load_final_layer(discriminator.store)):.2f} ms (store, final layer) / "
+            f"{1e3 * best_time(lambda: load_nn(discriminator)):.2f} ms (store, into the configuration), "
+            f"disk {kB(pkl_sizes[0])} (pkl) / {kB(store_size)} (store), "
+            f"{n_versions} calibrations {kB(sum(pkl_sizes))} (pkl) / {kB(discriminator.store.disk_size())} (store)"
+        )
+
+print("Use Case 2 StateDiscriminator, .npz vs ParameterStore:")
+for readout_len in readout_lens:
+    folder = tempfile.mkdtemp()
+    store = ParameterStore(os.path.join(folder, "params"))
+    npz_sizes = []
+    for version in range(n_versions):
+        data = uc2_data(readout_len)
+        store.save(data)
+        npz = os.path.join(folder, f"params_{version}.npz")
+        np.savez(npz, **data)
+        npz_sizes.append(os.path.getsize(npz))
+        if version == 0:
+            store_size = store.disk_size()
+    print(
+        f"    {readout_len} ns: load {1e3 * best_time(lambda: np.load(npz)['weights']):.2f} ms (npz) / "
+        f"{1e3 * best_time(lambda: store.load()['weights']):.2f} ms (store), "
+        f"disk {kB(npz_sizes[0])} (npz) / {kB(store_size)} (store), "
+        f"{n_versions} calibrations {kB(sum(npz_sizes))} (npz) / {kB(store.disk_size())} (store)"
+    )
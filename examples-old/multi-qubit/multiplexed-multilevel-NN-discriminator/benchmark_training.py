@@ -0,0 +1,124 @@
+"""
+Benchmark of the training methods of the NNStateDiscriminator: the Keras neural network and the NumPy linear
+discriminants ('lda' in closed form and 'logistic' with L-BFGS) of LinearDiscriminantTrainer.
+Multiplexed raw ADC traces are synthesized from the resonator responses of example_configuration.py with Gaussian
+noise, and saved as the raw training data file, either averaged as in the training program or as single shots, which
+are not linearly separable. For each method, the training time of all the resonators and the single shot assignment
+fidelity on newly synthesized traces are reported. The Keras method is skipped when TensorFlow is not installed.
+"""
+from example_configuration import config, rr_num, freqs, readout_len, simulate_pulse, chi, k, Ts, Td, power
+from NNStateDiscriminator import NNStateDiscriminator
+from LinearDiscriminantTrainer import LinearDiscriminantTrainer
+import numpy as np
+import importlib.util
+import tempfile
+import h5py
+import time
+import os
+
+##############
+# Parameters #
+##############
+methods = ["lda", "logistic", "keras"]
+num_of_combinations = 243  # Number of prepared states of the qubits
+n_avgs = [15, 1]  # Numbers of measurements averaged in the training data, 1 for single shots
+n_test = 3000  # Number of single shot measurements used to derive the fidelity
+signal_amplitude = 40  # Amplitude of the resonator responses in ADC units
+noise_amplitude = 300  # Standard deviation of the noise in ADC units
+epochs = 1000  # Number of training epochs of the Keras method
+rng = np.random.default_rng(0)
+
+# Response of each resonator to each state of its qubit
+t = np.arange(readout_len)
+responses = np.zeros((rr_num, 3, readout_len), dtype=complex)
+for j in range(rr_num):
+    for s in range(3):
+        _, I, Q, _ = simulate_pulse(freqs[j], chi[s], k, Ts, Td, power)
+        responses[j, s] = (I + 1j * Q)[:readout_len] * np.exp(1j * 2 * np.pi * freqs[j] * 1e-9 * t)
+
+
+def synthesize(states):
+    """
+    Synthesizes the raw ADC traces of the multiplexed readout of the qubits prepared in the given states.
+
+    :param states: The state of each qubit in each measurement as an array of shape (n_measurements, rr_num).
+    :return: The out1 and out2 traces as arrays of shape (n_measurements, readout_len).
+    """
+    signal = signal_amplitude * np.sum(responses[np.arange(rr_num), states], axis=1)
+    return (
+        signal.real + noise_amplitude * rng.standard_normal(signal.shape),
+        signal.imag + noise_amplitude * rng.standard_normal(signal.shape),
+    )
+
+
+def training_data(n_avg):
+    """
+    Synthesizes the raw training data file of the discriminator and prepares the training data of each resonator.
+
+    :param n_avg: The number of measurements of each prepared state averaged in the training data.
+    :return: The raw1cos, raw1sin, raw2cos, raw2sin and states of each resonator.
+    """
+    states = rng.integers(0, discriminator.num_of_states, (num_of_combinations, rr_num))
+    raw1, raw2 = synthesize(np.tile(states, (n_avg, 1)))
+    raw_data = h5py.File(discriminator.raw_data_file, "w")
+    for j in range(rr_num):
+        # All the resonators are read out by the same ADCs
+        discriminator._append_dataset(raw_data, "raw1_" + str(j), raw1)
+        discriminator._append_dataset(raw_data, "raw2_" + str(j), raw2)
+    discriminator._append_block(raw_data, states, n_avg)
+    raw_data.close()
+    with h5py.File(discriminator.raw_data_file, "r") as raw_data:
+        return [discriminator._prepare_training_data(raw_data, j) for j in range(rr_num)]
+
+
+#############
+# Test data #
+#############
+path = os.path.join(tempfile.mkdtemp(), "benchmark")
+resonators = ["rr" + str(i) for i in range(rr_num)]
+qubits = ["qb" + str(i) for i in range(rr_num)]
+discriminator = NNStateDiscriminator(None, config, resonators, qubits, ["rr0"], path)
+test_states = rng.integers(0, discriminator.num_of_states, (n_test, rr_num))
+test1, test2 = synthesize(test_states)
+
+#############
+# Benchmark #
+#############
+if importlib.util.find_spec("tensorflow") is None and "keras" in methods:
+    print("TensorFlow is not installed, the keras method is skipped")
+    methods.remove("keras")
+for n_avg in n_avgs:
+    print(f"training data averaged over {n_avg} measurements:" if n_avg > 1 else "single shot training data:")
+    data = training_data(n_avg)
+    for method in methods:
+        training_time = 0
+        fidelities = []
+        for j in range(rr_num):
+            raw1cos, raw1sin, raw2cos, raw2sin, train_states = data[j]
+            start = time.perf_counter()
+            if method == "keras":
+                weights = discriminator._fit_keras(
+                    j, raw1cos, raw1sin, raw2cos, raw2sin, train_states, epochs, "glorot_uniform"
+                )
+            else:
+                weights = LinearDiscriminantTrainer.fit(
+                    raw1cos, raw1sin, raw2cos, raw2sin, train_states, discriminator.num_of_states, method
+                )
+            training_time += time.perf_counter() - start
+            cos1, sin1, cos2, sin2, (W, b) = weights
+            # Demodulation of the test traces with the trained weights followed by the final layer
+            demod = [
+                discriminator._quantize_traces(test * 2**-12 * down(freqs[j], 0, readout_len)) @ w[:, 0]
+                for test, down, w in [
+                    (test1, discriminator._down_cos, cos1),
+                    (test1, discriminator._down_sin, sin1),
+                    (test2, discriminator._down_cos, cos2),
+                    (test2, discriminator._down_sin, sin2),
+                ]
+            ]
+            scores = np.stack([demod[0] + demod[1], demod[2] + demod[3]], axis=1) @ W + b
+            fidelities.append(np.mean(np.argmax(scores, axis=1) == test_states[:, j]))
+        print(
+            f"    {method}: {training_time:.2f} s for {rr_num} resonators, "
+            f"fidelity {np.mean(fidelities):.3f} ({', '.join(f'{f:.3f}' for f in fidelities)})"
+        )
@@ -32,7 +32,7 @@ n_avg = 15  # repeat the measurement n_avg times and average the result in the t
 
 discriminator.generate_training_data(prepare_qubits, "readout", n_avg, states, wait_time)
 
-discriminator.train()
+discriminator.train()  # or discriminator.train(method="lda") to train without TensorFlow
 
 
 # Testing program